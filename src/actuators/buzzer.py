@@ -1,23 +1,100 @@
-import machine
-import time
+from machine import PWM, Pin, Timer
+import micropython
+from micropython import const
+from time import ticks_ms, ticks_diff
+
+# Import diretti: ticks_ms()/ticks_diff() vengono risolti con una sola lookup
+# tra i globali del modulo, senza passare ogni volta dall'attributo del modulo.
+
+# Modalità del buzzer come interi const() (il compilatore inserisce il valore immediato):
+# - MODE_OFF: spento
+# - MODE_PARKING: assistenza parcheggio (tono continuo variabile)
+# - MODE_ALARM: allarme (lampeggio sonoro ON/OFF a intervalli)
+_MODE_OFF = const(0)
+_MODE_PARKING = const(1)
+_MODE_ALARM = const(2)
+
+# Duty u16 del tono acceso (50% di 65535).
+_DUTY_ON = const(32768)
 
 class Buzzer:
+    # API pubblica: costanti di modalità riesposte come attributi di classe.
+    MODE_OFF = _MODE_OFF
+    MODE_PARKING = _MODE_PARKING
+    MODE_ALARM = _MODE_ALARM
+
+    # Nomi leggibili delle modalità (indice = valore MODE_*), per debug/telemetria.
+    _MODE_NAMES = ("off", "parking", "alarm")
+
     def __init__(self, pin):
         # Inizializza un buzzer pilotato in PWM sul pin specificato.
-        # - Il duty cycle controlla l'energia inviata (qui si usa come ON/OFF: 0 = spento, 512 ≈ 50%).
-        self.pwm = machine.PWM(machine.Pin(pin))
+        # - Il duty cycle controlla l'energia inviata (qui si usa come ON/OFF: 0 = spento, 32768 = 50%).
+        # - Si usa sempre duty_u16 (API nativa a 16 bit), come per il servo.
+        self.pwm = PWM(Pin(pin))
         
         # Imposta subito duty = 0 per garantire che il buzzer parta spento.
-        self.pwm.duty(0)
+        self.pwm.duty_u16(0)
         
         # Flag logico che indica se il buzzer è considerato "attivo" (in uso) dal sistema.
         self.active = False
         
-        # Modalità corrente del buzzer:
-        # - "off": spento
-        # - "parking": assistenza parcheggio (tono continuo variabile)
-        # - "alarm": allarme (lampeggio sonoro ON/OFF a intervalli)
-        self.mode = "off"  # off, parking, alarm
+        # Modalità corrente del buzzer (una delle costanti MODE_*).
+        self.mode = _MODE_OFF
+
+        # update() è un attributo d'istanza che punta al metodo giusto per la modalità:
+        # - _update_noop quando l'allarme non è attivo (nessun controllo, nessun branch)
+        # - _update_alarm durante l'allarme (start_alarm)
+        # I metodi bound sono creati una sola volta qui, così lo scambio non alloca.
+        self._update_noop_ref = self._update_noop
+        self._update_alarm_ref = self._update_alarm
+        self.update = self._update_noop_ref
+
+        # Stato ON/OFF corrente del tono d'allarme, tenuto in RAM.
+        # Evita di rileggere il duty dal PWM (lettura hardware) ad ogni update().
+        self._alarm_on = False
+
+        # Timer hardware opzionale per il lampeggio dell'allarme (vedi use_timer()).
+        # None => lampeggio gestito da update() chiamato dal loop.
+        self._timer = None
+
+    def use_timer(self, timer_id):
+        """
+        Affida il lampeggio dell'allarme a un timer hardware invece che a update().
+
+        A cosa serve:
+        - Cadenza ON/OFF esatta anche quando il loop è occupato (MQTT, display) o
+          salta i giri durante il movimento della sbarra.
+
+        Parametri:
+        - timer_id: id del timer hardware (ESP32: 0-3), non usato da altri moduli.
+
+        Come funziona:
+        - Il timer viene armato solo durante l'allarme (start_alarm), con periodo pari
+          all'intervallo di commutazione, e fermato da stop_alarm()/stop(): a riposo
+          non genera interrupt.
+        - La callback rimanda la commutazione con micropython.schedule, usando un
+          riferimento bound pre-allocato (come ServoGate.start_fsm_timer).
+        - update() resta _update_noop: il loop può continuare a chiamarla senza effetti.
+        """
+        self._toggle_ref = self._toggle_scheduled
+        self._timer = Timer(timer_id)
+
+    def _on_alarm_timer(self, t):
+        """Callback del timer d'allarme: schedula la commutazione; se la coda è piena salta un giro."""
+        try:
+            micropython.schedule(self._toggle_ref, 0)
+        except RuntimeError:
+            pass
+
+    def _toggle_scheduled(self, _):
+        """Commutazione ON/OFF dal timer (ignorata se l'allarme è stato fermato nel frattempo)."""
+        if self.mode == _MODE_ALARM:
+            self._toggle_alarm()
+
+    def _stop_timer(self):
+        """Ferma il timer dell'allarme (se in uso)."""
+        if self._timer:
+            self._timer.deinit()
         
         
     def set_frequency(self, freq):
@@ -30,12 +107,15 @@ class Buzzer:
 
         Come funziona:
         - Imposta la frequenza PWM (freq) => determina il tono emesso.
-        - Imposta un duty cycle diverso da 0 (512) => attiva fisicamente il buzzer.
+        - Imposta un duty cycle diverso da 0 (32768 su 65535) => attiva fisicamente il buzzer.
         - Aggiorna gli stati interni (mode, active) per indicare che è in modalità parcheggio.
         """
+        if self.mode == _MODE_ALARM:
+            self._stop_timer()
         self.pwm.freq(freq)
-        self.pwm.duty(512)
-        self.mode = "parking"
+        self.pwm.duty_u16(_DUTY_ON)
+        self.mode = _MODE_PARKING
+        self.update = self._update_noop_ref
         self.active = True
         
         
@@ -51,7 +131,7 @@ class Buzzer:
         Come funziona:
         - Salva le impostazioni dell'allarme (frequenza e intervallo).
         - Salva un timestamp iniziale (alarm_timer) da usare come riferimento temporale.
-        - Imposta mode = "alarm" e active = True.
+        - Imposta mode = MODE_ALARM e active = True.
         
         Nota:
         - Il "lampeggio sonoro" non è gestito qui con sleep/blocchi: viene gestito in update()
@@ -59,9 +139,19 @@ class Buzzer:
         """
         self.alarm_freq = freq
         self.alarm_interval = interval
-        self.alarm_timer = time.ticks_ms()
-        self.mode = "alarm"
+        self.alarm_timer = ticks_ms()
+        self.mode = _MODE_ALARM
         self.active = True
+
+        # Il primo toggle (da update() o dal timer) accenderà il tono.
+        self._alarm_on = False
+
+        # Con il timer hardware (use_timer) il lampeggio avviene ogni 'interval' ms
+        # senza passare da update(); altrimenti update() controlla il tempo ad ogni giro.
+        if self._timer:
+            self._timer.init(period=interval, mode=Timer.PERIODIC, callback=self._on_alarm_timer)
+        else:
+            self.update = self._update_alarm_ref
         
     def stop_parking_assist(self):
         """
@@ -73,12 +163,12 @@ class Buzzer:
 
         Come funziona:
         - Controlla la modalità corrente.
-        - Se "parking": duty=0 (buzzer fisicamente spento), active=False e mode="off".
+        - Se "parking": duty=0 (buzzer fisicamente spento), active=False e mode=MODE_OFF.
         """
-        if self.mode == "parking":
-            self.pwm.duty(0)
+        if self.mode == _MODE_PARKING:
+            self.pwm.duty_u16(0)
             self.active = False
-            self.mode = "off"
+            self.mode = _MODE_OFF
             
             
     def stop_alarm(self):
@@ -90,12 +180,15 @@ class Buzzer:
 
         Come funziona:
         - Controlla la modalità corrente.
-        - Se "alarm": duty=0 (buzzer spento), active=False e mode="off".
+        - Se "alarm": duty=0 (buzzer spento), active=False e mode=MODE_OFF.
         """
-        if self.mode == "alarm":
-            self.pwm.duty(0)
+        if self.mode == _MODE_ALARM:
+            self._stop_timer()
+            self.pwm.duty_u16(0)
             self.active = False
-            self.mode = "off"
+            self.mode = _MODE_OFF
+            self._alarm_on = False
+            self.update = self._update_noop_ref
             
             
     def stop(self):
@@ -107,49 +200,69 @@ class Buzzer:
 
         Come funziona:
         - duty=0 spegne l'uscita PWM (nessun tono).
-        - active=False e mode="off" riportano lo stato interno a riposo.
+        - active=False e mode=MODE_OFF riportano lo stato interno a riposo.
         """
-        self.pwm.duty(0)
+        if self.mode == _MODE_ALARM:
+            self._stop_timer()
+        self.pwm.duty_u16(0)
         self.active = False
-        self.mode = "off"
+        self.mode = _MODE_OFF
+        self._alarm_on = False
+        self.update = self._update_noop_ref
         
         
-    def update(self):
+    def _update_noop(self):
+        """Versione di update() quando l'allarme non è attivo: non fa nulla."""
+        pass
+
+    def _update_alarm(self):
         """
-        Aggiorna lo stato del buzzer, usato per implementare l'allarme intermittente.
+        Versione di update() in modalità allarme: implementa l'allarme intermittente.
 
         A cosa serve:
-        - Deve essere chiamata periodicamente dal loop principale.
-        - In modalità "alarm" alterna ON/OFF senza bloccare l'esecuzione del programma.
+        - Installata come self.update da start_alarm(); il loop principale la chiama
+          periodicamente tramite buzzer.update().
+        - Alterna ON/OFF senza bloccare l'esecuzione del programma.
 
         Come funziona:
-        - Se siamo in modalità "alarm" e active=True:
+        - Non ricontrolla modalità e active: viene installata solo mentre l'allarme è attivo.
           1) legge il tempo corrente (ticks_ms)
           2) calcola da quanto tempo è passato dall'ultima commutazione (ticks_diff)
           3) se il tempo trascorso >= alarm_interval:
-             - se il buzzer è acceso (duty > 0) lo spegne (duty=0)
+             - se il buzzer è acceso (_alarm_on) lo spegne (duty=0)
              - altrimenti lo accende impostando freq e duty
              - aggiorna alarm_timer al tempo corrente (nuovo riferimento)
         
         Dettaglio tecnico:
-        - time.ticks_ms() restituisce un contatore millisecondi che può andare in overflow.
-        - time.ticks_diff(a, b) gestisce correttamente la differenza anche con overflow,
+        - ticks_ms() restituisce un contatore millisecondi che può andare in overflow.
+        - ticks_diff(a, b) gestisce correttamente la differenza anche con overflow,
           evitando bug temporali tipici se si facesse (a - b) direttamente.
         """
-        if self.mode == "alarm" and self.active:
-            current = time.ticks_ms()
-            if time.ticks_diff(current, self.alarm_timer) >= self.alarm_interval:
-                # Se il duty è > 0, significa che il PWM sta pilotando il buzzer (stato ON).
-                # In tal caso, lo spegniamo mettendo duty=0 (stato OFF).
-                if self.pwm.duty() > 0:
-                    self.pwm.duty(0)
-                else:
-                    # Se era OFF, lo riaccendiamo:
-                    # - impostiamo la frequenza del tono dell'allarme
-                    # - impostiamo duty=512 (circa 50%) per far emettere suono
-                    self.pwm.freq(self.alarm_freq)
-                    self.pwm.duty(512)
-                
-                # Aggiorna il riferimento temporale dell'ultima commutazione,
-                # così il prossimo toggle avverrà dopo 'alarm_interval' ms da qui.
-                self.alarm_timer = current
\ No newline at end of file
+        current = ticks_ms()
+        if ticks_diff(current, self.alarm_timer) >= self.alarm_interval:
+            self._toggle_alarm()
+
+            # Aggiorna il riferimento temporale dell'ultima commutazione,
+            # così il prossimo toggle avverrà dopo 'alarm_interval' ms da qui.
+            self.alarm_timer = current
+
+    def _toggle_alarm(self):
+        """Inverte il tono d'allarme (ON <-> OFF)."""
+        # Se _alarm_on è True il PWM sta pilotando il buzzer (stato ON).
+        # In tal caso, lo spegniamo mettendo duty=0 (stato OFF).
+        # Si usa il flag in RAM invece di rileggere pwm.duty() dall'hardware.
+        if self._alarm_on:
+            self.pwm.duty_u16(0)
+            self._alarm_on = False
+        else:
+            # Se era OFF, lo riaccendiamo:
+            # - impostiamo la frequenza del tono dell'allarme
+            # - impostiamo duty_u16=32768 (50%) per far emettere suono
+            self.pwm.freq(self.alarm_freq)
+            self.pwm.duty_u16(_DUTY_ON)
+            self._alarm_on = True
+
+    @property
+    def mode_name(self):
+        """Ritorna il nome leggibile della modalità corrente ("off", "parking", "alarm")."""
+        return self._MODE_NAMES[self.mode]
@@ -0,0 +1,87 @@
+# actuators/gpio.py
+
+import micropython
+from array import array
+from micropython import const
+
+# Registri GPIO dell'ESP32 per scritture atomiche "write 1 to set / write 1 to clear":
+# scrivendo una maschera si alzano (W1TS) o abbassano (W1TC) tutti i pin corrispondenti
+# in un solo accesso, senza toccare gli altri. OUT = GPIO 0-31, OUT1 = GPIO 32-39.
+_GPIO_OUT_W1TS = const(0x3FF44008)
+_GPIO_OUT_W1TC = const(0x3FF4400C)
+_GPIO_OUT1_W1TS = const(0x3FF44014)
+_GPIO_OUT1_W1TC = const(0x3FF44018)
+# Registri di uscita (latch dei livelli impostati), letti per il toggle.
+_GPIO_OUT = const(0x3FF44004)
+_GPIO_OUT1 = const(0x3FF44010)
+
+@micropython.viper
+def gpio_write(masks):
+    """
+    Applica al GPIO una quaterna di maschere [clr0, set0, clr1, set1] (array 'I').
+
+    Come funziona:
+    - Prima il clear (W1TC) e poi il set (W1TS), per ciascun banco con maschera non nulla.
+    - Le maschere sono lette direttamente dal buffer dell'array (ptr32): nessun oggetto allocato.
+    """
+    m = ptr32(masks)
+    if m[0]:
+        ptr32(_GPIO_OUT_W1TC)[0] = m[0]
+    if m[2]:
+        ptr32(_GPIO_OUT1_W1TC)[0] = m[2]
+    if m[1]:
+        ptr32(_GPIO_OUT_W1TS)[0] = m[1]
+    if m[3]:
+        ptr32(_GPIO_OUT1_W1TS)[0] = m[3]
+
+@micropython.viper
+def gpio_toggle(d):
+    """
+    Inverte un pin descritto da d = array 'I' [reg_out, reg_w1ts, reg_w1tc, maschera].
+
+    Come funziona:
+    - Legge il latch di uscita (registro OUT, non il pin fisico) e scrive la maschera
+      in W1TC se il pin è alto, altrimenti in W1TS: scrittura atomica, gli altri pin
+      del banco non vengono toccati.
+    """
+    m = ptr32(d)
+    mask = m[3]
+    if ptr32(m[0])[0] & mask:
+        ptr32(m[2])[0] = mask
+    else:
+        ptr32(m[1])[0] = mask
+
+def pin_masks(pin):
+    """Ritorna (maschera banco OUT, maschera banco OUT1) per un numero di GPIO."""
+    if pin < 32:
+        return (1 << pin, 0)
+    return (0, 1 << (pin - 32))
+
+def write_masks(on_pins, off_pins):
+    """
+    Costruisce le maschere per gpio_write() a partire da due elenchi di GPIO.
+
+    Parametri:
+    - on_pins: pin da portare a livello alto
+    - off_pins: pin da portare a livello basso
+
+    Ritorna:
+    - array 'I' [clr0, set0, clr1, set1], da calcolare una volta e riusare
+    """
+    clr0 = clr1 = set0 = set1 = 0
+    for pin in off_pins:
+        m0, m1 = pin_masks(pin)
+        clr0 |= m0
+        clr1 |= m1
+    for pin in on_pins:
+        m0, m1 = pin_masks(pin)
+        set0 |= m0
+        set1 |= m1
+    return array('I', (clr0, set0, clr1, set1))
+
+def toggle_descriptor(pin):
+    """Ritorna il descrittore per gpio_toggle(): registri del banco del pin + maschera."""
+    m0, m1 = pin_masks(pin)
+    if pin < 32:
+        return array('I', (_GPIO_OUT, _GPIO_OUT_W1TS, _GPIO_OUT_W1TC, m0))
+    return array('I', (_GPIO_OUT1, _GPIO_OUT1_W1TS, _GPIO_OUT1_W1TC, m1))
@@ -10,6 +10,18 @@ class ParkingLeds:
         self.red = machine.Pin(red_pin, machine.Pin.OUT)
         self.green = machine.Pin(green_pin, machine.Pin.OUT)
 
+        # Scrittura tramite Pin.value(x): una sola chiamata per LED con il livello esplicito.
+        # Nota: i due LED (GPIO16 e GPIO33 nella configurazione attuale) stanno su banchi
+        # GPIO diversi dell'ESP32 (0-31 e 32-39), quindi non è possibile una scrittura
+        # atomica unica via registro W1TS/W1TC: si mantiene l'API a due pin.
+        self._red_v = self.red.value
+        self._green_v = self.green.value
+
+        # Ultimo stato applicato ai LED (None = mai scritto, 1 = occupato, 0 = libero).
+        # Permette di saltare le scritture GPIO quando lo stato richiesto è già attivo,
+        # anche se il chiamante ripete set_occupied()/set_free() ad ogni ciclo.
+        self._state = None
+
         # Imposta lo stato iniziale del parcheggio come "libero":
         # LED verde acceso, LED rosso spento.
         self.set_free()
@@ -22,11 +34,14 @@ class ParkingLeds:
         - Segnalazione visiva locale della disponibilità (posto non disponibile).
 
         Come funziona:
-        - Accende il LED rosso.
-        - Spegne il LED verde.
+        - Se i LED mostrano già "occupato" non fa nulla (nessuna scrittura GPIO).
+        - Altrimenti accende il LED rosso e spegne il LED verde.
         """
-        self.red.on()
-        self.green.off()
+        if self._state == 1:
+            return
+        self._red_v(1)
+        self._green_v(0)
+        self._state = 1
         
     def set_free(self):
         """
@@ -36,8 +51,21 @@ class ParkingLeds:
         - Segnalazione visiva locale della disponibilità (posto disponibile).
 
         Come funziona:
-        - Spegne il LED rosso.
-        - Accende il LED verde.
+        - Se i LED mostrano già "libero" non fa nulla (nessuna scrittura GPIO).
+        - Altrimenti spegne il LED rosso e accende il LED verde.
+        """
+        if self._state == 0:
+            return
+        self._red_v(0)
+        self._green_v(1)
+        self._state = 0
+
+    def mark_free(self):
+        """
+        Registra lo stato "libero" senza scrivere i GPIO.
+
+        A cosa serve:
+        - Riallineare lo stato interno quando i due LED sono già stati impostati
+          da una scrittura a registro esterna (vedi SmartParking.set_initial_state()).
         """
-        self.red.off()
-        self.green.on()
\ No newline at end of file
+        self._state = 0
\ No newline at end of file
@@ -1,21 +1,150 @@
-import machine
-import time
+from collections import deque
+from machine import PWM, Pin, Timer
+import micropython
+from micropython import const
+from time import ticks_ms, ticks_diff, ticks_add
+
+# Import diretti dei nomi usati nel percorso caldo: "ticks_ms()" è una sola
+# lookup tra i globali del modulo, invece di "time.ticks_ms()" (modulo + attributo).
+
+# Costanti intere del modulo, dichiarate con const(): il compilatore MicroPython
+# le sostituisce con il valore immediato nel bytecode (nessuna lookup su self/classe).
+# Le versioni pubbliche senza "_" sono riesposte come attributi di classe più sotto.
+
+# Costanti di stato
+# Questi valori identificano gli stati della macchina a stati finiti (FSM) che governa la sbarra.
+# La logica di update() cambia comportamento in base allo stato corrente.
+_STATE_IDLE = const(0)
+_STATE_GREEN = const(1)
+_STATE_OPENING = const(2)
+_STATE_WAIT_CLEAR = const(3)
+_STATE_CLOSING = const(4)
+_STATE_MANUAL_OPEN = const(5)
+
+# Nomi leggibili degli stati (indice = valore STATE_*), usati da get_state().
+# Tupla di modulo: una sola lookup globale, nessuna lista allocata a ogni chiamata.
+_STATE_NAMES = ("CHIUSA", "PRONTA", "APERTURA", "APERTA (AUTO)", "CHIUSURA", "APERTA (MAN)")
+
+# --- DEFINIZIONE LOGICA (Il "cervello" pensa così) ---
+# Questi sono gli angoli LOGICI usati dall'algoritmo:
+# - SERVO_DOWN = 0  => sbarra chiusa
+# - SERVO_UP   = 90 => sbarra aperta
+_SERVO_DOWN = const(0)     # Logicamente Chiusa
+_SERVO_UP = const(90)      # Logicamente Aperta
+
+# PARAMETRI OTTIMIZZATI
+# SERVO_STEP: incremento/decremento dell'angolo ad ogni step di movimento.
+# SERVO_INTERVAL: tempo minimo (ms) tra uno step e il successivo.
+# Questi due parametri determinano la "velocità" e la fluidità di apertura/chiusura.
+_SERVO_STEP = const(2)
+_SERVO_INTERVAL = const(30)   # 30ms
+
+# BLINK_INTERVAL: periodo (ms) del lampeggio giallo durante il movimento.
+# Il lampeggio è agganciato allo stesso timer del servo: si commuta il giallo
+# ogni BLINK_TICKS step (150 / 30 = 5), così basta un solo timer hardware.
+_BLINK_INTERVAL = const(150)
+_BLINK_TICKS = const(_BLINK_INTERVAL // _SERVO_INTERVAL)
+
+# SAFE_DELAY: tempo (ms) in cui entrambi i sensori devono risultare "liberi"
+# prima di autorizzare la chiusura automatica (evita chiusure immediate per transitori).
+_SAFE_DELAY = const(1000)
+
+# Maschere di bit per i test di appartenenza a gruppi di stati.
+# Il bit (1 << STATE_*) è acceso se lo stato appartiene al gruppo: il controllo
+# diventa un solo AND, senza allocare una lista a ogni chiamata.
+_MOVING_MASK = const((1 << _STATE_OPENING) | (1 << _STATE_CLOSING))
+_OPEN_MASK = const((1 << _STATE_OPENING) | (1 << _STATE_WAIT_CLEAR) | (1 << _STATE_MANUAL_OPEN))
+# Stati in cui un'apertura remota viene ignorata (già in apertura o già aperta manuale).
+_REMOTE_OPEN_SKIP_MASK = const((1 << _STATE_OPENING) | (1 << _STATE_MANUAL_OPEN))
+# Stati in cui una chiusura remota è consentita (sbarra aperta, auto o manuale).
+_REMOTE_CLOSE_MASK = const((1 << _STATE_WAIT_CLEAR) | (1 << _STATE_MANUAL_OPEN))
+
+# Bit della parola di flag _flags (comandi remoti + modalità + movimento).
+# Un solo attributo intero invece di più booleani: ogni test è un AND.
+_FLAG_OPEN_REQ = const(1 << 0)    # richiesta di apertura remota in attesa
+_FLAG_CLOSE_REQ = const(1 << 1)   # richiesta di chiusura remota in attesa
+_FLAG_MANUAL = const(1 << 2)      # apertura manuale/remota: a fine corsa -> MANUAL_OPEN
+_FLAG_MOVING = const(1 << 3)      # FSM in OPENING/CLOSING (aggiornato in update())
+
+# Tabella precalcolata angolo LOGICO (0..180) -> duty_u16, come letterale bytes
+# (181 valori u16 little-endian, 2 byte ciascuno). Generata offline con:
+#   duty = 1700 + (max(0, 90 - a) * 6500) // 180
+# (angolo fisico invertito 90 - logico e clampato a 0; 1700 = offset minimo di impulso,
+# 6500 = escursione utile). Essendo un letterale non viene costruita a ogni boot e,
+# con il modulo congelato, resta in flash.
+_DUTY_LUT = (
+    b'\x56\x13\x31\x13\x0d\x13\xe9\x12\xc5\x12\xa1\x12\x7d\x12\x59\x12'
+    b'\x35\x12\x11\x12\xec\x11\xc8\x11\xa4\x11\x80\x11\x5c\x11\x38\x11'
+    b'\x14\x11\xf0\x10\xcc\x10\xa7\x10\x83\x10\x5f\x10\x3b\x10\x17\x10'
+    b'\xf3\x0f\xcf\x0f\xab\x0f\x87\x0f\x62\x0f\x3e\x0f\x1a\x0f\xf6\x0e'
+    b'\xd2\x0e\xae\x0e\x8a\x0e\x66\x0e\x42\x0e\x1d\x0e\xf9\x0d\xd5\x0d'
+    b'\xb1\x0d\x8d\x0d\x69\x0d\x45\x0d\x21\x0d\xfd\x0c\xd8\x0c\xb4\x0c'
+    b'\x90\x0c\x6c\x0c\x48\x0c\x24\x0c\x00\x0c\xdc\x0b\xb8\x0b\x93\x0b'
+    b'\x6f\x0b\x4b\x0b\x27\x0b\x03\x0b\xdf\x0a\xbb\x0a\x97\x0a\x73\x0a'
+    b'\x4e\x0a\x2a\x0a\x06\x0a\xe2\x09\xbe\x09\x9a\x09\x76\x09\x52\x09'
+    b'\x2e\x09\x09\x09\xe5\x08\xc1\x08\x9d\x08\x79\x08\x55\x08\x31\x08'
+    b'\x0d\x08\xe9\x07\xc4\x07\xa0\x07\x7c\x07\x58\x07\x34\x07\x10\x07'
+    b'\xec\x06\xc8\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06'
+    b'\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06'
+    b'\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06'
+    b'\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06'
+    b'\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06'
+    b'\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06'
+    b'\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06'
+    b'\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06'
+    b'\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06'
+    b'\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06'
+    b'\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06'
+    b'\xa4\x06\xa4\x06\xa4\x06\xa4\x06\xa4\x06'
+)
+
+@micropython.viper
+def _duty_at(a: int) -> int:
+    """Legge la voce a-esima (0..180) di _DUTY_LUT (due letture byte, nessun oggetto allocato)."""
+    p = ptr8(_DUTY_LUT)
+    i = a << 1
+    return p[i] | (p[i + 1] << 8)
+
+# Registro di ingresso GPIO dell'ESP32 (livelli dei pin 0-31, un bit per pin).
+_GPIO_IN = const(0x3FF4403C)
+
+@micropython.viper
+def _read_gpio_in() -> int:
+    """Legge in un solo accesso i livelli di tutti i GPIO 0-31 (registro GPIO_IN)."""
+    return int(ptr32(_GPIO_IN)[0])
+
+@micropython.viper
+def _clamp180(a: int) -> int:
+    """Limita un angolo logico intero a [0, 180] (due confronti interi nativi, nessun oggetto)."""
+    a = a if a > 0 else 0
+    return a if a < 180 else 180
 
 class ServoGate:
-    # Costanti di stato
-    # Questi valori identificano gli stati della macchina a stati finiti (FSM) che governa la sbarra.
-    # La logica di update() cambia comportamento in base allo stato corrente.
-    STATE_IDLE = 0
-    STATE_GREEN = 1
-    STATE_OPENING = 2
-    STATE_WAIT_CLEAR = 3
-    STATE_CLOSING = 4
-    STATE_MANUAL_OPEN = 5
-
-    def __init__(self, pin, ir_entrance, ir_exit, traffic_light, gate_button, is_parking_full_cb=None):
+    # API pubblica: stessi nomi e valori di prima, riferiti alle costanti del modulo.
+    STATE_IDLE = _STATE_IDLE
+    STATE_GREEN = _STATE_GREEN
+    STATE_OPENING = _STATE_OPENING
+    STATE_WAIT_CLEAR = _STATE_WAIT_CLEAR
+    STATE_CLOSING = _STATE_CLOSING
+    STATE_MANUAL_OPEN = _STATE_MANUAL_OPEN
+
+    SERVO_DOWN = _SERVO_DOWN
+    SERVO_UP = _SERVO_UP
+    SERVO_STEP = _SERVO_STEP
+    SERVO_INTERVAL = _SERVO_INTERVAL
+    BLINK_INTERVAL = _BLINK_INTERVAL
+    BLINK_TICKS = _BLINK_TICKS
+    SAFE_DELAY = _SAFE_DELAY
+
+    FLAG_OPEN_REQ = _FLAG_OPEN_REQ
+    FLAG_CLOSE_REQ = _FLAG_CLOSE_REQ
+    FLAG_MANUAL = _FLAG_MANUAL
+    FLAG_MOVING = _FLAG_MOVING
+
+    def __init__(self, pin, ir_entrance, ir_exit, traffic_light, gate_button, is_parking_full_cb=None, timer_id=0):
         # Inizializza il servo tramite PWM a 50 Hz.
         # freq=50 => periodo 20 ms, il duty (ampiezza impulso) determina l'angolo.
-        self.servo = machine.PWM(machine.Pin(pin), freq=50)
+        self.servo = PWM(Pin(pin), freq=50)
 
         # Sensori IR e dispositivi di contesto:
         # - ir_entrance: sensore presenza veicolo lato ingresso
@@ -31,59 +160,93 @@ class ServoGate:
         # Serve per bloccare gli ingressi automatici (ma NON le uscite).
         self.is_parking_full_cb = is_parking_full_cb
 
-        # --- DEFINIZIONE LOGICA (Il "cervello" pensa così) ---
-        # Questi sono gli angoli LOGICI usati dall'algoritmo:
-        # - SERVO_DOWN = 0  => sbarra chiusa
-        # - SERVO_UP   = 90 => sbarra aperta
-        self.SERVO_DOWN = 0   # Logicamente Chiusa
-        self.SERVO_UP = 90       # Logicamente Aperta
-
-        # PARAMETRI OTTIMIZZATI
-        # SERVO_STEP: incremento/decremento dell'angolo ad ogni step di movimento.
-        # SERVO_INTERVAL: tempo minimo (ms) tra uno step e il successivo.
-        # Questi due parametri determinano la "velocità" e la fluidità di apertura/chiusura.
-        self.SERVO_STEP = 2
-        self.SERVO_INTERVAL = 30     # 30ms
-
-        # SAFE_DELAY: tempo (ms) in cui entrambi i sensori devono risultare "liberi"
-        # prima di autorizzare la chiusura automatica (evita chiusure immediate per transitori).
-        self.SAFE_DELAY = 1000
+        # Metodo bound del PWM salvato una volta: set_servo evita la lookup self.servo.duty_u16.
+        self._pwm_duty_u16 = self.servo.duty_u16
 
         # Stato iniziale: sbarra ferma (IDLE) e chiusa.
-        self.state = self.STATE_IDLE
+        self.state = _STATE_IDLE
 
         # servo_angle: angolo logico corrente della sbarra.
         # target_angle: angolo logico obiettivo verso cui il servo deve muoversi.
-        self.servo_angle = self.SERVO_DOWN
-        self.target_angle = self.SERVO_DOWN
+        self.servo_angle = _SERVO_DOWN
+        self.target_angle = _SERVO_DOWN
 
         # Applica fisicamente la posizione iniziale al servo.
         self.set_servo(self.servo_angle)
 
-        # Timestamp/variabili temporali per gestire eventi periodici senza bloccare:
-        # - last_blink: ultimo istante in cui è stato togglato il giallo lampeggiante
-        # - last_servo_move: ultimo istante in cui è stato fatto uno step del servo
-        # - clear_start: istante in cui entrambi i sensori risultano liberi (per SAFE_DELAY)
-        self.last_blink = 0
-        self.last_servo_move = 0
+        # clear_start: istante in cui entrambi i sensori risultano liberi (per SAFE_DELAY).
         self.clear_start = 0
 
-        # Flag di comandi remoti (via MQTT):
-        # - remote_open_requested: richiesta di apertura remota
-        # - remote_close_requested: richiesta di chiusura remota
-        #
-        # Questi flag vengono consumati in update() (una volta letti vengono azzerati).
-        self.remote_open_requested = False
-        self.remote_close_requested = False
-
-        # manual_mode: indica se l'apertura è stata richiesta "manuale/remota"
-        # e quindi la sbarra deve restare aperta (STATE_MANUAL_OPEN) finché non arriva close.
-        self.manual_mode = False
-
-        # Flag “riassuntivo” del movimento, aggiornato in update().
-        # (Non calcola la differenza tra angolo e target: riflette solo lo stato della FSM.)
-        self.is_moving_flag = False
-
+        # Timer hardware che scandisce il movimento della sbarra (step servo + lampeggio giallo).
+        # Viene armato solo durante OPENING/CLOSING (vedi _start_motion/_stop_motion):
+        # la cadenza degli step non dipende più dalla durata del loop principale.
+        self._step_timer = Timer(timer_id)
+
+        # Contatore degli step dall'ultimo toggle del giallo.
+        self._blink_ticks = 0
+
+        # Scadenza assoluta (ticks_ms) del prossimo step del timer: usata da next_wake()
+        # per dire al loop principale quanto può dormire durante il movimento.
+        self._next_step_at = 0
+
+        # Riferimento al metodo bound pre-allocato: l'ISR lo passa a micropython.schedule
+        # senza creare nuovi oggetti (nessuna allocazione in contesto di interrupt).
+        self._step_ref = self._step_servo
+
+        # Log circolare degli eventi della FSM: (timestamp_ms, evento).
+        # update() non stampa mai sulla seriale (print su UART è bloccante, alcuni ms):
+        # gli eventi vengono accodati qui e stampati da drain_events() a sbarra ferma.
+        # Con maxlen=32 gli eventi più vecchi vengono scartati se nessuno svuota la coda.
+        self._event_log = deque((), 32)
+
+        # Parola di flag (bit FLAG_*):
+        # - FLAG_OPEN_REQ / FLAG_CLOSE_REQ: comandi remoti (via MQTT), consumati in update()
+        #   (una volta letti vengono azzerati).
+        # - FLAG_MANUAL: l'apertura è stata richiesta "manuale/remota" e quindi la sbarra
+        #   deve restare aperta (STATE_MANUAL_OPEN) finché non arriva close.
+        # - FLAG_MOVING: flag "riassuntivo" del movimento, aggiornato in update()
+        #   (non calcola la differenza tra angolo e target: riflette solo lo stato della FSM).
+        self._flags = 0
+
+        # True quando IDLE ha già impostato le luci (rosso acceso, giallo spento) e la FSM
+        # non è più uscita da IDLE: permette a update() di uscire subito nel caso "quieto".
+        # Azzerato a ogni uscita da IDLE (_start_motion, passaggio a GREEN).
+        self._idle_lit = False
+
+        # Riferimenti bound pre-calcolati per il percorso caldo di update():
+        # "self.ir_entrance.pin.value" costa tre lookup di attributo per ogni lettura,
+        # mentre con il metodo già legato basta un solo accesso prima della chiamata C.
+        self._ir_ent = ir_entrance.pin.value
+        self._ir_exit_v = ir_exit.pin.value
+        self._btn = gate_button.pin.value
+
+        # Campionamento unico degli ingressi: se IR ingresso, IR uscita e pulsante stanno
+        # tutti nel banco GPIO 0-31 (configurazione attuale: 14, 26, 12), update() legge
+        # il registro GPIO_IN una sola volta ed estrae i tre bit. Altrimenti usa i Pin.
+        self._sh_ent = ir_entrance.pin_num
+        self._sh_exit = ir_exit.pin_num
+        self._sh_btn = gate_button.pin_num
+        self._gpio_in_fast = self._sh_ent < 32 and self._sh_exit < 32 and self._sh_btn < 32
+        self._yellow_toggle = traffic_light.yellow_toggle_fast
+        self._red_on = traffic_light.red_on
+        self._red_off = traffic_light.red_off
+        self._green_on = traffic_light.green_on
+        self._green_off = traffic_light.green_off
+        self._yellow_off = traffic_light.yellow_off
+        self._all_off = traffic_light.all_off
+
+        # Tabella di dispatch della FSM: l'indice corrisponde ai valori STATE_*.
+        # update() chiama direttamente self._handlers[self.state](now, ir_ent, ir_exit, btn).
+        self._handlers = (
+            self._st_idle,          # STATE_IDLE
+            self._st_green,         # STATE_GREEN
+            self._st_opening,       # STATE_OPENING
+            self._st_wait_clear,    # STATE_WAIT_CLEAR
+            self._st_closing,       # STATE_CLOSING
+            self._st_manual_open,   # STATE_MANUAL_OPEN
+        )
+
+    @micropython.native
     def set_servo(self, logic_angle):
         """
         Imposta l'angolo del servo applicando una inversione software.
@@ -94,48 +257,34 @@ class ServoGate:
           Qui si traduce: LOGICO 0->90  in FISICO 90->0.
 
         Come funziona:
-        1) Clamp dell'angolo logico in [0, 180] per sicurezza.
-        2) Calcolo dell'angolo fisico: physical_angle = 90 - logic_angle.
-           - Se logic_angle = 0  => physical_angle = 90
-           - Se logic_angle = 90 => physical_angle = 0
-        3) Mappatura dell'angolo fisico in duty_u16:
-           duty = 1700 + (physical_angle * 6500) // 180
-           - 1700 è un offset minimo di impulso (in unità u16 del PWM)
-           - 6500 è l'escursione utile
-           - divisione intera // 180 per scalare su 0..180 gradi
-        4) Invio del duty al PWM e aggiornamento dello stato interno servo_angle (logico).
+        1) Clamp dell'angolo logico (intero) in [0, 180] per sicurezza, con _clamp180 (viper).
+        2) Lettura del duty_u16 dalla tabella _DUTY_LUT (letterale del modulo) calcolata con:
+           - angolo fisico: physical_angle = max(0, 90 - logic_angle)
+             (logic_angle = 0 => 90, logic_angle = 90 => 0)
+           - duty = 1700 + (physical_angle * 6500) // 180
+             (1700 = offset minimo di impulso, 6500 = escursione utile)
+        3) Invio del duty al PWM e aggiornamento dello stato interno servo_angle (logico).
         """
-        # Converte in intero e limita l'angolo logico a un range sicuro.
-        logic_angle = int(max(0, min(180, logic_angle)))
-
-        # Inversione software: il verso fisico del servo è invertito rispetto alla logica.
-        physical_angle = 90 - logic_angle
-
-        # Anche l'angolo fisico viene clampato per evitare valori fuori range.
-        physical_angle = int(max(0, min(180, physical_angle)))
-
-        # Conversione angolo -> duty PWM (16-bit).
-        # Formula lineare: offset + scala*(angolo/180).
-        duty = 1700 + (physical_angle * 6500) // 180
+        # Limita l'angolo logico a un range sicuro (indice valido della tabella).
+        a = _clamp180(logic_angle)
 
         # Imposta il duty in formato u16 (0..65535) per pilotare il servo.
-        self.servo.duty_u16(duty)
+        self._pwm_duty_u16(_duty_at(a))
 
         # Salva l'angolo LOGICO corrente (quello usato dalla FSM).
-        self.servo_angle = logic_angle
+        self.servo_angle = a
 
+    @micropython.native
     def is_moving(self):
         """
         Ritorna True se la sbarra è in movimento (apertura/chiusura) e non ha ancora raggiunto il target.
 
         Come funziona:
-        - Se lo stato è OPENING o CLOSING, confronta servo_angle con target_angle.
+        - Se lo stato è OPENING o CLOSING (bit in _MOVING_MASK), confronta servo_angle con target_angle.
         - Se servo_angle != target_angle significa che non ha ancora completato il movimento.
         - In tutti gli altri stati ritorna False.
         """
-        if self.state in [self.STATE_OPENING, self.STATE_CLOSING]:
-            return self.servo_angle != self.target_angle
-        return False
+        return bool(_MOVING_MASK & (1 << self.state)) and self.servo_angle != self.target_angle
 
     def request_open(self):
         """
@@ -145,13 +294,12 @@ class ServoGate:
         - chiamata quando arriva un comando esterno (MQTT).
 
         Come funziona:
-        - Imposta un flag (remote_open_requested) che verrà processato in update().
-        - Imposta manual_mode=True: l'apertura viene considerata "manuale/remota",
+        - Imposta il bit FLAG_OPEN_REQ che verrà processato in update().
+        - Imposta FLAG_MANUAL: l'apertura viene considerata "manuale/remota",
           quindi dopo l'apertura completa si andrà nello stato STATE_MANUAL_OPEN
           (sbarra mantenuta aperta finché non arriva una richiesta di chiusura).
         """
-        self.remote_open_requested = True
-        self.manual_mode = True
+        self._flags |= _FLAG_OPEN_REQ | _FLAG_MANUAL
 
     def request_close(self):
         """
@@ -161,232 +309,388 @@ class ServoGate:
         - chiamata da remoto per chiudere una sbarra mantenuta aperta manualmente.
 
         Come funziona:
-        - Imposta un flag (remote_close_requested) che verrà processato in update().
+        - Imposta il bit FLAG_CLOSE_REQ che verrà processato in update().
         - La chiusura effettiva avverrà solo in stati compatibili (WAIT_CLEAR / MANUAL_OPEN)
           e solo se i sensori risultano liberi (entrambi a 1).
         """
-        self.remote_close_requested = True
+        self._flags |= _FLAG_CLOSE_REQ
+
+    def _start_motion(self):
+        """
+        Arma il timer hardware che muove la sbarra.
+
+        A cosa serve:
+        - Chiamata ad ogni ingresso in OPENING/CLOSING.
+        - Gli step del servo avvengono ogni SERVO_INTERVAL ms con la precisione del timer,
+          indipendentemente da quanto dura un giro del loop principale.
+
+        Come funziona:
+        - Azzera il contatore del lampeggio (primo toggle dopo BLINK_INTERVAL ms).
+        - (Ri)inizializza il timer in modalità periodica con callback _on_step_timer.
+        """
+        self._blink_ticks = 0
+        self._idle_lit = False
+        self._next_step_at = ticks_add(ticks_ms(), _SERVO_INTERVAL)
+        self._step_timer.init(period=_SERVO_INTERVAL, mode=Timer.PERIODIC, callback=self._on_step_timer)
+
+    def _stop_motion(self):
+        """Disarma il timer del movimento (sbarra ferma)."""
+        self._step_timer.deinit()
+
+    def _on_step_timer(self, t):
+        """
+        Callback del timer (contesto di interrupt).
+
+        Come funziona:
+        - Non tocca direttamente il PWM: rimanda lo step a _step_servo tramite
+          micropython.schedule, così l'ISR resta brevissima.
+        - Se la coda di schedule è piena (RuntimeError) lo step viene saltato:
+          verrà recuperato al tick successivo.
+        """
+        try:
+            micropython.schedule(self._step_ref, 0)
+        except RuntimeError:
+            pass
+
+    def start_fsm_timer(self, timer_id, period=_SERVO_INTERVAL):
+        """
+        Fa girare update() su un timer hardware periodico invece che dal loop principale.
+
+        A cosa serve:
+        - Cadenza deterministica della FSM (default ogni SERVO_INTERVAL ms), indipendente
+          da quanto dura un giro del loop (MQTT, display, sensori lenti).
+
+        Parametri:
+        - timer_id: id del timer hardware (ESP32: 0-3), diverso da quello dello step servo.
+        - period: periodo in ms.
+
+        Come funziona:
+        - La callback del timer rimanda update() con micropython.schedule (come per lo step),
+          usando un riferimento bound pre-allocato: nessuna allocazione in contesto di interrupt.
+        - update() non stampa mai (eventi in _event_log), quindi non blocca sulla UART.
+        """
+        self._fsm_ref = self._update_scheduled
+        self._fsm_timer = Timer(timer_id)
+        self._fsm_timer.init(period=period, mode=Timer.PERIODIC, callback=self._on_fsm_timer)
+
+    def _on_fsm_timer(self, t):
+        """Callback del timer della FSM: schedula update(); se la coda è piena salta un giro."""
+        try:
+            micropython.schedule(self._fsm_ref, 0)
+        except RuntimeError:
+            pass
+
+    def _update_scheduled(self, _):
+        """Adattatore per micropython.schedule (che passa un argomento) verso update()."""
+        self.update()
+
+    @micropython.viper
+    def _ramp(self, direction: int) -> int:
+        """
+        Calcola l'angolo del prossimo step (aritmetica intera compilata viper).
+
+        Parametri:
+        - direction: +1 in apertura, -1 in chiusura.
+
+        Ritorna:
+        - servo_angle + direction * SERVO_STEP, clampato a target_angle.
+        """
+        a = int(self.servo_angle) + direction * _SERVO_STEP
+        t = int(self.target_angle)
+        if direction > 0 and a > t:
+            a = t
+        if direction < 0 and a < t:
+            a = t
+        return a
+
+    def _blink_yellow(self):
+        """
+        Avanza il lampeggio giallo di uno step del timer.
+
+        Come funziona:
+        - Ogni BLINK_TICKS step inverte il giallo con traffic_light.yellow_toggle_fast()
+          (lettura del latch di uscita + una scrittura W1TS/W1TC).
+        - La scadenza è contata in step del timer servo, condiviso col movimento:
+          nessun ticks_diff e nessuna lettura del pin.
+        """
+        self._blink_ticks += 1
+        if self._blink_ticks >= _BLINK_TICKS:
+            self._blink_ticks = 0
+            self._yellow_toggle()
 
+    @micropython.native
+    def _step_servo(self, _):
+        """
+        Esegue uno step di movimento della sbarra (chiamata schedulata dal timer).
+
+        A cosa serve:
+        - Avanza servo_angle di SERVO_STEP verso target_angle e applica la posizione.
+        - Gestisce il lampeggio giallo (toggle ogni BLINK_TICKS step).
+
+        Come funziona:
+        - La direzione dipende dallo stato: OPENING sale, CLOSING scende.
+        - Il calcolo dell'angolo con clamp al target è delegato a _ramp() (viper).
+        - Le transizioni di stato (fine corsa, inversione per sicurezza) restano in update().
+        """
+        if self.state == _STATE_OPENING:
+            angle = self._ramp(1)
+        elif self.state == _STATE_CLOSING:
+            angle = self._ramp(-1)
+        else:
+            # Nessun movimento in corso: il timer non serve più.
+            self._stop_motion()
+            return
+
+        # Prossimo step atteso (riferimento per next_wake()): la scadenza avanza di
+        # SERVO_INTERVAL a partire da quella precedente, come il timer periodico,
+        # così il jitter di esecuzione della callback non si accumula.
+        # Se uno step è stato saltato (coda schedule piena) si riallinea a "adesso".
+        nxt = ticks_add(self._next_step_at, _SERVO_INTERVAL)
+        now = ticks_ms()
+        if ticks_diff(nxt, now) <= 0:
+            nxt = ticks_add(now, _SERVO_INTERVAL)
+        self._next_step_at = nxt
+
+        # Lampeggio giallo: commuta ogni BLINK_TICKS step (= BLINK_INTERVAL ms).
+        self._blink_yellow()
+
+        # Applica la nuova posizione.
+        self.set_servo(angle)
+
+    @micropython.native
     def update(self):
         """
         Aggiorna la macchina a stati della sbarra.
 
         A cosa serve:
         - Deve essere chiamata ciclicamente nel loop principale.
-        - Gestisce: comandi remoti, logica ingresso/uscita, apertura/chiusura graduale,
-          lampeggio giallo, sicurezza in chiusura (SAFE_DELAY).
+        - Gestisce: comandi remoti, logica ingresso/uscita, transizioni di fine corsa,
+          sicurezza in chiusura (SAFE_DELAY).
+        - Lo step del servo e il lampeggio giallo sono invece guidati dal timer
+          hardware (vedi _start_motion/_step_servo).
 
         Come funziona:
-        - Usa time.ticks_ms() come clock non bloccante.
+        - Usa ticks_ms() come clock non bloccante.
         - Implementa una FSM con stati:
           IDLE -> GREEN -> OPENING -> WAIT_CLEAR -> CLOSING
           e un ramo MANUAL_OPEN per aperture manuali/remoto.
+        - Dopo i comandi remoti, il gestore dello stato corrente viene scelto
+          per indice nella tupla _handlers (un solo accesso, nessuna catena di if/elif).
         """
         # Timestamp corrente in ms (gestione corretta overflow con ticks_diff).
-        now = time.ticks_ms()
+        now = ticks_ms()
+
+        # Snapshot degli ingressi: tutti i rami vedono lo stesso valore dei sensori
+        # nello stesso ciclo. Con i pin nel banco 0-31 basta una lettura di registro
+        # (campionamento simultaneo); altrimenti al massimo tre letture Pin.value().
+        if self._gpio_in_fast:
+            g = _read_gpio_in()
+            ir_ent = (g >> self._sh_ent) & 1
+            ir_exit = (g >> self._sh_exit) & 1
+            btn = (g >> self._sh_btn) & 1
+        else:
+            ir_ent = self._ir_ent()
+            ir_exit = self._ir_exit_v()
+            btn = self._btn()
 
         # Flag movimento basato sullo stato: utile per telemetria o logica esterna.
-        self.is_moving_flag = (self.state in [self.STATE_OPENING, self.STATE_CLOSING])
+        if _MOVING_MASK & (1 << self.state):
+            self._flags |= _FLAG_MOVING
+        else:
+            self._flags &= ~_FLAG_MOVING
+
+        # USCITA RAPIDA (caso quieto)
+        # In IDLE, con luci già impostate, nessun comando remoto in attesa, uscita libera
+        # e ingresso libero (o parcheggio pieno, che ignora l'ingresso) non può cambiare nulla:
+        # si evita tutto il resto della FSM.
+        if (self.state == _STATE_IDLE and self._idle_lit
+                and not (self._flags & (_FLAG_OPEN_REQ | _FLAG_CLOSE_REQ))
+                and ir_exit == 1
+                and (ir_ent == 1 or (self.is_parking_full_cb and self.is_parking_full_cb()))):
+            return
 
         # COMANDI REMOTI
         # Gestione prioritaria: se arriva un comando remoto, lo processiamo subito
         # e in molti casi facciamo "return" per evitare di eseguire altra logica nello stesso ciclo.
-        if self.remote_open_requested:
+        if self._flags & _FLAG_OPEN_REQ:
             # Consuma il comando: lo azzera per evitare di ripeterlo nei cicli successivi.
-            self.remote_open_requested = False
+            self._flags &= ~_FLAG_OPEN_REQ
 
             # Se non stiamo già aprendo e non siamo già in stato di apertura manuale,
             # avviamo un'apertura forzata.
-            if self.state not in [self.STATE_OPENING, self.STATE_MANUAL_OPEN]:
-                self.state = self.STATE_OPENING
-                self.target_angle = self.SERVO_UP
-                self.manual_mode = True
-                self.last_servo_move = now
+            if not (_REMOTE_OPEN_SKIP_MASK & (1 << self.state)):
+                self.state = _STATE_OPENING
+                self.target_angle = _SERVO_UP
+                self._flags |= _FLAG_MANUAL
+                self._start_motion()
 
                 # Spenge verde e rosso: durante il movimento si userà il giallo lampeggiante.
-                self.traffic_light.green_off()
-                self.traffic_light.red_off()
+                self._green_off()
+                self._red_off()
                 return
 
-        if self.remote_close_requested:
+        if self._flags & _FLAG_CLOSE_REQ:
             # Consuma il comando remoto di chiusura.
-            self.remote_close_requested = False
+            self._flags &= ~_FLAG_CLOSE_REQ
 
             # La chiusura remota è consentita solo se la sbarra è "aperta"
             # in contesto automatico (WAIT_CLEAR) o in manuale (MANUAL_OPEN).
-            if self.state in [self.STATE_WAIT_CLEAR, self.STATE_MANUAL_OPEN]:
+            if _REMOTE_CLOSE_MASK & (1 << self.state):
                 # Chiusura consentita solo se entrambi i sensori risultano liberi:
                 # qui si assume convenzione: valore 1 = nessun ostacolo rilevato.
-                if self.ir_entrance.pin.value() == 1 and self.ir_exit.pin.value() == 1:
-                    self.state = self.STATE_CLOSING
-                    self.target_angle = self.SERVO_DOWN
-                    self.manual_mode = False
-                    self.last_servo_move = now
+                if ir_ent == 1 and ir_exit == 1:
+                    self.state = _STATE_CLOSING
+                    self.target_angle = _SERVO_DOWN
+                    self._flags &= ~_FLAG_MANUAL
+                    self._start_motion()
 
         # --- MACCHINA A STATI ---
-
-        # 1. IDLE (Fermo)
-        if self.state == self.STATE_IDLE:
-            # Stato di riposo: sbarra chiusa e semaforo rosso acceso.
-            self.traffic_light.red_on()
-            self.traffic_light.yellow_off()
-
-            # --- USCITA AUTOMATICA (SEMPRE PERMESSA) ---
-            # Se il sensore di uscita rileva un veicolo (convenzione: 0 = rilevato),
-            # la sbarra si apre indipendentemente dal fatto che il parcheggio sia pieno.
-            if self.ir_exit.pin.value() == 0:
-                print("Auto in uscita rilevata -> Apertura Automatica")
-                self.state = self.STATE_OPENING
-                self.target_angle = self.SERVO_UP
-                self.last_servo_move = now
-                self.last_blink = now
-
-                # Spegne il rosso: durante l'apertura si usa il giallo lampeggiante.
-                self.traffic_light.red_off()
-
-                # Apertura per uscita => non è manuale.
-                self.manual_mode = False
-                return
-
-            # --- BLOCCO INGRESSO SE PARCHEGGIO PIENO ---
-            # Se pieno, ignora completamente l'IR di ingresso: non si passa a GREEN.
-            # Questo evita che l'ingresso venga "pre-autorizzato".
-            if self.is_parking_full_cb and self.is_parking_full_cb():
-                # Resta rosso e chiuso.
-                return
-
-            # --- INGRESSO: auto rilevata all'ingresso ---
-            # Se il sensore di ingresso rileva un veicolo (0 = rilevato),
-            # entra nello stato GREEN in cui attende la pressione del pulsante.
-            if self.ir_entrance.pin.value() == 0:
-                self.state = self.STATE_GREEN
-
-        # 2. GREEN (Attesa Pulsante)
-        elif self.state == self.STATE_GREEN:
-            # Se il parcheggio diventa pieno mentre si è in GREEN,
-            # annulla l'autorizzazione e torna in IDLE mantenendo la sbarra chiusa.
-            if self.is_parking_full_cb and self.is_parking_full_cb():
-                self.traffic_light.green_off()
-                self.state = self.STATE_IDLE
-                return
-
-            # Segnala "pronto ingresso" accendendo il verde.
-            self.traffic_light.green_on()
-
-            # Priorità uscita anche qui: se rilevo veicolo in uscita, apro.
-            if self.ir_exit.pin.value() == 0:
-                self.state = self.STATE_OPENING
-                self.target_angle = self.SERVO_UP
-                self.last_servo_move = now
-                self.last_blink = now
-                self.traffic_light.green_off()
-                self.manual_mode = False
-                return
-
-            # Pulsante premuto (0 = premuto): avvia apertura.
-            # Il controllo "parcheggio pieno" è già stato fatto sopra, quindi qui è implicito
-            # che l'apertura per ingresso è consentita.
-            if self.gate_button.pin.value() == 0:
-                self.state = self.STATE_OPENING
-                self.target_angle = self.SERVO_UP
-                self.last_servo_move = now
-                self.last_blink = now
-                self.traffic_light.green_off()
-                self.manual_mode = False
-
-            # Se il veicolo non è più rilevato all'ingresso (sensore torna a 1),
-            # annulla lo stato GREEN e torna in IDLE.
-            elif self.ir_entrance.pin.value() == 1:
-                self.state = self.STATE_IDLE
-
-        # 3. OPENING
-        elif self.state == self.STATE_OPENING:
-            # Lampeggio giallo ogni 150 ms: alterna lo stato del LED giallo.
-            # value(not value()) è un toggle: True->False o False->True.
-            if time.ticks_diff(now, self.last_blink) >= 150:
-                self.traffic_light.yellow.value(not self.traffic_light.yellow.value())
-                self.last_blink = now
-
-            # Movimento del servo a step temporizzati per avere apertura graduale e non bloccante.
-            if time.ticks_diff(now, self.last_servo_move) >= self.SERVO_INTERVAL:
-                self.servo_angle += self.SERVO_STEP
-
-                # Evita di superare target_angle: clamp al target.
-                if self.servo_angle > self.target_angle:
-                    self.servo_angle = self.target_angle
-
-                # Applica la nuova posizione.
-                self.set_servo(self.servo_angle)
-                self.last_servo_move = now
-
-                # Se raggiunta l'apertura completa:
-                # - spegne il giallo
-                # - passa a WAIT_CLEAR (auto) o MANUAL_OPEN (manuale/remoto)
-                if self.servo_angle >= self.SERVO_UP:
-                    self.traffic_light.yellow_off()
-                    self.state = self.STATE_MANUAL_OPEN if self.manual_mode else self.STATE_WAIT_CLEAR
-
-                    # Reset del timer di "clear": verrà inizializzato quando i sensori sono liberi.
-                    self.clear_start = 0
-
-        # 4. WAIT CLEAR
-        elif self.state == self.STATE_WAIT_CLEAR:
-            # In stato di sbarra aperta automatica:
-            # si spengono tutte le luci e si aspetta che l'area sia libera
-            # per SAFE_DELAY prima di chiudere.
-            self.traffic_light.all_off()
-
-            # Se entrambi i sensori sono liberi (1 e 1), avvia/continua il conteggio di sicurezza.
-            if self.ir_entrance.pin.value() == 1 and self.ir_exit.pin.value() == 1:
-                # Se è la prima volta che risultano liberi, memorizza l'istante di inizio.
-                if self.clear_start == 0:
-                    self.clear_start = now
-
-                # Se sono rimasti liberi abbastanza a lungo, avvia chiusura.
-                if time.ticks_diff(now, self.clear_start) >= self.SAFE_DELAY:
-                    self.state = self.STATE_CLOSING
-                    self.target_angle = self.SERVO_DOWN
-                    self.last_servo_move = now
-                    self.last_blink = now
-            else:
-                # Se almeno uno dei sensori rileva presenza, resetta il timer
-                # per richiedere di nuovo SAFE_DELAY continui di area libera.
-                self.clear_start = 0
-
-        # 5. CLOSING
-        elif self.state == self.STATE_CLOSING:
-            # Lampeggio giallo durante la chiusura (stessa logica dell'apertura).
-            if time.ticks_diff(now, self.last_blink) >= 150:
-                self.traffic_light.yellow.value(not self.traffic_light.yellow.value())
-                self.last_blink = now
-
-            # Sicurezza: se durante la chiusura si rileva un veicolo (ingresso o uscita),
-            # interrompe la chiusura e torna ad aprire.
-            if self.ir_entrance.pin.value() == 0 or self.ir_exit.pin.value() == 0:
-                self.state = self.STATE_OPENING
-                self.target_angle = self.SERVO_UP
-                return
-
-            # Movimento a step temporizzati per chiusura graduale.
-            if time.ticks_diff(now, self.last_servo_move) >= self.SERVO_INTERVAL:
-                self.servo_angle -= self.SERVO_STEP
-
-                # Evita di scendere sotto target_angle: clamp al target.
-                if self.servo_angle < self.target_angle:
-                    self.servo_angle = self.target_angle
-
-                # Applica la nuova posizione.
-                self.set_servo(self.servo_angle)
-                self.last_servo_move = now
-
-                # Se raggiunta la chiusura completa:
-                # - spegne il giallo
-                # - accende il rosso
-                # - torna in IDLE
-                if self.servo_angle <= self.SERVO_DOWN:
-                    self.traffic_light.yellow_off()
-                    self.traffic_light.red_on()
-                    self.state = self.STATE_IDLE
+        # Dispatch O(1): l'indice della tupla coincide con il valore STATE_*.
+        self._handlers[self.state](now, ir_ent, ir_exit, btn)
+
+    @micropython.native
+    def _st_idle(self, now, ir_ent, ir_exit, btn):
+        """1. IDLE (Fermo): sbarra chiusa, attesa veicolo in ingresso o in uscita."""
+        # Stato di riposo: sbarra chiusa e semaforo rosso acceso.
+        # Le luci vengono scritte solo al primo giro in IDLE (poi _idle_lit resta True).
+        if not self._idle_lit:
+            self._red_on()
+            self._yellow_off()
+            self._idle_lit = True
+
+        # --- USCITA AUTOMATICA (SEMPRE PERMESSA) ---
+        # Se il sensore di uscita rileva un veicolo (convenzione: 0 = rilevato),
+        # la sbarra si apre indipendentemente dal fatto che il parcheggio sia pieno.
+        if ir_exit == 0:
+            self._event_log.append((now, "Auto in uscita rilevata -> Apertura Automatica"))
+            self.state = _STATE_OPENING
+            self.target_angle = _SERVO_UP
+            self._start_motion()
+
+            # Spegne il rosso: durante l'apertura si usa il giallo lampeggiante.
+            self._red_off()
+
+            # Apertura per uscita => non è manuale.
+            self._flags &= ~_FLAG_MANUAL
+            return
+
+        # --- BLOCCO INGRESSO SE PARCHEGGIO PIENO ---
+        # Se pieno, ignora completamente l'IR di ingresso: non si passa a GREEN.
+        # Questo evita che l'ingresso venga "pre-autorizzato".
+        if self.is_parking_full_cb and self.is_parking_full_cb():
+            # Resta rosso e chiuso.
+            return
+
+        # --- INGRESSO: auto rilevata all'ingresso ---
+        # Se il sensore di ingresso rileva un veicolo (0 = rilevato),
+        # entra nello stato GREEN in cui attende la pressione del pulsante.
+        if ir_ent == 0:
+            self.state = _STATE_GREEN
+            self._idle_lit = False
+
+    @micropython.native
+    def _st_green(self, now, ir_ent, ir_exit, btn):
+        """2. GREEN (Attesa Pulsante): veicolo in ingresso, verde acceso."""
+        # Se il parcheggio diventa pieno mentre si è in GREEN,
+        # annulla l'autorizzazione e torna in IDLE mantenendo la sbarra chiusa.
+        if self.is_parking_full_cb and self.is_parking_full_cb():
+            self._green_off()
+            self.state = _STATE_IDLE
+            return
+
+        # Segnala "pronto ingresso" accendendo il verde.
+        self._green_on()
+
+        # Priorità uscita anche qui: se rilevo veicolo in uscita, apro.
+        if ir_exit == 0:
+            self.state = _STATE_OPENING
+            self.target_angle = _SERVO_UP
+            self._start_motion()
+            self._green_off()
+            self._flags &= ~_FLAG_MANUAL
+            return
+
+        # Pulsante premuto (0 = premuto): avvia apertura.
+        # Il controllo "parcheggio pieno" è già stato fatto sopra, quindi qui è implicito
+        # che l'apertura per ingresso è consentita.
+        if btn == 0:
+            self.state = _STATE_OPENING
+            self.target_angle = _SERVO_UP
+            self._start_motion()
+            self._green_off()
+            self._flags &= ~_FLAG_MANUAL
+
+        # Se il veicolo non è più rilevato all'ingresso (sensore torna a 1),
+        # annulla lo stato GREEN e torna in IDLE.
+        elif ir_ent == 1:
+            self.state = _STATE_IDLE
+
+    @micropython.native
+    def _st_opening(self, now, ir_ent, ir_exit, btn):
+        """3. OPENING: attesa fine corsa in apertura."""
+        # Step del servo e lampeggio giallo sono eseguiti dal timer (_step_servo):
+        # qui si gestisce solo la transizione di fine apertura.
+        #
+        # Se raggiunta l'apertura completa:
+        # - ferma il timer e spegne il giallo
+        # - passa a WAIT_CLEAR (auto) o MANUAL_OPEN (manuale/remoto)
+        if self.servo_angle >= _SERVO_UP:
+            self._stop_motion()
+            self._yellow_off()
+            self.state = _STATE_MANUAL_OPEN if self._flags & _FLAG_MANUAL else _STATE_WAIT_CLEAR
+
+            # Reset del timer di "clear": verrà inizializzato quando i sensori sono liberi.
+            self.clear_start = 0
+
+    @micropython.native
+    def _st_wait_clear(self, now, ir_ent, ir_exit, btn):
+        """4. WAIT CLEAR: sbarra aperta (auto), chiusura dopo SAFE_DELAY di area libera."""
+        # In stato di sbarra aperta automatica:
+        # si spengono tutte le luci e si aspetta che l'area sia libera
+        # per SAFE_DELAY prima di chiudere.
+        self._all_off()
+
+        # Se entrambi i sensori sono liberi (1 e 1), avvia/continua il conteggio di sicurezza.
+        if ir_ent == 1 and ir_exit == 1:
+            # Se è la prima volta che risultano liberi, memorizza l'istante di inizio.
+            if self.clear_start == 0:
+                self.clear_start = now
+
+            # Se sono rimasti liberi abbastanza a lungo, avvia chiusura.
+            if ticks_diff(now, self.clear_start) >= _SAFE_DELAY:
+                self.state = _STATE_CLOSING
+                self.target_angle = _SERVO_DOWN
+                self._start_motion()
+        else:
+            # Se almeno uno dei sensori rileva presenza, resetta il timer
+            # per richiedere di nuovo SAFE_DELAY continui di area libera.
+            self.clear_start = 0
+
+    @micropython.native
+    def _st_closing(self, now, ir_ent, ir_exit, btn):
+        """5. CLOSING: sicurezza ostacoli e attesa fine corsa in chiusura."""
+        # Sicurezza: se durante la chiusura si rileva un veicolo (ingresso o uscita),
+        # interrompe la chiusura e torna ad aprire.
+        # Il timer resta armato: dal prossimo step _step_servo muoverà verso l'alto.
+        if ir_ent == 0 or ir_exit == 0:
+            self.state = _STATE_OPENING
+            self.target_angle = _SERVO_UP
+            return
+
+        # Se raggiunta la chiusura completa:
+        # - ferma il timer e spegne il giallo
+        # - accende il rosso
+        # - torna in IDLE
+        if self.servo_angle <= _SERVO_DOWN:
+            self._stop_motion()
+            self._yellow_off()
+            self._red_on()
+            self.state = _STATE_IDLE
+
+    @micropython.native
+    def _st_manual_open(self, now, ir_ent, ir_exit, btn):
+        """6. MANUAL_OPEN: sbarra tenuta aperta finché non arriva request_close()."""
+        pass
 
     def is_open(self):
         """Ritorna True se la sbarra è aperta o si sta aprendo"""
@@ -394,15 +698,49 @@ class ServoGate:
         # - sta aprendo (OPENING)
         # - è aperta automatica in attesa area libera (WAIT_CLEAR)
         # - è aperta manuale (MANUAL_OPEN)
-        return self.state in [self.STATE_OPENING, self.STATE_WAIT_CLEAR, self.STATE_MANUAL_OPEN]
+        return bool(_OPEN_MASK & (1 << self.state))
+
+    def next_wake(self, now):
+        """
+        Ritorna fra quanti ms scade la prossima scadenza interna della sbarra.
+
+        A cosa serve:
+        - Permette al loop principale di dormire fino al prossimo evento utile
+          invece di ciclare a vuoto (es. durante il movimento).
+
+        Come funziona:
+        - OPENING/CLOSING: tempo mancante al prossimo step del timer.
+        - WAIT_CLEAR con area libera: tempo mancante alla fine di SAFE_DELAY.
+        - Altri stati: nessuna scadenza (la FSM dipende solo dai sensori).
+
+        Ritorna:
+        - int >= 0: millisecondi alla prossima scadenza
+        - -1: nessuna scadenza interna
+        """
+        if _MOVING_MASK & (1 << self.state):
+            d = ticks_diff(self._next_step_at, now)
+        elif self.state == _STATE_WAIT_CLEAR and self.clear_start != 0:
+            d = _SAFE_DELAY - ticks_diff(now, self.clear_start)
+        else:
+            return -1
+        return d if d > 0 else 0
+
+    def drain_events(self):
+        """
+        Stampa e svuota il log degli eventi accodati da update().
+
+        A cosa serve:
+        - Spostare le print (bloccanti sulla UART) fuori dal percorso di controllo della sbarra.
+        - Va chiamata dal loop principale quando la sbarra non è in movimento.
+        """
+        log = self._event_log
+        while log:
+            t, msg = log.popleft()
+            print("[{}] {}".format(t, msg))
 
     def get_state(self):
         """Ritorna una stringa descrittiva dello stato"""
-        # Tabella di mapping stato -> stringa leggibile (per debug/display).
-        # L'indice della lista corrisponde direttamente ai valori STATE_* definiti sopra.
-        states = ["CHIUSA", "PRONTA", "APERTURA", "APERTA (AUTO)", "CHIUSURA", "APERTA (MAN)"]
-
+        # Mapping stato -> stringa leggibile (per debug/display) tramite _STATE_NAMES.
         # Controllo bounds per evitare IndexError in caso di stati non previsti.
-        if 0 <= self.state < len(states):
-            return states[self.state]
-        return "UNKNOWN"
\ No newline at end of file
+        st = self.state
+        return _STATE_NAMES[st] if 0 <= st < 6 else "UNKNOWN"
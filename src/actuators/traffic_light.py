@@ -1,5 +1,6 @@
 import machine
-import time
+from array import array
+from actuators.gpio import gpio_write, gpio_toggle, pin_masks, toggle_descriptor
 
 class TrafficLight:
     def __init__(self, red_pin, yellow_pin, green_pin):
@@ -12,6 +13,22 @@ class TrafficLight:
         self.red = machine.Pin(red_pin, machine.Pin.OUT)
         self.yellow = machine.Pin(yellow_pin, machine.Pin.OUT)
         self.green = machine.Pin(green_pin, machine.Pin.OUT)
+
+        # Maschere precalcolate per le scritture a registro (vedi gpio_write):
+        # ogni luce "esclusiva" è una sola coppia clear(tutte le altre)+set(questa),
+        # invece di tre .off() e un .on() separati.
+        r0, r1 = pin_masks(red_pin)
+        y0, y1 = pin_masks(yellow_pin)
+        g0, g1 = pin_masks(green_pin)
+        all0 = r0 | y0 | g0
+        all1 = r1 | y1 | g1
+        self._red_w = array('I', (all0 & ~r0, r0, all1 & ~r1, r1))
+        self._yellow_w = array('I', (all0 & ~y0, y0, all1 & ~y1, y1))
+        self._green_w = array('I', (all0 & ~g0, g0, all1 & ~g1, g1))
+        self._off_w = array('I', (all0, 0, all1, 0))
+
+        # Descrittore per il toggle del giallo (vedi gpio_toggle): registri del suo banco + maschera.
+        self._yellow_t = toggle_descriptor(yellow_pin)
         
     def red_on(self):
         """
@@ -21,11 +38,9 @@ class TrafficLight:
         - Impostare uno stato "mutuamente esclusivo" del semaforo (solo rosso acceso).
 
         Come funziona:
-        - Chiama all_off() per spegnere giallo e verde (e anche rosso, per reset coerente).
-        - Poi accende il rosso.
+        - Una sola scrittura a registro: clear di giallo e verde, poi set del rosso.
         """
-        self.all_off()
-        self.red.on()
+        gpio_write(self._red_w)
         
     def yellow_on(self):
         """
@@ -35,11 +50,9 @@ class TrafficLight:
         - Indicare uno stato di attenzione/lampeggio o fase di transizione.
 
         Come funziona:
-        - Spegne tutte le luci con all_off().
-        - Accende il giallo.
+        - Una sola scrittura a registro: clear di rosso e verde, poi set del giallo.
         """
-        self.all_off()
-        self.yellow.on()
+        gpio_write(self._yellow_w)
         
     def green_on(self):
         """
@@ -49,11 +62,9 @@ class TrafficLight:
         - Segnalare "via libera" o autorizzazione (es. pronto per apertura in ingresso).
 
         Come funziona:
-        - Spegne tutte le luci con all_off().
-        - Accende il verde.
+        - Una sola scrittura a registro: clear di rosso e giallo, poi set del verde.
         """
-        self.all_off()
-        self.green.on()
+        gpio_write(self._green_w)
         
     def red_off(self):
         """
@@ -100,11 +111,9 @@ class TrafficLight:
         - Garantire che prima di accendere una luce "esclusiva" le altre siano spente.
 
         Come funziona:
-        - Chiama .off() su tutti e tre i pin.
+        - Un solo clear (W1TC) con la maschera dei tre pin.
         """
-        self.red.off()
-        self.yellow.off()
-        self.green.off()
+        gpio_write(self._off_w)
         
     def yellow_toggle(self):
         """
@@ -123,4 +132,18 @@ class TrafficLight:
         - Questa funzione non impone esclusività (non spegne rosso/verde).
           È pensata per un lampeggio del giallo gestito da logica esterna.
         """
-        self.yellow.value(not self.yellow.value())
\ No newline at end of file
+        self.yellow.value(not self.yellow.value())
+
+    def yellow_toggle_fast(self):
+        """
+        Inverte la luce gialla con una lettura del latch e una scrittura a registro.
+
+        A cosa serve:
+        - Lampeggio del giallo dal percorso caldo della sbarra (step del timer servo).
+
+        Come funziona:
+        - Come yellow_toggle(), ma senza passare da due chiamate Pin.value():
+          usa gpio_toggle (viper) sul banco GPIO del giallo.
+        - Non impone esclusività (non spegne rosso/verde).
+        """
+        gpio_toggle(self._yellow_t)
@@ -1,4 +1,5 @@
 # boot.py
+import esp32
 import machine
 import time
 import gc
@@ -13,16 +14,31 @@ def boot():
     # Check power button state
     power_pin = machine.Pin(32, machine.Pin.IN, machine.Pin.PULL_UP)
     
-    # If power button is held for 3 seconds on boot, go to deep sleep
-    start_time = time.ticks_ms()
-    while time.ticks_diff(time.ticks_ms(), start_time) < 3000:
-        if power_pin.value() == 1:  # Button released
-            break
-        time.sleep_ms(100)
-    else:
-        # Button held for 3 seconds, go to deep sleep
-        print("Entering deep sleep...")
-        machine.deepsleep()
+    # If power button is held for 3 seconds on boot, go to deep sleep.
+    # Invece di controllare il pin ogni 100 ms a CPU attiva, si dorme in light sleep
+    # per il tempo rimanente: GPIO32 è un pin RTC, quindi il rilascio del pulsante
+    # (livello alto) risveglia subito il chip tramite ext0.
+    # Effetto collaterale di ext0: al risveglio il pad resta assegnato all'RTC IO e va
+    # riconfigurato come GPIO digitale prima di leggerlo (vedi init() dopo lightsleep()).
+    if power_pin.value() == 0:
+        esp32.wake_on_ext0(pin=power_pin, level=esp32.WAKEUP_ANY_HIGH)
+        start_time = time.ticks_ms()
+        while True:
+            remaining = 3000 - time.ticks_diff(time.ticks_ms(), start_time)
+            if power_pin.value() == 1 or remaining <= 0:
+                break
+            machine.lightsleep(remaining)
+            # Riporta GPIO32 alla matrice GPIO digitale: senza, value() non legge il pulsante.
+            power_pin.init(machine.Pin.IN, machine.Pin.PULL_UP)
+
+        # Rimuove la sorgente di risveglio: non deve interferire con il deep sleep
+        # (che, come prima, non ha sorgenti di wake) né con il resto del programma.
+        esp32.wake_on_ext0(pin=None)
+
+        if power_pin.value() == 0:
+            # Button held for 3 seconds, go to deep sleep
+            print("Entering deep sleep...")
+            machine.deepsleep()
     
     print("Boot sequence completed")
     print("Free memory:", gc.mem_free())
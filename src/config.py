@@ -1,34 +1,88 @@
 # config.py
+from micropython import const
+
+# Numeri di pin e id dei timer: valori fissi dell'hardware, dichiarati con const()
+# così il compilatore li inserisce come immediati. La classe Config li riespone
+# con i nomi pubblici di sempre (self.config.PIN_*), che restano l'API per gli altri moduli.
+# I valori modificabili a runtime (soglie, modalità luci) restano attributi normali
+# di Config, aggiornati da update_threshold()/update_light_mode().
+
+# Log di debug degli aggiornamenti via MQTT (uno per ogni messaggio di slider della dashboard).
+# Con 0 il compilatore elimina i rami "if _DEBUG:".
+_DEBUG = const(0)
+
+# I2C Pins for OLED and sensors
+_PIN_SDA = const(21)
+_PIN_SCL = const(22)
+
+# Master button (power on/off and reset)
+_PIN_MASTER_BTN = const(32)
+
+# Gate system
+_PIN_IR_ENTRANCE = const(14)    # IR ingresso
+_PIN_IR_EXIT = const(26)        # IR uscita
+_PIN_GATE_BUTTON = const(12)    # Pulsante apri sbarra
+_PIN_SERVO = const(15)          # Servo motor
+
+# Traffic light
+_PIN_TRAFFIC_RED = const(27)
+_PIN_TRAFFIC_YELLOW = const(4)
+_PIN_TRAFFIC_GREEN = const(2)
+
+# Parking spot sensors
+_PIN_ULTRASONIC_TRIG = const(5)
+_PIN_ULTRASONIC_ECHO = const(18)
+_PIN_PARKING_RED = const(16)
+_PIN_PARKING_GREEN = const(33)
+_PIN_BUZZER = const(17)
+_PIN_PARKING_LIGHT = const(25)
+_PIN_ALARM_LED = const(13)
+
+# Gas sensor
+_PIN_MQ2 = const(34)
+
+# Timer hardware (ESP32: id 0-3)
+_TIMER_SERVO = const(0)          # Step servo + lampeggio giallo sbarra
+_TIMER_GATE_FSM = const(1)       # Tick periodico della FSM sbarra (update())
+_TIMER_BUTTON = const(2)         # Campionamento periodico del pulsante master (poll())
+_TIMER_BUZZER = const(3)         # Lampeggio sonoro dell'allarme gas (solo ad allarme attivo)
+
 class Config:
     # I2C Pins for OLED and sensors
-    PIN_SDA = 21
-    PIN_SCL = 22
+    PIN_SDA = _PIN_SDA
+    PIN_SCL = _PIN_SCL
     
     # Master button (power on/off and reset)
-    PIN_MASTER_BTN = 32
+    PIN_MASTER_BTN = _PIN_MASTER_BTN
     
     # Gate system
-    PIN_IR_ENTRANCE = 14    # IR ingresso
-    PIN_IR_EXIT = 26        # IR uscita
-    PIN_GATE_BUTTON = 12    # Pulsante apri sbarra
-    PIN_SERVO = 15           # Servo motor
+    PIN_IR_ENTRANCE = _PIN_IR_ENTRANCE
+    PIN_IR_EXIT = _PIN_IR_EXIT
+    PIN_GATE_BUTTON = _PIN_GATE_BUTTON
+    PIN_SERVO = _PIN_SERVO
     
     # Traffic light
-    PIN_TRAFFIC_RED = 27
-    PIN_TRAFFIC_YELLOW = 4
-    PIN_TRAFFIC_GREEN = 2
+    PIN_TRAFFIC_RED = _PIN_TRAFFIC_RED
+    PIN_TRAFFIC_YELLOW = _PIN_TRAFFIC_YELLOW
+    PIN_TRAFFIC_GREEN = _PIN_TRAFFIC_GREEN
     
     # Parking spot sensors
-    PIN_ULTRASONIC_TRIG = 5
-    PIN_ULTRASONIC_ECHO = 18
-    PIN_PARKING_RED = 16
-    PIN_PARKING_GREEN = 33
-    PIN_BUZZER = 17
-    PIN_PARKING_LIGHT = 25
-    PIN_ALARM_LED = 13
+    PIN_ULTRASONIC_TRIG = _PIN_ULTRASONIC_TRIG
+    PIN_ULTRASONIC_ECHO = _PIN_ULTRASONIC_ECHO
+    PIN_PARKING_RED = _PIN_PARKING_RED
+    PIN_PARKING_GREEN = _PIN_PARKING_GREEN
+    PIN_BUZZER = _PIN_BUZZER
+    PIN_PARKING_LIGHT = _PIN_PARKING_LIGHT
+    PIN_ALARM_LED = _PIN_ALARM_LED
     
     # Gas sensor
-    PIN_MQ2 = 34
+    PIN_MQ2 = _PIN_MQ2
+
+    # Timer hardware (ESP32: id 0-3)
+    TIMER_SERVO = _TIMER_SERVO
+    TIMER_GATE_FSM = _TIMER_GATE_FSM
+    TIMER_BUTTON = _TIMER_BUTTON
+    TIMER_BUZZER = _TIMER_BUZZER
     
     # Display settings
     OLED_WIDTH = 128
@@ -92,13 +146,16 @@ class Config:
             value = float(value)
             if param == "mq2_threshold":
                 self.MQ2_THRESHOLD = int(value)
-                print(f"MQ2_THRESHOLD updated to {self.MQ2_THRESHOLD}")
+                if _DEBUG:
+                    print("MQ2_THRESHOLD updated to", self.MQ2_THRESHOLD)
             elif param == "mq2_hyst":
                 self.MQ2_HYSTERESIS = int(value)
-                print(f"MQ2_HYSTERESIS updated to {self.MQ2_HYSTERESIS}")
+                if _DEBUG:
+                    print("MQ2_HYSTERESIS updated to", self.MQ2_HYSTERESIS)
             elif param == "lux_threshold":
                 self.LUX_THRESHOLD = int(value)
-                print(f"LUX_THRESHOLD updated to {self.LUX_THRESHOLD}")
+                if _DEBUG:
+                    print("LUX_THRESHOLD updated to", self.LUX_THRESHOLD)
             return True
         except Exception as e:
             print(f"Error updating {param}: {e}")
@@ -109,7 +166,8 @@ class Config:
         mode = mode.upper().strip()
         if mode in ["AUTO", "ON", "OFF"]:
             self.PARKING_LIGHT_MODE = mode
-            print(f"PARKING_LIGHT_MODE updated to {mode}")
+            if _DEBUG:
+                print("PARKING_LIGHT_MODE updated to", mode)
             return True
         print(f"Invalid light mode: {mode}")
         return False
\ No newline at end of file
@@ -1,8 +1,17 @@
 import machine
-import network
 import time
 import framebuf
 from ssd1306 import SSD1306_I2C
+from micropython import const
+from net.wifi_manager import get_sta
+
+# Granularità dei valori che, cambiando, fanno ridisegnare la schermata principale:
+# gas in passi di ~5% della scala ADC (0-4095), luminosità in passi di 10 lux.
+_GAS_REDRAW_STEP = const(200)
+_LUX_REDRAW_STEP = const(10)
+
+# Chiave della schermata di allarme gas (contenuto fisso).
+_FRAME_GAS_ALARM = const(1)
 
 class OLEDDisplay:
     def __init__(self, sda_pin=21, scl_pin=22, width=128, height=64):
@@ -10,6 +19,10 @@ class OLEDDisplay:
         self.display = SSD1306_I2C(width, height, self.i2c)
         self.width = width
         self.height = height
+
+        # Chiave dell'ultima schermata inviata al display (None = da ridisegnare):
+        # se la nuova schermata ha la stessa chiave, il trasferimento I2C viene saltato.
+        self._frame = None
                 
         # Icona WiFi
         self.WIFI_ICON = bytearray([
@@ -133,6 +146,7 @@ class OLEDDisplay:
 
     def clear(self):
         self.display.fill(0)
+        self._frame = None
         
     def text(self, text, x, y):
         self.display.text(text, x, y)
@@ -148,7 +162,8 @@ class OLEDDisplay:
         except Exception:
             self.display.text("NEXTGARAGE", 25, 20)
         self.show()
-        time.sleep(duration)
+        if duration:
+            time.sleep(duration)
 
     def show_wifi_connecting(self):
         self.clear()
@@ -175,6 +190,16 @@ class OLEDDisplay:
         self.show()
 
     def show_main_screen(self, gate_status, parking_status, gas_level, alarm_active=False, distance=None, lux_level=None):
+        # Nessun campo visibile cambiato dall'ultimo frame: niente ridisegno né invio I2C.
+        # Gas e luminosità contano solo a passi (_GAS_REDRAW_STEP / _LUX_REDRAW_STEP),
+        # così il rumore delle letture non forza un frame al secondo.
+        online = self._is_wifi_connected()
+        frame = (gate_status, parking_status, alarm_active, online, distance,
+                 gas_level // _GAS_REDRAW_STEP,
+                 None if lux_level is None else int(lux_level) // _LUX_REDRAW_STEP)
+        if frame == self._frame:
+            return
+
         self.clear()
         self.display.text("NextGarage", 25, 0)
         self.display.hline(0, 10, 128, 1)
@@ -211,9 +236,10 @@ class OLEDDisplay:
             self.display.text(f"{lux_level:.0f} lx", x_val, y)
         
         self.display.hline(0, 54, 128, 1)
-        status = "Sistema Online" if self._is_wifi_connected() else "Sistema Offline"
+        status = "Sistema Online" if online else "Sistema Offline"
         self.display.text(status, 10, 56)
         self.show()
+        self._frame = frame
 
     def show_parking_assist(self, distance):
         self.clear()
@@ -254,11 +280,15 @@ class OLEDDisplay:
         self.show()
 
     def show_gas_alarm(self, gas_level):
+        # Schermata fissa: ridisegnata solo quando si arriva da un'altra schermata.
+        if self._frame == _FRAME_GAS_ALARM:
+            return
         self.clear()
         fb_icon = framebuf.FrameBuffer(self.ALERT_ICON_LARGE, 48, 48, framebuf.MONO_HLSB)
         self.display.blit(fb_icon, 40, 0) 
         self.display.text("PERICOLO GAS", 15, 54)
         self.show()
+        self._frame = _FRAME_GAS_ALARM
 
     def show_error(self, error_msg):
         self.clear()
@@ -270,7 +300,7 @@ class OLEDDisplay:
     def _is_wifi_connected(self):
         """Ritorna True se la STA WiFi è connessa."""
         try:
-            wlan = network.WLAN(network.STA_IF)
+            wlan = get_sta()
             return wlan.active() and wlan.isconnected()
         except:
             return False
\ No newline at end of file
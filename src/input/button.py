@@ -1,7 +1,19 @@
 # input/button.py
 
 import machine
-import time
+import micropython
+from micropython import const
+from time import ticks_ms, ticks_diff
+
+# Import diretti: ticks_ms()/ticks_diff() risolti con una sola lookup globale
+# invece di passare ogni volta dall'attributo del modulo.
+
+# Soglie di default (ms) per la classificazione delle pressioni in get_press_type().
+_SHORT_MS = const(100)
+_LONG_MS = const(5000)
+
+# Periodo (ms) di campionamento del pin quando poll() è guidato da un timer.
+_SAMPLE_MS = const(6)
 
 
 class Button:
@@ -9,6 +21,7 @@ class Button:
     Classe per la gestione di un pulsante fisico collegato a un GPIO.
     """
 
+
     def __init__(self, pin, pull_up=True, name="Button"):
         """
         Costruttore della classe Button.
@@ -27,44 +40,114 @@ class Button:
         # - pin.value() == 0 → pulsante premuto
         self.pin = machine.Pin(pin, machine.Pin.IN, machine.Pin.PULL_UP)
 
-        # Stato precedente del pulsante (serve per rilevare il fronte di discesa)
-        self.last_state = self.pin.value()
+        # Numero GPIO, conservato per letture dirette dal registro GPIO_IN (es. ServoGate).
+        self.pin_num = pin
+
+        # Metodo bound di lettura del pin, creato una sola volta (usato da poll()).
+        self._read = self.pin.value
+
+        # Storico degli ultimi 8 campioni del pin (bit 0 = più recente), per il debounce:
+        # un fronte è valido solo dopo 7 campioni stabili consecutivi.
+        # Parte sempre da 0xFF (rilasciato stabile): un pulsante già premuto all'avvio
+        # deve superare il debounce come ogni altra pressione, e la sua durata si misura
+        # dal fronte rilevato da poll() (un tocco durante l'init non vale come pressione lunga).
+        self._hist = 0xFF
+
+        # Stato logico (debounced) del pulsante: True = premuto.
+        self._down = False
 
-        # Timestamp di inizio pressione (in millisecondi)
+        # Timestamp (ms) dell'ultimo fronte di pressione (discesa) e di rilascio (salita).
+        self._fell_at = 0
+        self._rose_at = 0
+
+        # Eventi in attesa, consumati da is_pressed() / get_press_type():
+        # - _press_evt: pressione nuova non ancora letta da is_pressed()
+        # - _release_evt: rilascio non ancora valutato da get_press_type()
+        self._press_evt = False
+        self._release_evt = False
+
+        # Timestamp di inizio pressione (in millisecondi) per get_press_type().
         # 0 significa "pulsante non premuto"
         self.press_start = 0
-        
-    def is_pressed(self):
+
+    def start_sampling(self, timer_id, period=_SAMPLE_MS):
         """
-        Verifica se il pulsante è stato appena premuto.
+        Fa girare poll() su un timer hardware periodico invece che dal loop principale.
 
-        Rileva il fronte di discesa:
-        - da 1 (rilasciato)
-        - a 0 (premuto)
+        A cosa serve:
+        - Campionamento a cadenza fissa (default ogni 6 ms): il debounce non dipende più
+          dalla durata del giro del loop (MQTT, display, sensori) e le pressioni brevi
+          non vengono perse.
 
-        Ritorna:
-        - True  → pressione rilevata
-        - False → nessuna nuova pressione
-        """
+        Parametri:
+        - timer_id: id del timer hardware (ESP32: 0-3), non usato da altri moduli.
+        - period: periodo di campionamento in ms.
 
-        # Lettura stato attuale del pin
-        current = self.pin.value()
+        Come funziona:
+        - La callback del timer rimanda poll() con micropython.schedule, usando un
+          riferimento bound pre-allocato (come ServoGate.start_fsm_timer).
+        - is_pressed() / get_press_type() leggono solo i flag e i timestamp scritti da poll().
+        """
+        self._poll_ref = self._poll_scheduled
+        self._sample_timer = machine.Timer(timer_id)
+        self._sample_timer.init(period=period, mode=machine.Timer.PERIODIC, callback=self._on_sample_timer)
+
+    def _on_sample_timer(self, t):
+        """Callback del timer di campionamento: schedula poll(); se la coda è piena salta un campione."""
+        try:
+            micropython.schedule(self._poll_ref, 0)
+        except RuntimeError:
+            pass
+
+    def _poll_scheduled(self, _):
+        """Adattatore per micropython.schedule (che passa un argomento) verso poll()."""
+        self.poll()
+
+    @micropython.native
+    def poll(self):
+        """
+        Campiona il pin e aggiorna il debounce (da chiamare a cadenza regolare, ~6 ms).
+
+        Come funziona:
+        - Inserisce il campione nello storico a 8 bit: hist = ((hist << 1) | pin) & 0xFF.
+        - 0x80 (un 1 seguito da sette 0) = passaggio a "premuto stabile".
+        - 0x7F (uno 0 seguito da sette 1) = passaggio a "rilasciato stabile".
+        - Qualunque altro valore (rimbalzi, stato già stabile) non genera eventi:
+          un solo shift+mask e due confronti per campione.
+        - Compilato con @micropython.native (solo aritmetica intera e confronti).
+        """
+        h = ((self._hist << 1) | self._read()) & 0xFF
+        self._hist = h
+        if h == 0x80:
+            self._down = True
+            self._fell_at = ticks_ms()
+            self._press_evt = True
+        elif h == 0x7F:
+            self._down = False
+            self._rose_at = ticks_ms()
+            self._release_evt = True
+
+    @micropython.viper
+    def is_pressed(self) -> int:
+        """
+        Verifica se il pulsante è stato appena premuto.
 
-        # Caso: pulsante appena premuto (1 → 0)
-        if current == 0 and self.last_state == 1:
-            # Aggiorna lo stato precedente
-            self.last_state = current
-            return True
+        Come funziona:
+        - Il fronte di discesa (1 → 0) è rilevato, già filtrato, da poll().
+        - Qui si legge e si azzera il flag dell'evento: nessuna lettura del pin.
+        - Compilato con @micropython.viper: ritorna un intero nativo (nessun oggetto bool).
 
-        # Caso: pulsante rilasciato
-        elif current == 1:
-            # Aggiorna lo stato precedente
-            self.last_state = current
+        Ritorna:
+        - 1 → pressione rilevata
+        - 0 → nessuna nuova pressione
+        """
+        if self._press_evt:
+            self._press_evt = False
+            return 1
+        return 0
 
-        # Nessun evento di pressione
-        return False
-    
-    def get_press_type(self, short_duration=100, long_duration=5000):
+    @micropython.native
+    def get_press_type(self, short_duration=_SHORT_MS, long_duration=_LONG_MS):
         """
         Determina il tipo di pressione del pulsante.
 
@@ -72,42 +155,37 @@ class Button:
         - short_duration: durata minima (ms) per una pressione breve
         - long_duration: durata minima (ms) per una pressione lunga
 
+        Come funziona:
+        - I timestamp di pressione/rilascio sono registrati da poll() (debounced).
+        - Se il pulsante è tenuto premuto, la durata è misurata da _fell_at a ora.
+        - Se è stato rilasciato, la durata è _rose_at - _fell_at (nessun polling).
+
         Ritorna:
         - "short_press" → pressione breve
         - "long_press"  → pressione lunga
         - "none"        → nessun evento valido
         """
 
-        # Lettura stato attuale del pin
-        current = self.pin.value()
-        
         # === PULSANTE PREMUTO ===
-        if current == 0:
-            # Se è la prima volta che viene premuto
-            if self.press_start == 0:
-                # Salva il tempo di inizio pressione
-                self.press_start = time.ticks_ms()
-            else:
-                # Calcola la durata della pressione
-                duration = time.ticks_diff(time.ticks_ms(), self.press_start)
-
-                # Se supera la soglia di pressione lunga
-                if duration >= long_duration:
-                    return "long_press"
+        if self._down:
+            # Inizio pressione (registrato da poll()).
+            self.press_start = self._fell_at
+            # Se supera la soglia di pressione lunga
+            if ticks_diff(ticks_ms(), self._fell_at) >= long_duration:
+                return "long_press"
+            return "none"
 
         # === PULSANTE RILASCIATO ===
-        else:
-            # Se il pulsante era precedentemente premuto
-            if self.press_start > 0:
-                # Calcola la durata totale della pressione
-                duration = time.ticks_diff(time.ticks_ms(), self.press_start)
-
-                # Reset del timestamp
-                self.press_start = 0
-
-                # Se la durata rientra nel range della pressione breve
-                if duration > short_duration and duration < long_duration:
-                    return "short_press"
-                    
+        if self._release_evt:
+            self._release_evt = False
+            self.press_start = 0
+
+            # Durata totale della pressione misurata tra i due fronti.
+            duration = ticks_diff(self._rose_at, self._fell_at)
+
+            # Se la durata rientra nel range della pressione breve
+            if duration > short_duration and duration < long_duration:
+                return "short_press"
+
         # Nessun evento riconosciuto
         return "none"
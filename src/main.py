@@ -1,10 +1,21 @@
 import machine
+import micropython
 import time
 import gc
 import sys
+from micropython import const
+
+# Segnalazione di errore: frequenza (Hz) e durata (ms) del lampeggio LED, attesa prima del reset (secondi).
+_BLINK_FREQ = const(2)
+_BLINK_MS = const(4000)
+_RESET_DELAY_S = const(5)
 
 def main():
     print("NextGarage - Starting...")
+
+    # Buffer per le eccezioni sollevate dentro gli interrupt (pulsanti, timer):
+    # senza, un errore in un ISR non può essere stampato perché l'ISR non può allocare.
+    micropython.alloc_emergency_exception_buf(100)
     
     # Step-by-step initialization con dettagli errore:
     # L'idea è inizializzare il sistema a "passi", stampando dove si è arrivati.
@@ -37,27 +48,25 @@ def main():
         # Avvia il loop principale del sistema (in genere non ritorna mai, salvo eccezioni/reset).
         parking_system.run()
         
-    except ImportError as e:
-        # Gestione mirata per errori di import:
-        # utile per capire subito quale modulo manca o non è stato caricato correttamente.
-        print(f"IMPORT ERROR: {e}")
-        print(f"   Missing module: {str(e)}")
-        # Stampa stacktrace completo con sys.print_exception (MicroPython-friendly).
-        sys.print_exception(e)
-        
-    except AttributeError as e:
-        # Gestione mirata per errori di attributo:
-        # tipico quando un oggetto non ha un metodo/variabile attesa (refusi o version mismatch).
-        print(f"ATTRIBUTE ERROR: {e}")
-        print(f"   Check class methods and variables")
-        sys.print_exception(e)
-        
     except Exception as e:
-        # Catch-all per qualsiasi altro errore non previsto.
-        # Stampa tipo eccezione + messaggio + stacktrace per debug completo.
-        print(f"FATAL ERROR: {type(e).__name__}")
-        print(f"   Message: {e}")
-        print(f"   Details:")
+        # Un solo handler: la classificazione avviene sul nome del tipo di eccezione.
+        name = type(e).__name__
+        if name == "ImportError":
+            # Errori di import:
+            # utile per capire subito quale modulo manca o non è stato caricato correttamente.
+            print("IMPORT ERROR:", e)
+            print("   Missing module:", e)
+        elif name == "AttributeError":
+            # Errori di attributo:
+            # tipico quando un oggetto non ha un metodo/variabile attesa (refusi o version mismatch).
+            print("ATTRIBUTE ERROR:", e)
+            print("   Check class methods and variables")
+        else:
+            # Qualsiasi altro errore non previsto: tipo eccezione + messaggio.
+            print("FATAL ERROR:", name)
+            print("   Message:", e)
+            print("   Details:")
+        # Stampa stacktrace completo con sys.print_exception (MicroPython-friendly).
         sys.print_exception(e)
         
     finally:
@@ -66,14 +75,13 @@ def main():
         
         # Emergency error indication:
         # Prova a lampeggiare un LED su GPIO2.
+        # Il lampeggio è generato dalla periferica PWM (2 Hz, duty 50%): una sola attesa
+        # invece di un ciclo on/off con 20 sleep.
         # È dentro try/except per evitare crash se il pin non esiste o non è disponibile.
         try:
-            led = machine.Pin(2, machine.Pin.OUT)
-            for _ in range(10):
-                led.on()
-                time.sleep(0.2)
-                led.off()
-                time.sleep(0.2)
+            pwm = machine.PWM(machine.Pin(2, machine.Pin.OUT), freq=_BLINK_FREQ, duty_u16=32768)
+            time.sleep_ms(_BLINK_MS)
+            pwm.deinit()
         except:
             # Se non è possibile usare il LED, ignora (robustezza su diverse board).
             pass
@@ -81,7 +89,7 @@ def main():
         print("System will reset in 5 seconds...")
         
         # Attesa 5 secondi prima del reset: dà tempo di leggere l'errore in seriale.
-        time.sleep(5)
+        time.sleep(_RESET_DELAY_S)
         
         # Reset hardware del microcontrollore.
         machine.reset()
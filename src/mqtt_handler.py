@@ -1,6 +1,110 @@
 from umqtt.simple import MQTTClient as UMQTTClient
-import time
-import json
+from time import ticks_ms, ticks_diff, ticks_add
+# ujson è il modulo JSON nativo (C) di MicroPython; fallback a json se non presente.
+try:
+    import ujson as json
+except ImportError:
+    import json
+import select
+import struct
+import micropython
+from micropython import const
+from net.backoff import backoff_delay
+
+# Log di debug su seriale per i percorsi caldi (ricezione messaggi).
+# Costante di compilazione: con 0 il compilatore elimina del tutto i rami "if _DEBUG:".
+_DEBUG = const(0)
+
+# Porta MQTT standard (usata se config non definisce MQTT_PORT) e keepalive in secondi.
+# Keepalive 30 s: il broker chiude la sessione dopo 45 s senza traffico (la telemetria
+# ha comunque un heartbeat di pochi secondi, vedi _TELEMETRY_HEARTBEAT).
+_DEFAULT_PORT = const(1883)
+_KEEPALIVE = const(30)
+
+# Se la coda di trasmissione resta bloccata (socket mai scrivibile) per questo tempo (ms),
+# il broker è considerato perso: connected=False e il loop avvia la riconnessione con backoff.
+_TX_STALL_TIMEOUT = const(30000)
+
+# Lunghezza massima della coda di trasmissione: a coda piena si scarta il messaggio più vecchio.
+_TX_QUEUE_LEN = const(8)
+
+# Livelli QoS usati dal dispositivo:
+# - QoS 0 ("fire and forget"): nessun PUBACK da attendere. Telemetria e heartbeat:
+#   un campione perso viene sostituito dal successivo.
+# - QoS 1: consegna confermata dal broker. Solo per eventi rari la cui perdita si vede
+#   sulla dashboard (cambio stato del posto, conferme delle soglie).
+#   Nota: umqtt.simple attende il PUBACK dentro publish(), in modo sincrono.
+_QOS_FIRE = const(0)
+_QOS_ACKED = const(1)
+
+# Formattazione del payload per tipo del valore (lookup diretta su type(value)):
+# - numeri => "123" / "12.5"
+# - boolean => "1" o "0" (scelta tipica per sistemi embedded)
+# - dict => JSON
+# - stringhe => invariate
+# Tipi non presenti => conversione a stringa con str().
+# Nota: con type() il caso bool viene davvero riconosciuto (isinstance(True, int) è True,
+# quindi nella vecchia catena di isinstance il ramo bool non veniva mai raggiunto).
+_FORMATTERS = {
+    int: str,
+    float: str,
+    bool: lambda v: "1" if v else "0",
+    dict: json.dumps,
+    str: lambda v: v,
+}
+
+# Interi entro questo modulo sono scritti in ASCII direttamente nel buffer di payload
+# (_format_int): restano small int, quindi nessuna allocazione; oltre, si passa per str().
+_INT_FAST_MAX = const(1000000000)
+
+@micropython.native
+def _format_int(p, v):
+    """Scrive v in decimale ASCII all'inizio del buffer p, senza allocare; ritorna i byte scritti."""
+    n = 0
+    neg = v < 0
+    if neg:
+        v = 0 - v
+    # Cifre dalla meno significativa, poi inversione in place.
+    while True:
+        p[n] = 48 + v % 10
+        v = v // 10
+        n += 1
+        if v == 0:
+            break
+    if neg:
+        p[n] = 45
+        n += 1
+    i = 0
+    j = n - 1
+    while i < j:
+        t = p[i]
+        p[i] = p[j]
+        p[j] = t
+        i += 1
+        j -= 1
+    return n
+
+# Formato binario della telemetria numerica su 'parking/telemetry' (little-endian, 6 byte):
+# distanza in mm (uint16, risoluzione 0.1 cm), livello gas raw ADC (uint16),
+# luminosità lux (uint16, saturata a 65535).
+_TELEMETRY_FMT = "<HHH"
+_TELEMETRY_SIZE = const(6)
+
+# Compressione a delta: la telemetria viene inviata solo se almeno una lettura si è
+# spostata oltre la sua soglia rispetto all'ultimo invio (valori quantizzati)...
+_DIST_DELTA_MM = const(5)
+_GAS_DELTA = const(20)
+_LUX_DELTA = const(5)
+# ...oppure se dall'ultimo invio è passato questo tempo (ms). Deve restare sotto il
+# watchdog di 5 s della dashboard Node-RED, che altrimenti segnala il dispositivo offline.
+_TELEMETRY_HEARTBEAT = const(4000)
+
+# Topic fissi già completi e in bytes (nessun prefisso da aggiungere né encode() da fare).
+# Pubblici: usati anche da SmartParking per i publish diretti.
+TOPIC_TELEMETRY = b"parking/telemetry"
+TOPIC_STATE_GATE = b"parking/state/gate"
+TOPIC_STATE_SPOT = b"parking/state/spot"
+TOPIC_ALARM_GAS = b"parking/alarms/gas"
 
 class MQTTHandler:
     """Gestione MQTT per Smart Parking System"""
@@ -14,14 +118,63 @@ class MQTTHandler:
         
         # Flag di connessione: True se connesso al broker e utilizzabile per publish/subscribe.
         self.connected = False
+
+        # Poller sul socket del client (creato in connect()): check_messages() chiama
+        # check_msg() solo se ci sono dati da leggere.
+        self._poller = None
+
+        # Poller in scrittura (POLLOUT): publish() scrive solo se il buffer TCP ha spazio.
+        # Se il socket non è scrivibile il messaggio va in _tx_queue e viene inviato più tardi
+        # (da check_messages() o dal primo publish con il socket di nuovo scrivibile), senza
+        # mai bloccare il loop principale. Voci (topic, payload, retain, qos), al massimo
+        # _TX_QUEUE_LEN: una per topic, perché su ogni topic conta solo l'ultimo valore.
+        # Lista e non deque: per sostituire la voce di un topic già in coda serve l'indice.
+        self._tx_poller = None
+        self._tx_queue = []
+        # Istante (ticks_ms) in cui la coda è passata da vuota a non vuota (vedi _TX_STALL_TIMEOUT).
+        self._tx_stalled_at = 0
+
+        # Buffer di payload condiviso tra i publish e sua memoryview: i valori interi vengono
+        # scritti qui e inviati come slice, senza creare ogni volta una str e un bytes nuovi.
+        self._payload_buf = bytearray(128)
+        self._mv = memoryview(self._payload_buf)
         
         # Callback esterna opzionale, chiamata quando arriva un messaggio MQTT.
-        # Firma prevista: on_message_callback(topic_str, msg_str)
+        # Firma prevista: on_message_callback(topic_bytes, msg_bytes)
         self.on_message_callback = on_message_callback
         
         # Dizionario di tracking degli ultimi publish effettuati (timestamp in ms).
         # Utile per debug o per implementare logiche anti-spam/rate-limit (se servissero).
         self.last_publish = {}
+
+        # Cache topic relativo (str) -> topic completo già codificato in bytes (b"parking/...").
+        # Evita concatenazione ed encode() ad ogni publish: i topic vengono aggiunti alla
+        # prima pubblicazione. I topic fissi (TOPIC_*) sono già bytes e non passano di qui.
+        self._topic_cache = {}
+
+        # Ultimi valori pubblicati sui topic di stato retained (usato da publish_telemetry):
+        # gli stati vengono ripubblicati solo quando cambiano.
+        self._last_state = {}
+
+        # Ultime letture inviate in telemetria (quantizzate) e istante dell'invio:
+        # usate da publish_telemetry() per saltare i pacchetti senza variazioni.
+        # Interi separati (nessuna tupla allocata ad ogni invio); _tx_valid=False forza l'invio.
+        self._tx_valid = False
+        self._tx_dist = 0
+        self._tx_gas = 0
+        self._tx_lux = 0
+        self._last_tx_at = 0
+
+        # Buffer dedicato al pacchetto di telemetria, lungo esattamente _TELEMETRY_SIZE byte:
+        # struct.pack_into lo riscrive in place ed è passato così com'è a umqtt
+        # (nessuna slice/memoryview né tupla di argomenti).
+        self._telem_buf = bytearray(_TELEMETRY_SIZE)
+
+        # Riconnessione con backoff esponenziale (vedi reconnect()):
+        # - _reconnect_attempt: tentativi di connessione falliti consecutivi
+        # - _next_retry_ms: istante (ticks_ms) da cui è consentito il prossimo tentativo
+        self._reconnect_attempt = 0
+        self._next_retry_ms = ticks_ms()
         
     def connect(self):
         """Connessione al broker MQTT"""
@@ -29,14 +182,15 @@ class MQTTHandler:
             # Determina broker e porta:
             # - se config contiene MQTT_BROKER/MQTT_PORT usa quelli
             # - altrimenti usa HiveMQ pubblico e porta standard 1883
-            broker = self.config.MQTT_BROKER if hasattr(self.config, 'MQTT_BROKER') else "broker.hivemq.com"
-            port = self.config.MQTT_PORT if hasattr(self.config, 'MQTT_PORT') else 1883
+            # getattr con default: una sola lookup invece di hasattr + accesso.
+            broker = getattr(self.config, 'MQTT_BROKER', "broker.hivemq.com")
+            port = getattr(self.config, 'MQTT_PORT', _DEFAULT_PORT)
             
             # Crea il client MQTT (umqtt.simple) con:
             # - client_id fisso (identifica il dispositivo sul broker)
             # - server/port del broker
-            # - keepalive=60 (ping periodico per mantenere la sessione attiva)
-            self.client = UMQTTClient(client_id="nextgarage-esp32", server=broker, port=port, keepalive=60)
+            # - keepalive=_KEEPALIVE (30 s, durata massima di silenzio dichiarata al broker)
+            self.client = UMQTTClient(client_id="nextgarage-esp32", server=broker, port=port, keepalive=_KEEPALIVE)
             
             # Imposta la callback interna che verrà chiamata dal client quando arrivano messaggi.
             # Questa callback poi inoltra i messaggi a on_message_callback (se definita).
@@ -45,7 +199,25 @@ class MQTTHandler:
             # Connessione al broker
             self.client.connect()
             self.connected = True
-            print(f"MQTT connected to {broker}:{port}")
+
+            # Registra il socket MQTT su un poller: poll(0) è una sola chiamata non bloccante,
+            # molto più leggera di un tentativo completo di lettura/parsing di check_msg().
+            self._poller = select.poll()
+            self._poller.register(self.client.sock, select.POLLIN)
+            self._tx_poller = select.poll()
+            self._tx_poller.register(self.client.sock, select.POLLOUT)
+
+            # Connessione riuscita: il backoff riparte dal primo gradino.
+            self._reconnect_attempt = 0
+
+            # Messaggi rimasti in coda dalla sessione precedente: ormai obsoleti.
+            self._tx_queue.clear()
+
+            # Nuova sessione: al primo giro di telemetria gli stati retained vengono ripubblicati
+            # e la telemetria numerica viene inviata comunque.
+            self._last_state = {}
+            self._tx_valid = False
+            print("MQTT connected to ", broker, ":", port, sep="")
             
             # Sottoscrive i topic necessari (comandi e configurazioni).
             self._subscribe_topics()
@@ -56,135 +228,261 @@ class MQTTHandler:
             # In caso di errore:
             # - log su seriale
             # - set connected=False per impedire publish successivi
-            print(f"MQTT connection failed: {e}")
+            # - prossimo tentativo ammesso solo dopo il ritardo di backoff
+            print("MQTT connection failed:", e)
             self.connected = False
+            delay = backoff_delay(self._reconnect_attempt)
+            self._reconnect_attempt += 1
+            self._next_retry_ms = ticks_add(ticks_ms(), delay)
+            print("MQTT retry in", delay, "ms")
             return False
     
     def _subscribe_topics(self):
         """Subscribe ai topic necessari"""
         # Lista dei topic da sottoscrivere in forma bytes (richiesto da umqtt.simple).
-        # 'parking/cmd/#' cattura tutti i sotto-topic dei comandi.
-        # 'parking/cfg/#' cattura tutti i sotto-topic delle configurazioni.
+        # Filtri espliciti invece di wildcard '#': il broker consegna solo ciò che il
+        # dispositivo gestisce.
+        # - comandi: i quattro topic esatti di parking/cmd/
+        # - 'parking/cfg/+' (un solo livello): le soglie, ma non le conferme
+        #   'parking/cfg/<param>/confirm' pubblicate dal dispositivo stesso.
         topics = [
-            b"parking/cmd/#",           # Comandi
-            b"parking/cfg/#"              # Configurazioni
+            b"parking/cmd/open_gate",           # Comandi
+            b"parking/cmd/close_gate",
+            b"parking/cmd/parking_light_mode",
+            b"parking/cmd/reset_config",
+            b"parking/cfg/+"                    # Configurazioni
         ]
         
         # Esegue subscribe per ogni topic; eventuali errori vengono loggati ma non bloccano il sistema.
         for topic in topics:
             try:
                 self.client.subscribe(topic)
-                print(f"Subscribed to {topic.decode()}")
+                print("Subscribed to", topic.decode())
             except Exception as e:
-                print(f"Subscribe failed for {topic.decode()}: {e}")
+                print("Subscribe failed for ", topic.decode(), ": ", e, sep="")
     
     def _on_message(self, topic, msg):
         """Callback per messaggi ricevuti"""
         try:
-            # umqtt.simple fornisce topic e msg come bytes: decodifica in stringhe.
-            topic_str = topic.decode()
-            msg_str = msg.decode()
-            
+            # umqtt.simple fornisce topic e msg come bytes: vengono inoltrati così come sono,
+            # senza decode() (due str nuove per messaggio). Il livello applicativo confronta
+            # i topic in bytes e decodifica il payload solo dove serve il testo.
             # Log ricezione (utile per debug e tracciamento integrazione dashboard).
-            print(f"MQTT RX: {topic_str} = {msg_str}")
+            # Solo con _DEBUG attivo: la print su UART costa millisecondi per messaggio.
+            if _DEBUG:
+                print("MQTT RX:", topic.decode(), "=", msg.decode())
             
             # Se è stato fornito un callback esterno, inoltra il messaggio al livello applicativo.
             if self.on_message_callback:
-                self.on_message_callback(topic_str, msg_str)
+                self.on_message_callback(topic, msg)
                 
         except Exception as e:
             # Protezione: un errore di decode/parsing/callback non deve rompere la ricezione.
-            print(f"Error processing message: {e}")
+            if _DEBUG:
+                print("Error processing message:", e)
     
-    def publish(self, topic, value, retain=False):
+    def _full_topic(self, topic):
+        """Topic completo in bytes dalla cache (la prima volta lo costruisce e lo memorizza)"""
+        # Un topic bytes è già completo (es. TOPIC_STATE_SPOT): usato così com'è.
+        if type(topic) is bytes:
+            return topic
+        # NOTA: a un topic str aggiunge sempre prefisso "parking/".
+        # Esempio: topic="state/gate" -> b"parking/state/gate"
+        full_topic = self._topic_cache.get(topic)
+        if full_topic is None:
+            full_topic = ("parking/" + topic).encode()
+            self._topic_cache[topic] = full_topic
+        return full_topic
+
+    def publish(self, topic, value, retain=False, qos=_QOS_FIRE):
         """Pubblica un messaggio"""
         # Se non connesso, evita di tentare publish (fallirebbe).
         if not self.connected:
             return False
             
         try:
-            # Costruisce il topic completo pubblicato:
-            # NOTA: aggiunge sempre prefisso "parking/" al topic passato in input.
-            # Esempio: topic="state/gate" -> full_topic="parking/state/gate"
-            full_topic = f"parking/{topic}"
+            # Topic completo pubblicato (già in bytes: costante TOPIC_* o dalla cache).
+            full_topic = self._full_topic(topic)
             
-            # Costruisce il payload stringa in base al tipo del value:
-            # - numeri => "123" / "12.5"
-            # - boolean => "1" o "0" (scelta tipica per sistemi embedded)
-            # - dict => JSON
-            # - altro => conversione a stringa
-            if isinstance(value, (int, float)):
-                payload = str(value)
-            elif isinstance(value, bool):
-                payload = "1" if value else "0"
-            elif isinstance(value, dict):
-                payload = json.dumps(value)
+            # Costruisce il payload:
+            # - interi: cifre ASCII scritte nel buffer condiviso (slice della memoryview);
+            # - bytes: già pronti (es. payload ricevuto e ripubblicato come conferma);
+            # - altri tipi: stringa in base al tipo (vedi _FORMATTERS), poi encode().
+            #   Una lookup nel dizionario invece di una catena di isinstance.
+            if type(value) is int and -_INT_FAST_MAX < value < _INT_FAST_MAX:
+                payload = self._mv[:_format_int(self._payload_buf, value)]
+            elif type(value) is bytes:
+                payload = value
             else:
-                payload = str(value)
-            
-            # Pubblica su broker:
-            # - encode() necessario perché umqtt.simple usa bytes.
-            # - retain permette al broker di conservare l'ultimo valore per nuovi subscriber.
-            self.client.publish(full_topic.encode(), payload.encode(), retain=retain)
-            
-            # Salva timestamp dell'ultimo publish per quel topic "relativo" (senza prefisso parking/).
-            self.last_publish[topic] = time.ticks_ms()
-            return True
-            
+                payload = _FORMATTERS.get(type(value), str)(value).encode()
+
+            return self._send(topic, full_topic, payload, retain, qos)
+
         except Exception as e:
             # Se publish fallisce, marca la connessione come non valida:
             # spesso indica broker disconnesso o errore rete.
-            print(f"Publish failed: {e}")
+            print("Publish failed:", e)
             self.connected = False
             return False
+
+    def _send(self, topic, full_topic, payload, retain, qos):
+        """
+        Invia (o accoda se il socket non è scrivibile) un payload già pronto.
+
+        Ritorna:
+        - True se il messaggio è stato inviato o accodato: in entrambi i casi è accettato
+          e i chiamanti aggiornano le loro cache (stati retained, ultima telemetria).
+          Un errore del socket arriva come eccezione, gestita dal chiamante.
+        """
+        q = self._tx_queue
+        # Messaggi già in coda: partono prima loro, finché il socket resta scrivibile
+        # (l'ordine di invio resta quello dei publish).
+        if q:
+            self._flush_tx()
+
+        # Buffer di trasmissione pieno: invece di restare bloccati nella write,
+        # accoda il messaggio (verrà inviato da check_messages()).
+        if q or not self._tx_poller.poll(0):
+            self._enqueue(full_topic, payload, retain, qos)
+            return True
+
+        # Pubblica su broker:
+        # - umqtt.simple scrive topic e payload come buffer (bytes o memoryview).
+        # - retain permette al broker di conservare l'ultimo valore per nuovi subscriber.
+        # - qos: 0 per telemetria, 1 solo per gli eventi confermati (vedi _QOS_ACKED).
+        self.client.publish(full_topic, payload, retain, qos)
+        
+        # Salva timestamp dell'ultimo publish per quel topic "relativo" (senza prefisso parking/).
+        self.last_publish[topic] = ticks_ms()
+        return True
+
+    def _enqueue(self, full_topic, payload, retain, qos):
+        """Accoda un messaggio: sostituisce quello già in coda sullo stesso topic"""
+        q = self._tx_queue
+        if not q:
+            self._tx_stalled_at = ticks_ms()
+        # In coda va sempre una copia: il buffer condiviso sarà riscritto dal prossimo publish.
+        entry = (full_topic, bytes(payload), retain, qos)
+        # Stesso topic già in coda (stato, conferma, telemetria): il valore vecchio è superato.
+        # La voce mantiene il suo posto, così la coda non si riempie di duplicati durante uno
+        # stallo e le conferme in coda non vengono scartate per far posto alle ripetizioni.
+        for i in range(len(q)):
+            if q[i][0] == full_topic:
+                q[i] = entry
+                return
+        if len(q) >= _TX_QUEUE_LEN:
+            q.pop(0)
+        q.append(entry)
+
+    def _flush_tx(self):
+        """Invia i messaggi in coda finché il socket resta scrivibile"""
+        # Ogni invio riuscito riazzera il conteggio di stallo (vedi check_messages()).
+        q = self._tx_queue
+        while q and self._tx_poller.poll(0):
+            t, p, r, qos = q.pop(0)
+            self.client.publish(t, p, r, qos)
+            self._tx_stalled_at = ticks_ms()
     
     def publish_telemetry(self, data):
-        """Pubblica telemetria completa"""
-        # Pubblica un set di variabili di telemetria su topic differenti.
-        # Ogni chiave è opzionale: controlla la presenza nel dict 'data'.
-        
-        # Stato cancello
+        """
+        Pubblica la telemetria in un unico messaggio binario.
+
+        A cosa serve:
+        - Un solo pacchetto per ciclo su 'parking/telemetry' invece di un publish per
+          ogni variabile (meno segmenti TCP e meno byte di topic sul filo).
+
+        Come funziona:
+        - I valori numerici (distance, gas_level, light) vengono quantizzati a interi e
+          impacchettati in 6 byte secondo _TELEMETRY_FMT (non retained), senza testo.
+        - Il pacchetto viene saltato se nessuna lettura è cambiata oltre la sua soglia
+          (_*_DELTA) e non è ancora scaduto l'heartbeat (_TELEMETRY_HEARTBEAT).
+        - Gli stati retained (sbarra, posto, allarme gas) restano testuali sui loro topic
+          dedicati, ma vengono pubblicati solo quando il valore cambia rispetto all'ultimo inviato.
+        """
+        # Quantizzazione delle letture numeriche (valori mancanti => 0).
+        dist_mm = max(0, int(data.get('distance', 0) * 10 + 0.5))
+        gas = int(data.get('gas_level', 0))
+        lux = min(int(data.get('light', 0)), 65535)
+
+        # Messaggio unico con le letture numeriche, solo se cambiate o per heartbeat.
+        ok = True
+        now = ticks_ms()
+        if (not self._tx_valid
+                or abs(dist_mm - self._tx_dist) >= _DIST_DELTA_MM
+                or abs(gas - self._tx_gas) >= _GAS_DELTA
+                or abs(lux - self._tx_lux) >= _LUX_DELTA
+                or ticks_diff(now, self._last_tx_at) >= _TELEMETRY_HEARTBEAT):
+            ok = self._publish_telemetry_packet(dist_mm, gas, lux)
+            if ok:
+                self._tx_valid = True
+                self._tx_dist = dist_mm
+                self._tx_gas = gas
+                self._tx_lux = lux
+                self._last_tx_at = now
+
+        # Stato cancello: solo su cambiamento.
         if 'gate_state' in data:
-            # retain=True per mantenere l'ultimo stato sbarra sulla dashboard.
-            self.publish('state/gate', data['gate_state'], retain=True)
-        
-        # Stato posto auto
+            self._publish_state(TOPIC_STATE_GATE, data['gate_state'])
+
+        # Stato posto auto (testo leggibile per la dashboard): solo su cambiamento.
         if 'spot_occupied' in data:
-            # Converte booleano in stringa leggibile per interfacce (Node-RED/dashboard).
-            spot_text = "OCCUPATO" if data['spot_occupied'] else "LIBERO"
-            self.publish('state/spot', spot_text, retain=True)
-        
-        # Distanza ultrasuoni
-        if 'distance' in data:
-            # In genere non retained: è un valore “stream” che cambia spesso.
-            self.publish('ultrasonic/distance', data['distance'])
-        
-        # Luminosità
-        if 'light' in data:
-            self.publish('env/light', data['light'])
-        
-        # Allarme gas
+            # QoS 1: la transizione OCCUPATO/LIBERO è l'evento principale della dashboard.
+            self._publish_state(TOPIC_STATE_SPOT, "OCCUPATO" if data['spot_occupied'] else "LIBERO", _QOS_ACKED)
+
+        # Allarme gas: solo su cambiamento.
         if 'gas_alarm' in data:
-            # Converte booleano in testo di stato.
-            gas_text = "ALLARME!" if data['gas_alarm'] else "OK"
-            self.publish('alarms/gas', gas_text, retain=True)
-        
-        # Livello gas
-        if 'gas_level' in data:
-            self.publish('sensors/gas', data['gas_level'])
-    
+            self._publish_state(TOPIC_ALARM_GAS, "ALLARME!" if data['gas_alarm'] else "OK")
+
+        return ok
+
+    def _publish_telemetry_packet(self, dist_mm, gas, lux):
+        """Impacchetta le tre letture nel buffer di telemetria e lo pubblica"""
+        if not self.connected:
+            return False
+
+        try:
+            struct.pack_into(_TELEMETRY_FMT, self._telem_buf, 0, dist_mm, gas, lux)
+            return self._send(TOPIC_TELEMETRY, TOPIC_TELEMETRY, self._telem_buf, False, _QOS_FIRE)
+
+        except Exception as e:
+            print("Publish failed:", e)
+            self.connected = False
+            return False
+
+    def _publish_state(self, topic, value, qos=_QOS_FIRE):
+        """Pubblica un topic di stato retained solo se il valore è cambiato"""
+        if self._last_state.get(topic) == value:
+            return
+        # Memorizza il valore solo se il publish è stato accettato (inviato o accodato),
+        # così in caso di errore verrà ritentato al giro successivo.
+        if self.publish(topic, value, True, qos):
+            self._last_state[topic] = value
+
     def check_messages(self):
         """Controlla messaggi in arrivo (non bloccante)"""
         # check_msg() di umqtt.simple controlla se c'è un messaggio disponibile e,
         # in caso positivo, invoca la callback impostata con set_callback().
-        # È non bloccante: se non ci sono messaggi, ritorna subito.
+        # Viene chiamato solo se il poller segnala il socket leggibile:
+        # se non ci sono dati, poll(0) ritorna subito una lista vuota.
+        # Prima invia gli eventuali messaggi in coda finché il socket resta scrivibile.
+        # Ogni invio riuscito riazzera il conteggio di stallo; se invece la coda non si
+        # svuota per _TX_STALL_TIMEOUT ms (broker o rete spariti senza errori sul socket),
+        # la connessione viene dichiarata persa: publish() non resta a riempire la coda.
         if self.connected:
             try:
-                self.client.check_msg()
+                q = self._tx_queue
+                if q:
+                    self._flush_tx()
+                    if q and ticks_diff(ticks_ms(), self._tx_stalled_at) >= _TX_STALL_TIMEOUT:
+                        print("MQTT TX stalled, broker lost")
+                        self.connected = False
+                        return False
+                if self._poller.poll(0):
+                    self.client.check_msg()
                 return True
             except Exception as e:
                 # In caso di errore, marca la connessione come persa.
-                print(f"Check messages failed: {e}")
+                print("Check messages failed:", e)
                 self.connected = False
                 return False
         return False
@@ -201,11 +499,19 @@ class MQTTHandler:
             self.connected = False
     
     def reconnect(self):
-        """Tentativo di riconnessione"""
-        # Strategia semplice:
-        # 1) disconnette (se necessario)
-        # 2) attende 2 secondi (backoff base)
-        # 3) ritenta connect()
+        """Tentativo di riconnessione (non bloccante, con backoff)"""
+        # Da chiamare periodicamente dal loop quando connected è False:
+        # 1) se il ritardo di backoff non è ancora scaduto, ritorna subito
+        # 2) chiude il socket della sessione precedente (se presente)
+        # 3) ritenta connect(), che in caso di errore fissa il prossimo ritardo
+        # Il primo tentativo dopo una caduta è immediato (contatore azzerato dall'ultima
+        # connessione riuscita); quelli successivi aspettano 100 ms, 200 ms, ... fino a 30 s.
+        if self._reconnect_attempt and ticks_diff(ticks_ms(), self._next_retry_ms) < 0:
+            return False
         self.disconnect()
-        time.sleep(2)
+        if self.client:
+            try:
+                self.client.sock.close()
+            except:
+                pass
         return self.connect()
\ No newline at end of file
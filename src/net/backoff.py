@@ -0,0 +1,36 @@
+# net/backoff.py
+
+from micropython import const
+from random import getrandbits
+
+# Ritardo del primo tentativo ripetuto e ritardo massimo (ms) tra due tentativi.
+_BASE_MS = const(100)
+_MAX_MS = const(30000)
+
+# Oltre questo numero di tentativi _BASE_MS << attempt supera comunque _MAX_MS.
+_MAX_SHIFT = const(9)
+
+
+def backoff_delay(attempt):
+    """
+    Calcola l'attesa (ms) prima del prossimo tentativo di connessione.
+
+    A cosa serve:
+    - Evitare che, con broker o access point irraggiungibili, il dispositivo ritenti
+      di continuo (carico di rete e consumo inutili).
+
+    Come funziona:
+    - Backoff esponenziale: min(_MAX_MS, _BASE_MS * 2^attempt).
+    - Jitter ±25%: dispositivi ripartiti insieme (es. dopo un riavvio del broker)
+      non ritentano tutti nello stesso istante.
+
+    Parametri:
+    - attempt: numero di tentativi falliti consecutivi (0 = primo fallimento)
+
+    Ritorna:
+    - ritardo in millisecondi (intero)
+    """
+    delay = _MAX_MS if attempt >= _MAX_SHIFT else min(_MAX_MS, _BASE_MS << attempt)
+
+    # getrandbits(8) - 128 è in [-128, 127]: scostamento in [-25%, +25%) del ritardo.
+    return delay + (delay >> 2) * (getrandbits(8) - 128) // 128
@@ -1,7 +1,42 @@
 # net/wifi_manager.py
 
 import network
-import time
+from micropython import const
+from time import ticks_ms, ticks_diff, ticks_add
+from net.backoff import backoff_delay
+
+# Stati della connessione (gestita a macchina a stati, senza attese bloccanti).
+_STATE_DISCONNECTED = const(0)
+_STATE_CONNECTING = const(1)
+_STATE_CONNECTED = const(2)
+_STATE_ERROR = const(3)
+
+# Tempo massimo (ms) concesso all'associazione prima di dichiarare errore.
+# Gli errori definitivi (password errata, rete assente) vengono rilevati prima, da status().
+_CONNECT_TIMEOUT = const(10000)
+
+# Esiti di wlan.status() che chiudono subito il tentativo, senza attendere il timeout.
+# Costruita all'import con i soli STAT_* definiti dal port in uso.
+_FAIL_STATUSES = tuple(getattr(network, name) for name in
+                       ("STAT_WRONG_PASSWORD", "STAT_NO_AP_FOUND", "STAT_CONNECT_FAIL")
+                       if hasattr(network, name))
+
+# Interfaccia Station condivisa da tutto il firmware (creata alla prima richiesta).
+_STA = None
+
+
+def get_sta():
+    """
+    Ritorna l'unica istanza di network.WLAN(network.STA_IF).
+
+    A cosa serve:
+    - WiFiManager e il display (indicatore "Online") usano lo stesso oggetto,
+      invece di crearne uno nuovo ad ogni controllo.
+    """
+    global _STA
+    if _STA is None:
+        _STA = network.WLAN(network.STA_IF)
+    return _STA
 
 
 class WiFiManager:
@@ -9,64 +44,142 @@ class WiFiManager:
     Classe che gestisce la connessione WiFi in modalità Station (STA).
 
     Incapsula:
-    - connessione alla rete WiFi
+    - connessione alla rete WiFi (non bloccante: connect() avvia, poll() fa avanzare)
+    - attesa con backoff esponenziale tra tentativi falliti (retry_due())
     - disconnessione
     - verifica dello stato di connessione
     """
 
-    def __init__(self, ssid, password):
+    # Stati pubblici (valori delle costanti di modulo).
+    STATE_DISCONNECTED = _STATE_DISCONNECTED
+    STATE_CONNECTING = _STATE_CONNECTING
+    STATE_CONNECTED = _STATE_CONNECTED
+    STATE_ERROR = _STATE_ERROR
+
+    def __init__(self, ssid, password, timeout_ms=_CONNECT_TIMEOUT):
         """
         Costruttore della classe WiFiManager.
 
         Parametri:
         - ssid: nome della rete WiFi
         - password: password della rete WiFi
+        - timeout_ms: tempo massimo per l'associazione, in millisecondi
         """
 
         # Salva SSID e password
         self.ssid = ssid
         self.password = password
+        self.timeout_ms = timeout_ms
+
+        # Interfaccia WiFi in modalità Station (istanza condivisa, vedi get_sta())
+        self.wlan = get_sta()
 
-        # Inizializza l'interfaccia WiFi in modalità Station
-        self.wlan = network.WLAN(network.STA_IF)
+        # Stato corrente e istante (ms) di avvio dell'ultimo tentativo di connessione.
+        self.state = _STATE_DISCONNECTED
+        self._started_at = 0
+
+        # Backoff tra tentativi falliti: numero di timeout consecutivi e istante (ticks_ms)
+        # da cui retry_due() consente un nuovo tentativo.
+        self._attempt = 0
+        self._next_retry_ms = ticks_ms()
         
     def connect(self):
         """
-        Connette il dispositivo alla rete WiFi configurata.
+        Avvia la connessione alla rete WiFi configurata, senza attenderla.
+
+        Come funziona:
+        - Attiva l'interfaccia e chiama wlan.connect(), poi ritorna subito.
+        - L'esito viene rilevato da poll(), da chiamare periodicamente dal loop.
 
         Ritorna:
-        - True  → connessione riuscita o già attiva
-        - False → connessione fallita
+        - True  → già connesso
+        - False → connessione avviata (stato CONNECTING)
+        """
+
+        # Se il dispositivo è già connesso non c'è nulla da fare
+        if self.wlan.isconnected():
+            self.state = _STATE_CONNECTED
+            return True
+
+        print(f"Connecting to {self.ssid}...")
+
+        # Attiva l'interfaccia WiFi
+        self.wlan.active(True)
+
+        # Disattiva il risparmio energetico della radio: in power-save il modem dorme tra
+        # i beacon e i messaggi MQTT in arrivo aspettano il risveglio (latenza di ricezione).
+        # PM_NONE non esiste su tutti i port/versioni: in quel caso resta l'impostazione di default.
+        pm_none = getattr(network.WLAN, "PM_NONE", None)
+        if pm_none is not None:
+            try:
+                self.wlan.config(pm=pm_none)
+            except (ValueError, OSError):
+                pass
+
+        # Avvia la connessione alla rete WiFi (l'associazione procede in background).
+        # Se il driver ha già un'associazione in corso (es. riconnessione automatica)
+        # può rifiutare la richiesta: in quel caso si continua ad attendere quella.
+        try:
+            self.wlan.connect(self.ssid, self.password)
+        except OSError as e:
+            print(f"WiFi connect error: {e}")
+
+        self.state = _STATE_CONNECTING
+        self._started_at = ticks_ms()
+        return False
+
+    def poll(self):
         """
+        Fa avanzare la macchina a stati della connessione (non bloccante).
 
-        # Controlla se il dispositivo NON è già connesso
-        if not self.wlan.isconnected():
-            print(f"Connecting to {self.ssid}...")
+        Come funziona:
+        - CONNECTING: se associato passa a CONNECTED; passa a ERROR se status() riporta
+          un errore definitivo (password errata, rete assente) o se scade il timeout.
+        - CONNECTED: se il collegamento cade torna a DISCONNECTED.
 
-            # Attiva l'interfaccia WiFi
-            self.wlan.active(True)
+        Ritorna:
+        - lo stato corrente (STATE_*)
+        """
 
-            # Avvia la connessione alla rete WiFi
-            self.wlan.connect(self.ssid, self.password)
-            
-            # Attende la connessione (max 10 secondi)
-            for _ in range(10):
-                # Se la connessione è stabilita
-                if self.wlan.isconnected():
-                    # Stampa l'indirizzo IP assegnato
-                    print(f"Connected! IP: {self.wlan.ifconfig()[0]}")
-                    return True
-
-                # Attende 1 secondo prima di ricontrollare
-                time.sleep(1)
-                
-            # Se dopo il timeout non è connesso
-            print("Connection failed")
-            return False
-
-        # Se era già connesso, ritorna True
-        return True
+        state = self.state
+        if state == _STATE_CONNECTING:
+            if self.wlan.isconnected():
+                # Stampa l'indirizzo IP assegnato
+                print(f"Connected! IP: {self.wlan.ifconfig()[0]}")
+                try:
+                    print("RSSI:", self.wlan.status("rssi"), "dBm")
+                except (ValueError, OSError):
+                    pass
+                self.state = _STATE_CONNECTED
+                self._attempt = 0
+            elif (self.wlan.status() in _FAIL_STATUSES
+                    or ticks_diff(ticks_ms(), self._started_at) >= self.timeout_ms):
+                # Se fallisce o dopo il timeout non è connesso: errore e attesa prima di ritentare.
+                print("Connection failed, status:", self.wlan.status())
+                self.state = _STATE_ERROR
+                self._next_retry_ms = ticks_add(ticks_ms(), backoff_delay(self._attempt))
+                self._attempt += 1
+        elif state == _STATE_CONNECTED:
+            if not self.wlan.isconnected():
+                print("WiFi connection lost")
+                self.state = _STATE_DISCONNECTED
+        return self.state
     
+    def retry_due(self):
+        """
+        Verifica se è trascorso il ritardo di backoff dall'ultimo tentativo fallito.
+
+        Dopo una caduta del collegamento (nessun tentativo fallito) ritorna subito True:
+        il confronto tra ticks vale solo per attese brevi (max 30 s), non per un istante
+        fissato giorni prima.
+
+        Ritorna:
+        - True  → si può chiamare connect()
+        - False → attendere ancora
+        """
+
+        return self._attempt == 0 or ticks_diff(ticks_ms(), self._next_retry_ms) >= 0
+
     def disconnect(self):
         """
         Disconnette il dispositivo dalla rete WiFi.
@@ -76,6 +189,7 @@ class WiFiManager:
         """
 
         self.wlan.disconnect()
+        self.state = _STATE_DISCONNECTED
         
     def is_connected(self):
         """
@@ -1,7 +1,11 @@
 import time
+import gc
 import machine
-import network
+import micropython
+from array import array
+from micropython import const
 from config import Config
+from net.wifi_manager import WiFiManager
 from sensors.ir_sensor import IRSensor
 from sensors.ultrasonic import UltrasonicSensor
 from sensors.mq2 import MQ2Sensor
@@ -11,17 +15,80 @@ from actuators.traffic_light import TrafficLight
 from actuators.parking_leds import ParkingLeds
 from actuators.buzzer import Buzzer
 from actuators.parking_light import ParkingLight
+from actuators.gpio import gpio_write, write_masks
 from input.button import Button
 from display.oled_display import OLEDDisplay
-from mqtt_handler import MQTTHandler
+
+# Log di debug su seriale per i percorsi caldi (ricezione messaggi, logica del posto auto).
+# Costante di compilazione: con 0 il compilatore elimina del tutto i rami "if _DEBUG:"
+# (come in mqtt_handler: una const importata da un altro modulo non verrebbe eliminata).
+_DEBUG = const(0)
+
+# Stato generale del sistema (SmartParking.state): interi invece di stringhe.
+_STATE_INIT = const(0)
+_STATE_READY = const(1)
+_STATE_RUNNING = const(2)
+
+# Parti fisse dei topic MQTT ricevuti (bytes, come arrivano da umqtt):
+# endswith()/startswith() sui bytes confrontano in place, senza creare slice né str.
+_CONFIRM_SUFFIX = b"/confirm"
+_CFG_PREFIX = b"parking/cfg/"
+_CFG_PREFIX_LEN = const(12)
+
+# Soglie ripristinate dal comando reset_config: (attributo di Config, campo del riepilogo, valore).
+_RESET_DEFAULTS = (
+    ("MQ2_THRESHOLD", "mq2_threshold", 1500),
+    ("MQ2_HYSTERESIS", "mq2_hyst", 100),
+    ("LUX_THRESHOLD", "lux_threshold", 50),
+)
+
+# Riepilogo del reset (JSON) costruito una volta all'import dagli stessi valori e già in bytes:
+# ad ogni reset viene pubblicato così com'è, senza dict né json.dumps nella callback MQTT.
+_TOPIC_RESET_ACK = b"parking/cfg/reset_ack"
+_RESET_ACK = ("{" + ", ".join('"%s": %d' % (k, v) for _, k, v in _RESET_DEFAULTS) + "}").encode()
+
+# Periodi (ms) dei task periodici del loop principale (vedi run()).
+_MQTT_POLL_MS = const(100)
+_WIFI_CHECK_MS = const(200)
+_DIST_CHECK_MS = const(200)
+_GAS_CHECK_MS = const(500)
+_LIGHT_CHECK_MS = const(1000)
+_DISPLAY_MS = const(1000)
+
+# Frequenze (Hz) del buzzer in assistenza parcheggio: stop, vicino, lontano.
+_BUZZ_STOP_HZ = const(2000)
+_BUZZ_NEAR_HZ = const(1500)
+_BUZZ_FAR_HZ = const(800)
+
+# Tolleranze anti-flapping sulla distanza (decimi di cm):
+# - _STOP_TOL_Q: soglia di stop allargata di 1 cm mentre si conta la conferma occupazione.
+# - _FREE_TOL_Q: per liberare il posto la distanza deve superare MAX di 2 cm.
+_STOP_TOL_Q = const(10)
+_FREE_TOL_Q = const(20)
+
+# Isteresi (lux) della luce parcheggio in AUTO: accende sotto LUX_THRESHOLD,
+# spegne solo sopra LUX_THRESHOLD + _LUX_HYSTERESIS (come l'isteresi del gas).
+_LUX_HYSTERESIS = const(10)
+
+# Sleep massimo (ms) del loop a sbarra ferma tra due giri: è anche il ritardo massimo con
+# cui un cambio di stato della sbarra (FSM sul timer) arriva alla telemetria.
+_LOOP_MAX_SLEEP_MS = const(20)
+
+# Tempo (ms) per cui resta visibile la schermata di reset prima di machine.reset().
+_RESET_SCREEN_MS = const(2000)
 
 class SmartParking:
+    # Stati pubblici (valori delle costanti di modulo).
+    STATE_INIT = _STATE_INIT
+    STATE_READY = _STATE_READY
+    STATE_RUNNING = _STATE_RUNNING
+
     def __init__(self, config):
         # Salva la configurazione (pin, soglie, parametri MQTT, ecc.).
         self.config = config
 
-        # Stato generale del sistema (stringa descrittiva: INIT, READY, RUNNING, ...).
-        self.state = "INIT"
+        # Stato generale del sistema (_STATE_INIT, _STATE_READY, _STATE_RUNNING).
+        self.state = _STATE_INIT
 
         # Flag di stato applicativo:
         # - car_parked: True se il posto è considerato occupato (auto parcheggiata).
@@ -31,28 +98,86 @@ class SmartParking:
         self.gas_alarm = False
         self.parking_assist = False
 
+        # Telemetria "sporca": un evento (posto, allarme gas, stato sbarra) è cambiato e va
+        # pubblicato subito, senza attendere il prossimo heartbeat (MQTT_TELEMETRY_INTERVAL).
+        self._telemetry_dirty = False
+
+        # Scadenza (ticks_ms) del riavvio richiesto dal pulsante master, None se nessun reset
+        # in corso: la schermata di reset resta visibile senza bloccare il loop (vedi system_reset).
+        self._reset_at = None
+
         # Stato connettività:
         # - wifi_connected: True se WiFi connesso.
         # - mqtt: handler MQTT (None se non disponibile).
+        # - _mqtt_setup_done: True dopo il primo tentativo di setup MQTT (fatto appena c'è rete).
         self.wifi_connected = False
         self.mqtt = None
+        self._mqtt_setup_done = False
+
+        # Risposte ai messaggi ricevuti (conferme delle soglie, reset_ack) in attesa di invio:
+        # topic completo (bytes) -> (payload, retain, qos). Non si pubblica dalla callback MQTT:
+        # la callback può girare dentro l'attesa del PUBACK di un publish QoS 1 (umqtt.simple
+        # legge i messaggi in arrivo in wait_msg()), e un publish QoS 1 annidato ne
+        # consumerebbe il PUBACK, lasciando il publish esterno bloccato per sempre sul socket.
+        # Le invia _task_mqtt dopo check_messages(); per ogni topic vale l'ultima risposta.
+        self._pending_replies = {}
 
         # Timer per conferma occupazione/liberazione:
         # - occupied_timer: timestamp inizio condizione "stop" per confermare OCCUPATO.
         # - free_timer: timestamp inizio condizione "libero" per confermare LIBERO.
-        # - last_distance: ultimo valore distanza filtrata (usato anche per stabilizzare la lettura).
+        # - last_distance_q: ultimo valore distanza filtrata in decimi di cm (intero, virgola
+        #   fissa: nessun float nel filtro), usato anche per stabilizzare la lettura.
+        #   9990 = sentinella "mai misurata" (999 cm).
+        # - _distance_outliers: letture consecutive scartate perché troppo lontane da last_distance_q.
         self.occupied_timer = 0
         self.free_timer = 0
-        self.last_distance = 999
+        self.last_distance_q = 9990
+        self._distance_outliers = 0
+
+        # Ultime letture dei sensori fatte dai check periodici del loop (check_gas,
+        # check_brightness): display e telemetria usano questi valori invece di rileggere
+        # ADC e I2C. _last_lux è None se il sensore di luminosità non è disponibile.
+        self._last_gas_raw = 0
+        self._last_lux = None
+
+        # Buffer preallocato per la lettura del gas (MQ2Sensor.read_into) in check_gas.
+        self._adc_buf = array('H', [0])
+
+        # Soglie del posto auto precalcolate (non cambiano a runtime): check_parking gira a 5 Hz
+        # e così evita lookup su self.config e la divisione MAX/2 ad ogni chiamata.
+        # Tutte in decimi di cm (interi), come le distanze del filtro: confronti tra small int.
+        # - _half_q: sotto questa distanza il buzzer di assistenza passa al tono più alto.
+        # - _release_q: MAX + 2cm, distanza oltre cui parte il conteggio di liberazione.
+        self._min_q = int(config.ULTRASONIC_MIN_DISTANCE * 10)
+        self._max_q = int(config.ULTRASONIC_MAX_DISTANCE * 10)
+        self._half_q = self._max_q // 2
+        self._release_q = self._max_q + _FREE_TOL_Q
+        self._occupied_confirm = config.ULTRASONIC_OCCUPIED_CONFIRM
+        self._free_confirm = config.ULTRASONIC_FREE_CONFIRM
+
+        # Soglie gas precalcolate (entrata/uscita allarme): modificabili via MQTT, quindi
+        # ricalcolate da _refresh_gas_thresholds() ad ogni aggiornamento o reset.
+        self._refresh_gas_thresholds()
 
         # WiFi connection (inizializza anche il display se necessario e mostra icone di connessione).
+        # Non bloccante: avvia l'associazione, che prosegue mentre si inizializzano i componenti.
         self.connect_wifi()
 
         # Inizializza sensori/attuatori/display, e imposta lo stato iniziale.
         self.initialize_components()
 
-        # MQTT setup (solo se WiFi connesso).
-        self.setup_mqtt()
+        # Dispatch dei topic MQTT con nome esatto: topic (bytes) -> metodo handler(message).
+        self._topic_handlers = {
+            b"parking/cmd/open_gate": self._handle_open_gate,
+            b"parking/cmd/close_gate": self._handle_close_gate,
+            b"parking/cmd/parking_light_mode": self._handle_light_mode,
+            b"parking/cmd/reset_config": self._handle_reset,
+            _TOPIC_RESET_ACK: self._handle_ignore,
+        }
+
+        # Controlla l'esito del WiFi: se già connesso esegue subito il setup MQTT,
+        # altrimenti se ne occupa check_wifi() dal loop principale appena la rete è pronta.
+        self.check_wifi()
 
     def connect_wifi(self):
         """Connessione WiFi con Icona"""
@@ -64,30 +189,34 @@ class SmartParking:
         # Mostra l'icona di connessione WiFi sul display
         self.display.show_wifi_connecting()
 
-        # Inizializza l'interfaccia WiFi
-        wlan = network.WLAN(network.STA_IF)
-        wlan.active(True)
-
-        # Se non è connesso, avvia la procedura di connessione con timeout.
-        if not wlan.isconnected():
-            print(f"Connecting to {self.config.WIFI_SSID}...")
-            wlan.connect(self.config.WIFI_SSID, self.config.WIFI_PASSWORD)
-
-            # Timeout massimo di 15 secondi: evita loop infinito se rete non raggiungibile.
-            timeout = 15
-            while not wlan.isconnected() and timeout > 0:
-                time.sleep(1)
-                timeout -= 1
-
-        # Se connesso, salva stato e IP; altrimenti mostra errore su display.
-        if wlan.isconnected():
-            self.wifi_connected = True
-            ip = wlan.ifconfig()[0]
-            print(f"WiFi connected! IP: {ip}")
-        else:
-            print("WiFi connection failed!")
-            self.display.show_error("WiFi FAILED")
-            time.sleep(2)
+        # Avvia la connessione (non bloccante): l'esito viene controllato da check_wifi().
+        # Timeout massimo di 10 secondi (default di WiFiManager) se rete non raggiungibile;
+        # password errata o rete assente chiudono il tentativo subito.
+        self.wifi = WiFiManager(self.config.WIFI_SSID, self.config.WIFI_PASSWORD)
+        self.wifi_connected = self.wifi.connect()
+
+    def check_wifi(self):
+        """
+        Fa avanzare la connessione WiFi (chiamato periodicamente dal loop principale).
+
+        Come funziona:
+        - poll() aggiorna lo stato di WiFiManager senza attese.
+        - Alla prima connessione riuscita esegue il setup MQTT.
+        - Se il tentativo fallisce (timeout) o la rete cade, ne avvia uno nuovo appena
+          scade il ritardo di backoff (retry_due()).
+        """
+        state = self.wifi.poll()
+        self.wifi_connected = state == WiFiManager.STATE_CONNECTED
+
+        if self.wifi_connected:
+            if not self._mqtt_setup_done:
+                self._mqtt_setup_done = True
+                self.setup_mqtt()
+        elif state != WiFiManager.STATE_CONNECTING and self.wifi.retry_due():
+            if state == WiFiManager.STATE_ERROR:
+                print("WiFi connection failed!")
+                self.display.show_error("WiFi FAILED")
+            self.wifi.connect()
 
     def setup_mqtt(self):
         """Setup MQTT connection"""
@@ -100,19 +229,21 @@ class SmartParking:
         self.display.show_mqtt_connecting()
 
         try:
+            # Import differito: mqtt_handler (con umqtt, select, struct, json) viene caricato
+            # solo quando il WiFi è connesso; senza rete non occupa heap né tempo di boot.
+            from mqtt_handler import MQTTHandler
+
             # Crea l'handler MQTT registrando la callback on_mqtt_message per i messaggi ricevuti.
             self.mqtt = MQTTHandler(self.config, self.on_mqtt_message)
 
             # Tenta connessione al broker: se OK, sistema pronto per publish/subscribe.
             if self.mqtt.connect():
                 print("MQTT ready")
-                # Piccola attesa per stabilizzare la transizione UI/logica (non indispensabile ma utile).
-                time.sleep(1)
             else:
-                # Connessione fallita: segnala errore e disabilita mqtt per evitare uso successivo.
+                # Connessione fallita: segnala errore. L'handler resta: il loop principale
+                # ritenta la connessione con backoff esponenziale (MQTTHandler.reconnect()).
                 print("MQTT connection failed")
                 self.display.show_error("MQTT FAIL")
-                self.mqtt = None
         except Exception as e:
             # Qualsiasi eccezione in fase di setup viene gestita:
             # - log su seriale
@@ -124,71 +255,97 @@ class SmartParking:
 
     def on_mqtt_message(self, topic, message):
         """Callback per messaggi MQTT ricevuti - CON FIX LOOP"""
+        # topic e message sono bytes (inoltrati da MQTTHandler senza decode):
+        # il payload viene decodificato solo dagli handler che ne usano il testo.
 
         # Evita loop di conferme:
         # Se arriva un messaggio su un topic che termina con "/confirm", è una conferma
         # pubblicata dal dispositivo stesso (o dalla logica di conferma) e va ignorata.
-        if topic.endswith("/confirm"):
+        # Con la sottoscrizione a 'parking/cfg/+' il broker non le consegna più:
+        # il controllo resta come protezione.
+        if topic.endswith(_CONFIRM_SUFFIX):
             return
 
         # Log diagnostico della ricezione (utile per debug integrazione con Node-RED/dashboard).
-        print(f"MQTT RX: {topic} = {message}")
+        if _DEBUG:
+            print("MQTT RX:", topic, "=", message)
 
         try:
-            # --- COMANDI SBARRA ---
-            # Topic comandi: apri/chiudi sbarra. La logica effettiva di movimento è nel ServoGate.
-            if topic == "parking/cmd/open_gate":
-                self.servo.request_open()
-            elif topic == "parking/cmd/close_gate":
-                self.servo.request_close()
-
-            # --- MODALITÀ LUCI PARCHEGGIO ---
-            # Aggiorna modalità di funzionamento della luce (ON/OFF/AUTO) tramite configurazione.
-            elif topic == "parking/cmd/parking_light_mode":
-                # update_light_mode ritorna True se la modalità è stata accettata/aggiornata.
-                if self.config.update_light_mode(message):
-                    self.apply_parking_light_mode()
-
-            # --- RESET CONFIGURAZIONE ---
-            # Ripristina soglie di default e aggiorna Node-RED pubblicando valori retained.
-            elif topic == "parking/cmd/reset_config":
-                print("RESET COMPLETO CONFIGURAZIONE...")
-                # Valori di Default
-                DEFAULT_MQ2_THRESH = 1500
-                DEFAULT_MQ2_HYST = 100
-                DEFAULT_LUX_THRESH = 50
-
-                # Resetta variabili interne di configurazione (soglie/isteresi).
-                self.config.MQ2_THRESHOLD = DEFAULT_MQ2_THRESH
-                self.config.MQ2_HYSTERESIS = DEFAULT_MQ2_HYST
-                self.config.LUX_THRESHOLD = DEFAULT_LUX_THRESH
-
-                # Aggiorna Node-RED (retain=True) per sincronizzare dashboard con valori resettati.
-                if self.mqtt:
-                    self.mqtt.publish("parking/cfg/mq2_threshold", str(DEFAULT_MQ2_THRESH), retain=True)
-                    self.mqtt.publish("parking/cfg/mq2_hyst", str(DEFAULT_MQ2_HYST), retain=True)
-                    self.mqtt.publish("parking/cfg/lux_threshold", str(DEFAULT_LUX_THRESH), retain=True)
-                print("Reset completato.")
+            # --- COMANDI (topic esatti) ---
+            # Lookup nel dizionario topic -> handler (vedi _topic_handlers in __init__):
+            # una sola ricerca invece di una catena di confronti tra stringhe.
+            handler = self._topic_handlers.get(topic)
+            if handler:
+                handler(message)
 
             # --- GESTIONE CONFIGURAZIONE GENERICA ---
             # Gestisce topic del tipo "parking/cfg/<param>" tipici di slider/barre su Node-RED.
-            elif topic.startswith("parking/cfg/"):
-                # Estrae il nome del parametro (ultima parte del topic).
-                param = topic.split("/")[-1]
+            elif topic.startswith(_CFG_PREFIX):
+                # Estrae il nome del parametro (ultima parte del topic): con la sottoscrizione
+                # a 'parking/cfg/+' è tutto ciò che segue il prefisso. Una sola slice invece
+                # di split() (lista + un bytes per ogni segmento).
+                param = topic[_CFG_PREFIX_LEN:].decode()
 
                 # Aggiorna il valore nella config; se accettato, invia conferma.
-                if self.config.update_threshold(param, message):
+                if self.config.update_threshold(param, message.decode()):
+                    self._refresh_gas_thresholds()
+
                     # Pubblica conferma sul topic "<topic>/confirm" per far allineare la dashboard.
                     # Nota: il return all'inizio su "/confirm" previene l'effetto ping-pong.
-                    confirm_topic = f"{topic}/confirm"
-                    if self.mqtt:
-                        self.mqtt.publish(confirm_topic, message, retain=True)
+                    # Il topic ricevuto è già completo ("parking/cfg/...") e in bytes:
+                    # publish() non aggiunge il prefisso e ripubblica il payload così com'è.
+                    # QoS 1: una conferma persa lascerebbe lo slider della dashboard disallineato.
+                    # Inviata da _task_mqtt, fuori dalla callback (vedi _pending_replies).
+                    self._pending_replies[topic + _CONFIRM_SUFFIX] = (message, True, 1)
 
         except Exception as e:
             # Qualsiasi errore in parsing/gestione messaggio MQTT viene loggato,
             # evitando che la callback rompa il loop principale.
             print(f"Error processing MQTT: {e}")
 
+    # --- COMANDI SBARRA ---
+    # Topic comandi: apri/chiudi sbarra. La logica effettiva di movimento è nel ServoGate.
+    def _handle_open_gate(self, message):
+        self.servo.request_open()
+
+    def _handle_close_gate(self, message):
+        self.servo.request_close()
+
+    # --- MODALITÀ LUCI PARCHEGGIO ---
+    # Aggiorna modalità di funzionamento della luce (ON/OFF/AUTO) tramite configurazione.
+    def _handle_light_mode(self, message):
+        # update_light_mode ritorna True se la modalità è stata accettata/aggiornata.
+        if self.config.update_light_mode(message.decode()):
+            self.apply_parking_light_mode()
+
+    # --- RESET CONFIGURAZIONE ---
+    # Ripristina soglie di default e aggiorna Node-RED pubblicando i valori.
+    def _handle_reset(self, message):
+        print("RESET COMPLETO CONFIGURAZIONE...")
+        # Resetta variabili interne di configurazione (soglie/isteresi) ai default (_RESET_DEFAULTS).
+        config = self.config
+        for attr, _, value in _RESET_DEFAULTS:
+            setattr(config, attr, value)
+        self._refresh_gas_thresholds()
+
+        # Aggiorna Node-RED per sincronizzare la dashboard con i valori resettati:
+        # un solo messaggio JSON su parking/cfg/reset_ack con tutte e tre le soglie
+        # (Node-RED lo espande nei singoli campi). Non retained: ad ogni riavvio della
+        # dashboard non deve riportare le soglie ai default.
+        # Inviato da _task_mqtt, fuori dalla callback (vedi _pending_replies).
+        self._pending_replies[_TOPIC_RESET_ACK] = (_RESET_ACK, False, 0)
+        print("Reset completato.")
+
+    # Riepilogo del reset pubblicato dal dispositivo stesso su parking/cfg/: va ignorato
+    # (altrimenti finirebbe nella gestione generica delle soglie).
+    def _handle_ignore(self, message):
+        pass
+
+    # Callback "parcheggio pieno" per ServoGate: metodo bound (creato una sola volta
+    # in initialize_components) invece di una lambda con closure su self.
+    def _is_parking_full(self):
+        return self.car_parked
+
     def apply_parking_light_mode(self):
         """Applica modalità luci parcheggio"""
         # Applica il comportamento della luce parcheggio in base alla modalità configurata:
@@ -215,9 +372,9 @@ class SmartParking:
         print("Initializing components...")
 
         # Display già inizializzato in connect_wifi.
-        # Mostra un logo/boot screen e attende 2s (feedback utente durante init HW).
-        self.display.show_logo()
-        time.sleep(2)
+        # Mostra il logo senza attese: resta a schermo mentre si inizializza l'hardware
+        # e viene sostituito dalla schermata successiva (MQTT o principale).
+        self.display.show_logo(0)
 
         # --- SENSORI ---
         # Sensori IR: tipicamente valore 0 quando rileva ostacolo/auto, 1 quando libero (convenzione comune).
@@ -247,9 +404,10 @@ class SmartParking:
         self.gate_button = Button(self.config.PIN_GATE_BUTTON, name="Gate Button")
 
         # ServoGate gestisce la macchina a stati della sbarra.
-        # is_parking_full_cb usa lambda che ritorna self.car_parked:
+        # is_parking_full_cb è il metodo bound _is_parking_full, che ritorna self.car_parked:
         # - se il posto è occupato, il parcheggio viene considerato "pieno" per l'ingresso.
-        self.servo = ServoGate(self.config.PIN_SERVO, self.ir_entrance, self.ir_exit, self.traffic_light, self.gate_button, is_parking_full_cb=lambda: self.car_parked)
+        # timer_id: timer hardware dedicato agli step del servo (movimento fluido non legato al loop).
+        self.servo = ServoGate(self.config.PIN_SERVO, self.ir_entrance, self.ir_exit, self.traffic_light, self.gate_button, is_parking_full_cb=self._is_parking_full, timer_id=self.config.TIMER_SERVO)
 
         # LED parcheggio (rosso/verde) per stato posto libero/occupato.
         self.parking_leds = ParkingLeds(self.config.PIN_PARKING_RED, self.config.PIN_PARKING_GREEN)
@@ -270,7 +428,7 @@ class SmartParking:
         self.set_initial_state()
 
         # Sistema pronto: aggiorna stato e mostra schermata principale.
-        self.state = "READY"
+        self.state = _STATE_READY
         self.display.show_main_screen(gate_status=self.servo.is_open(), parking_status=self.car_parked, gas_level=self.mq2.read_percentage())
         print("System ready")
 
@@ -281,10 +439,16 @@ class SmartParking:
         # - LED allarme spento
         # - luce parcheggio spenta
         # - buzzer fermo
-        self.traffic_light.red_on()
-        self.parking_leds.set_free()  # Verde acceso di default
-        self.alarm_led.off()
-        self.parking_light.off()
+        # Tutte le uscite digitali sono impostate con una sola gpio_write (store su W1TC/W1TS
+        # dei due banchi GPIO) invece di una chiamata Pin per ciascun LED. Poi si riallinea
+        # lo stato interno degli attuatori che ne tengono uno. Il buzzer è PWM: resta a parte.
+        cfg = self.config
+        gpio_write(write_masks(
+            (cfg.PIN_TRAFFIC_RED, cfg.PIN_PARKING_GREEN),
+            (cfg.PIN_TRAFFIC_YELLOW, cfg.PIN_TRAFFIC_GREEN, cfg.PIN_PARKING_RED,
+             cfg.PIN_ALARM_LED, cfg.PIN_PARKING_LIGHT)))
+        self.parking_leds.mark_free()  # Verde acceso di default
+        self.parking_light.brightness = 0
         self.buzzer.stop()
 
         # Reset variabili di stato del posto e timer di conferma.
@@ -295,34 +459,71 @@ class SmartParking:
     def run(self):
         """Main system loop"""
         print("Starting main loop...")
-        self.state = "RUNNING"
-
-        # Timestamp per scheduling non bloccante di task periodici:
-        last_display_update = 0
-        last_distance_check = 0
-        last_gas_check = 0
-        last_light_check = 0
-        last_mqtt_telemetry = 0
-        last_mqtt_check = 0
+        self.state = _STATE_RUNNING
+
+        # Riferimenti locali usati ad ogni giro: accesso a variabile locale invece di
+        # lookup globale + attributo (time.ticks_ms, self.servo, ...).
+        ticks_ms = time.ticks_ms
+        ticks_diff = time.ticks_diff
+        ticks_add = time.ticks_add
+        sleep_ms = time.sleep_ms
+        servo = self.servo
+        buzzer = self.buzzer
+        master_button = self.master_button
+
+        # Task periodici non bloccanti: [prossima scadenza (ticks_ms), periodo ms, funzione].
+        # La lista resta ordinata per scadenza: ad ogni giro basta confrontare la prima
+        # (un solo ticks_diff invece di uno per task). A parità di scadenza l'ordine
+        # è quello qui sotto, lo stesso dei vecchi controlli in sequenza.
+        # Tutti scadono subito: al primo giro vengono eseguiti una volta ciascuno.
+        now = ticks_ms()
+        tasks = [
+            [now, _MQTT_POLL_MS, self._task_mqtt],        # comandi/config MQTT (o riconnessione)
+            [now, _WIFI_CHECK_MS, self.check_wifi],       # avanzamento connessione WiFi
+            [now, _DIST_CHECK_MS, self.check_parking],    # occupato/libero + assistenza parcheggio
+            [now, _GAS_CHECK_MS, self.check_gas],         # isteresi su soglia gas
+            [now, _LIGHT_CHECK_MS, self.check_brightness],  # lettura lux + luci in AUTO
+            [now, _DISPLAY_MS, self._task_display],       # refresh display + gc
+            [now, self.config.MQTT_TELEMETRY_INTERVAL, self._task_telemetry],  # heartbeat telemetria
+        ]
 
         # was_moving serve per rilevare transizione "fine movimento sbarra"
         # e fare azioni una tantum subito dopo (refresh display/telemetria/luci).
         was_moving = False
 
-        while True:
-            current_time = time.ticks_ms()
+        # Ultimo stato FSM della sbarra visto dal loop: un cambio rende la telemetria "sporca".
+        last_gate_state = servo.state
+
+        # Stati in cui la sbarra può essere in movimento: a sbarra ferma (caso più comune)
+        # il loop controlla solo questa maschera, senza chiamare is_moving().
+        moving_mask = (1 << servo.STATE_OPENING) | (1 << servo.STATE_CLOSING)
+
+        # 1. FSM SERVO (Priorità)
+        # La sbarra è trattata come task prioritario: la sua FSM (update()) gira su un
+        # timer hardware dedicato ogni SERVO_INTERVAL ms, con cadenza fissa anche quando
+        # il loop è impegnato (MQTT, display). Il loop legge solo lo stato di movimento.
+        servo.start_fsm_timer(self.config.TIMER_GATE_FSM)
 
-            # 1. AGGIORNA SERVO (Priorità)
-            # La sbarra è trattata come task prioritario: aggiorna la FSM del servo ad ogni ciclo.
-            self.servo.update()
-            is_moving = self.servo.is_moving()
+        # Il pulsante master viene campionato (debounce) da un timer dedicato ogni 6 ms,
+        # anche mentre il loop è occupato o sta saltando giri durante il movimento sbarra.
+        master_button.start_sampling(self.config.TIMER_BUTTON)
+
+        # Il lampeggio sonoro dell'allarme gas gira su un proprio timer (armato solo durante
+        # l'allarme): continua regolare anche durante il movimento della sbarra.
+        buzzer.use_timer(self.config.TIMER_BUZZER)
+
+        while True:
+            is_moving = bool(moving_mask & (1 << servo.state)) and servo.is_moving()
 
             # 2. FLUIDITÀ SBARRA
-            # Se la sbarra si sta muovendo, si riduce il carico del loop (sleep minimo + continue)
-            # per avere maggiore reattività e regolarità nel movimento/lampeggio.
+            # Step del servo e FSM (sicurezza/fine corsa) girano sui timer hardware;
+            # durante il movimento il loop non fa altro lavoro (continue).
+            # Dorme fino a subito dopo il prossimo step (next_wake): le callback
+            # schedulate dai timer vengono eseguite durante lo sleep.
             if is_moving:
                 was_moving = True
-                time.sleep_ms(1)
+                wait = servo.next_wake(ticks_ms())
+                sleep_ms(wait + 1 if wait >= 0 else 1)
                 continue
 
             # 3. FINE MOVIMENTO
@@ -331,243 +532,349 @@ class SmartParking:
             if was_moving and not is_moving:
                 self.check_brightness()
                 self.publish_telemetry()
-                self.update_display()
+                self._task_display()
                 was_moving = False
 
-
-            # MQTT: check_messages a cadenza ~100ms per ricevere comandi/config in modo responsivo.
-            if self.mqtt and time.ticks_diff(current_time, last_mqtt_check) >= 100:
-                self.mqtt.check_messages()
-                last_mqtt_check = current_time
-
             # PULSANTE RESET (5 SECONDI)
             # get_press_type identifica la durata pressione:
             # - long_duration=5000 => long_press quando mantenuto premuto per 5s.
-            press_type = self.master_button.get_press_type(long_duration=5000)
+            # Il debounce (poll()) gira sul timer avviato prima del loop: qui si leggono solo i flag.
+            press_type = master_button.get_press_type(long_duration=5000)
 
             if press_type == "long_press":
                 print("PULSANTE MASTER: Pressione lunga rilevata (5s)")
                 print("Avvio procedura di RESET...")
                 self.system_reset() # Riavvia il microcontrollore dopo aver mostrato grafica.
 
-            # Sensori distanza: ogni 200ms (gestione occupato/libero + assistenza parcheggio).
-            if time.ticks_diff(current_time, last_distance_check) >= 200:
-                self.check_parking()
-                last_distance_check = current_time
-
-            # Sensore gas: ogni 500ms (isteresi su soglia).
-            if time.ticks_diff(current_time, last_gas_check) >= 500:
-                self.check_gas()
-                last_gas_check = current_time
-
-            # Luci in AUTO: ogni 1000ms (lettura lux + soglia).
-            if time.ticks_diff(current_time, last_light_check) >= 1000:
-                self.check_brightness()
-                last_light_check = current_time
-
-            # Display: refresh ogni 1000ms (o quando finisce il movimento della sbarra).
-            if time.ticks_diff(current_time, last_display_update) >= 1000:
-                self.update_display()
-                last_display_update = current_time
-
-            # Telemetria: invio MQTT a intervallo configurato (MQTT_TELEMETRY_INTERVAL).
-            if self.mqtt and time.ticks_diff(current_time, last_mqtt_telemetry) >= self.config.MQTT_TELEMETRY_INTERVAL:
-                self.publish_telemetry()
-                last_mqtt_telemetry = current_time
-
-            # Buzzer: update non bloccante (gestione lampeggio allarme).
-            self.buzzer.update()
+            # TASK PERIODICI
+            # Esegue tutti i task scaduti, in ordine di scadenza. Ogni task viene
+            # ripianificato un periodo dopo la scadenza precedente (cadenza senza deriva);
+            # se è rimasto indietro di più di un periodo (es. dopo un movimento della sbarra)
+            # riparte da adesso, invece di recuperare le esecuzioni perse una dopo l'altra.
+            # Il reinserimento ordinato in una lista di 7 elementi non alloca.
+            current_time = ticks_ms()
+            while ticks_diff(current_time, tasks[0][0]) >= 0:
+                task = tasks.pop(0)
+                task[2]()
+                due = ticks_add(task[0], task[1])
+                if ticks_diff(due, current_time) <= 0:
+                    due = ticks_add(current_time, task[1])
+                task[0] = due
+                i = 0
+                n = len(tasks)
+                while i < n and ticks_diff(due, tasks[i][0]) >= 0:
+                    i += 1
+                tasks.insert(i, task)
+
+            # Cambio di stato della sbarra (es. richiesta apertura accettata): da pubblicare subito.
+            # Gli eventi della FSM vengono accodati solo insieme a un cambio di stato, quindi il
+            # log si stampa qui (a sbarra ferma: la print su UART è bloccante) e non a ogni giro.
+            state = servo.state
+            if state != last_gate_state:
+                last_gate_state = state
+                self._telemetry_dirty = True
+                servo.drain_events()
+
+            # Telemetria: invio MQTT subito quando c'è un evento da comunicare; altrimenti
+            # parte come heartbeat dal task a intervallo configurato (MQTT_TELEMETRY_INTERVAL).
+            if self._telemetry_dirty:
+                self._task_telemetry()
+
+            # Sleep fino alla prossima scadenza, ma al massimo _LOOP_MAX_SLEEP_MS.
+            # Il lavoro a cadenza fissa non dipende da questo quanto: sbarra (step e FSM),
+            # debounce del pulsante e lampeggio del buzzer girano sui timer hardware e le loro
+            # callback schedulate vengono eseguite anche durante lo sleep. Il loop si sveglia
+            # solo per i task periodici e per accorgersi dei cambi di stato della sbarra.
+            wait = ticks_diff(tasks[0][0], ticks_ms())
+            sleep_ms(_LOOP_MAX_SLEEP_MS if wait > _LOOP_MAX_SLEEP_MS else (wait if wait > 0 else 0))
+
+    def _task_mqtt(self):
+        """Task periodico MQTT (ogni 100 ms): ricezione comandi o riconnessione."""
+        # self.mqtt può comparire durante il loop (setup dopo la connessione WiFi):
+        # viene riletto ad ogni esecuzione.
+        # Broker perso (o mai raggiunto): con il WiFi attivo si ritenta la connessione;
+        # reconnect() ritorna subito finché non è scaduto il ritardo di backoff.
+        mqtt = self.mqtt
+        if mqtt:
+            if mqtt.connected:
+                mqtt.check_messages()
+                if self._pending_replies:
+                    self._send_replies(mqtt)
+            elif self.wifi_connected:
+                mqtt.reconnect()
+
+    def _send_replies(self, mqtt):
+        """Pubblica le risposte raccolte dalla callback MQTT (vedi _pending_replies)."""
+        # Fuori dalla callback: un publish QoS 1 che qui attende il PUBACK può ricevere nuovi
+        # comandi, che aggiungono solo voci al dizionario. Una risposta non accettata resta
+        # in attesa e viene ritentata al prossimo giro (dopo la riconnessione).
+        pending = self._pending_replies
+        while pending:
+            topic, reply = pending.popitem()
+            if not mqtt.publish(topic, reply[0], reply[1], reply[2]):
+                pending.setdefault(topic, reply)
+                return
+
+    def _task_display(self):
+        """Task periodico display (ogni 1000 ms, o quando finisce il movimento della sbarra)."""
+        # Subito dopo il refresh, garbage collection esplicita: avviene in un punto noto e a
+        # sbarra ferma, invece di scattare quando capita (es. durante un aggiornamento del servo).
+        # Reset in corso: la schermata di reset non va sovrascritta; il riavvio avviene
+        # qui quando scade _reset_at (entro un periodo del task dopo i 2 s).
+        if self._reset_at is not None:
+            if time.ticks_diff(time.ticks_ms(), self._reset_at) >= 0:
+                machine.reset()
+            return
+        self.update_display()
+        gc.collect()
 
-            # Piccolo sleep per ridurre CPU e jitter, mantenendo loop reattivo.
-            time.sleep_ms(5)
+    def _task_telemetry(self):
+        """Pubblica la telemetria (evento in sospeso o heartbeat), se l'handler MQTT esiste."""
+        # Con tutto fermo, MQTTHandler salta comunque i pacchetti senza variazioni.
+        # Senza handler il flag "sporco" resta: l'evento viene inviato appena MQTT è pronto.
+        if self.mqtt:
+            self.publish_telemetry()
+            self._telemetry_dirty = False
 
-    def _get_filtered_distance(self):
+    # Logica del posto e del gas: eseguita 5 e 2 volte al secondo, solo confronti tra interi
+    # e chiamate a metodi: compilata in codice nativo (come la FSM in ServoGate).
+    @micropython.native
+    def _get_filtered_distance(self, d):
         """
-        Legge 7 valori, scarta i peggiori (min/max) e fa la media.
-        Usa anche il valore precedente per stabilizzare (Media Pesata).
+        Fonde una singola lettura d (decimi di cm, intero) nella distanza filtrata (Media Pesata).
 
         A cosa serve:
         - Ridurre rumore e outlier tipici dei sensori a ultrasuoni.
         - Stabilizzare l'andamento della distanza per evitare attivazioni/disattivazioni rapide
           (flapping) dell'assistenza e dei timer di conferma.
+        - Senza burst di letture e sleep: il loop non resta bloccato ad ogni controllo.
 
         Come funziona:
-        1) Esegue 7 letture ravvicinate.
+        1) Usa la lettura d misurata a interrupt (vedi check_parking()).
         2) Scarta letture fuori range fisico plausibile.
-        3) Ordina e rimuove minimo e massimo (trimmed mean) se abbastanza campioni.
-        4) Calcola media e applica un filtro passa-basso (media pesata con last_distance).
-        """
-        readings = []
-
-        # 1. Burst di 7 letture rapide
-        for _ in range(7):
-            d = self.ultrasonic.distance_cm()
-
-            # Accetta solo valori fisicamente possibili (0.5cm - 300cm)
-            # per scartare letture spurie (es. 0 o valori enormi dovuti a timeout/eco).
-            if 0.5 < d < 300:
-                readings.append(d)
-
-            # Pausa molto breve per non leggere sempre lo stesso impulso/eco.
-            time.sleep_ms(3)
+        3) Scarta letture troppo lontane (> 15 cm) dall'ultima distanza filtrata, ma solo
+           fino a 3 volte di fila: se il salto persiste è un cambiamento reale e viene accettato.
+        4) Applica un filtro passa-basso (media pesata con last_distance_q).
 
-        # Se non ci sono letture valide, ritorna l'ultima distanza nota (fallback stabile).
-        if not readings:
-            return self.last_distance
-
-        # 2. Ordina e rimuovi gli estremi (Trimmed Mean)
-        readings.sort()
-        if len(readings) >= 5:
-            # Rimuove il più basso e il più alto: spesso rappresentano rumore.
-            readings = readings[1:-1]
-
-        # 3. Media attuale dei campioni ripuliti
-        current_avg = sum(readings) / len(readings)
+        Tutto in decimi di cm (interi): nessun float allocato ad ogni controllo.
+        """
+        # 2. Accetta solo valori fisicamente possibili (0.5cm - 300cm)
+        # per scartare letture spurie (es. 0 o valori enormi dovuti a timeout/eco).
+        # Se la lettura non è valida, ritorna l'ultima distanza nota (fallback stabile).
+        # last_distance_q letto una sola volta in una variabile locale (usato fino a 4 volte).
+        last = self.last_distance_q
+        if not (5 < d < 3000):
+            return last
+
+        # Se last_distance_q è "sentinella" 9990 (primo avvio), usa direttamente la lettura.
+        if last == 9990: # Primo avvio
+            self._distance_outliers = 0
+            return d
+
+        # 3. Filtro outlier a finestra attorno al valore precedente (±15 cm).
+        # Confronto concatenato sulla finestra [last-150, last+150]: nessuna chiamata abs().
+        if not (last - 150 <= d <= last + 150) and self._distance_outliers < 3:
+            self._distance_outliers += 1
+            return last
+        self._distance_outliers = 0
 
         # 4. LOW PASS FILTER (stabilizzazione temporale)
-        # Se last_distance è "sentinella" 999 (primo avvio), usa direttamente current_avg.
-        # Altrimenti media pesata: 70% valore nuovo + 30% valore precedente.
-        if self.last_distance == 999: # Primo avvio
-            filtered = current_avg
-        else:
-            filtered = (current_avg * 0.7) + (self.last_distance * 0.3)
-
-        return filtered
+        # Media pesata intera: 70% valore nuovo + 30% valore precedente.
+        return (7 * d + 3 * last) // 10
 
+    @micropython.native
     def check_parking(self):
         """Check parking spot status - CON ISTERESI E TOLLERANZA"""
         # Se allarme gas attivo, si disabilita la logica parcheggio (priorità sicurezza).
         if self.gas_alarm: return
 
-        # Legge distanza ultra-filtrata (vedi _get_filtered_distance).
-        distance = self._get_filtered_distance()
-        now = time.ticks_ms()
+        # Misura ultrasuoni a interrupt: legge il risultato del trigger del giro precedente
+        # e avvia subito la misura successiva (nessuna attesa dell'eco nel loop).
+        # Senza una nuova misura disponibile la logica del posto salta questo giro.
+        us = self.ultrasonic
+        d = us.read_cm10()
+        us.trigger()
+        if d < 0:
+            return
+
+        # Distanza ultra-filtrata (vedi _get_filtered_distance).
+        # distance è in decimi di cm, come tutte le soglie _*_q.
+        distance = self._get_filtered_distance(d)
 
         # Salva distanza per:
         # - telemetria MQTT
         # - filtro passa-basso nel ciclo successivo
-        self.last_distance = distance
+        self.last_distance_q = distance
 
-        # ========== STATO: LIBERO (In fase di parcheggio) ==========
-        if not self.car_parked:
-            # Se il posto è libero, non ha senso far contare la liberazione.
-            self.free_timer = 0
+        # Logica separata per stato del posto: ciascun ramo è un metodo piccolo,
+        # con solo le variabili locali che gli servono.
+        if self.car_parked:
+            self._check_parking_occupied(distance, time.ticks_ms())
+        else:
+            self._check_parking_free(distance, time.ticks_ms())
 
-            # --- ZONA DI STOP E CONFERMA ---
-            # limit: soglia di "stop" sotto cui consideriamo l'auto arrivata a fine corsa.
-            # Se occupied_timer è già attivo, allarga la soglia di 1cm per tollerare oscillazioni
-            # senza resettare continuamente il conteggio (stabilizzazione temporale + tolleranza).
-            limit = self.config.ULTRASONIC_MIN_DISTANCE
-            if self.occupied_timer > 0:
-                limit += 1.0 # TOLLERANZA: se stiamo già contando, concedi 1cm in più
-
-            if 0 < distance <= limit:
-                # Buzzer continuo (suono di stop): frequenza alta costante.
-                self.buzzer.set_frequency(2000)
-
-                # Avvia timer di conferma occupazione se non è già partito.
-                if self.occupied_timer == 0:
-                    self.occupied_timer = now
-                    print(f"Stop rilevato ({distance:.1f}cm). Attesa stabilità...")
-
-                # Conferma occupazione solo se la condizione resta valida per ULTRASONIC_OCCUPIED_CONFIRM ms.
-                if time.ticks_diff(now, self.occupied_timer) >= self.config.ULTRASONIC_OCCUPIED_CONFIRM:
-                    # CONFERMA OCCUPATO
-                    self.car_parked = True
-                    self.parking_leds.set_occupied()
-                    self.parking_assist = False
-                    self.buzzer.stop_parking_assist()
-                    self.occupied_timer = 0
-                    print(f"PARCHEGGIO COMPLETATO")
-
-                    # Pubblica stato su MQTT (retain=True) così la dashboard vede l'ultimo stato.
-                    if self.mqtt: self.mqtt.publish('state/spot', 'OCCUPATO', retain=True)
-
-            # --- ZONA DI AVVICINAMENTO ---
-            # Se l'auto è entro ULTRASONIC_MAX_DISTANCE ma non in "stop", attiva assistenza.
-            elif distance <= self.config.ULTRASONIC_MAX_DISTANCE:
-                self.parking_assist = True
-
-                # Reset timer occupazione: siamo in avvicinamento, non ancora in stop stabile.
-                self.occupied_timer = 0 # Reset solo se ti allontani davvero
-
-                # Suono incrementale (semplice): più vicino => frequenza più alta.
-                if distance < (self.config.ULTRASONIC_MAX_DISTANCE / 2):
-                    self.buzzer.set_frequency(1500)
-                else:
-                    self.buzzer.set_frequency(800)
-
-            # --- LONTANO ---
-            # Fuori range: niente assistenza e buzzer spento.
-            else:
+    @micropython.native
+    def _check_parking_free(self, distance, now):
+        """
+        Logica del posto LIBERO (auto in fase di parcheggio): stop, avvicinamento, lontano.
+
+        Parametri:
+        - distance: distanza filtrata (decimi di cm)
+        - now: ticks_ms della misura
+        """
+        # Se il posto è libero, non ha senso far contare la liberazione.
+        self.free_timer = 0
+        buzzer = self.buzzer
+
+        # --- ZONA DI STOP E CONFERMA ---
+        # limit: soglia di "stop" sotto cui consideriamo l'auto arrivata a fine corsa.
+        # Se occupied_timer è già attivo, allarga la soglia di 1cm per tollerare oscillazioni
+        # senza resettare continuamente il conteggio (stabilizzazione temporale + tolleranza).
+        limit = self._min_q
+        if self.occupied_timer > 0:
+            limit += _STOP_TOL_Q # TOLLERANZA: se stiamo già contando, concedi 1cm in più
+
+        if 0 < distance <= limit:
+            # Buzzer continuo (suono di stop): frequenza alta costante.
+            buzzer.set_frequency(_BUZZ_STOP_HZ)
+
+            # Avvia timer di conferma occupazione se non è già partito.
+            if self.occupied_timer == 0:
+                self.occupied_timer = now
+                if _DEBUG:
+                    print("Stop rilevato (", distance / 10, "cm). Attesa stabilità...", sep="")
+
+            # Conferma occupazione solo se la condizione resta valida per ULTRASONIC_OCCUPIED_CONFIRM ms.
+            if time.ticks_diff(now, self.occupied_timer) >= self._occupied_confirm:
+                # CONFERMA OCCUPATO
+                self.car_parked = True
+                self._telemetry_dirty = True
+                self.parking_leds.set_occupied()
                 self.parking_assist = False
-                self.buzzer.stop_parking_assist()
+                buzzer.stop_parking_assist()
                 self.occupied_timer = 0
+                if _DEBUG:
+                    print("PARCHEGGIO COMPLETATO")
+
+                # Lo stato retained su MQTT parte nello stesso giro del loop dalla telemetria
+                # "sporca" (_publish_state): un solo publish, e solo se cambiato.
+
+        # --- ZONA DI AVVICINAMENTO ---
+        # Se l'auto è entro ULTRASONIC_MAX_DISTANCE ma non in "stop", attiva assistenza.
+        elif distance <= self._max_q:
+            self.parking_assist = True
+
+            # Reset timer occupazione: siamo in avvicinamento, non ancora in stop stabile.
+            self.occupied_timer = 0 # Reset solo se ti allontani davvero
+
+            # Suono incrementale (semplice): più vicino => frequenza più alta.
+            if distance < self._half_q:
+                buzzer.set_frequency(_BUZZ_NEAR_HZ)
+            else:
+                buzzer.set_frequency(_BUZZ_FAR_HZ)
 
-        # ========== STATO: OCCUPATO (Auto ferma) ==========
+        # --- LONTANO ---
+        # Fuori range: niente assistenza e buzzer spento.
         else:
-            # Se già occupato, non ha senso contare nuovamente per occupazione.
+            self.parking_assist = False
+            buzzer.stop_parking_assist()
             self.occupied_timer = 0
 
-            # Assicura che l'assistenza parcheggio sia spenta mentre l'auto è considerata ferma.
-            self.buzzer.stop_parking_assist()
-
-            # Per liberare il posto, l'auto deve uscire chiaramente dalla zona:
-            # distanza > MAX + 2cm (tolleranza anti-flapping).
-            if distance > (self.config.ULTRASONIC_MAX_DISTANCE + 2):
-                # Avvia timer liberazione se non già attivo.
-                if self.free_timer == 0:
-                    self.free_timer = now
-
-                # Conferma libero solo se la condizione permane per ULTRASONIC_FREE_CONFIRM ms.
-                if time.ticks_diff(now, self.free_timer) >= self.config.ULTRASONIC_FREE_CONFIRM:
-                    self.car_parked = False
-                    self.parking_leds.set_free()
-                    self.free_timer = 0
-                    print(f"POSTO LIBERATO")
-                    if self.mqtt: self.mqtt.publish('state/spot', 'LIBERO', retain=True)
-            else:
-                # Se rientra nella zona, resetta il timer: richiesta continuità della condizione.
+    @micropython.native
+    def _check_parking_occupied(self, distance, now):
+        """
+        Logica del posto OCCUPATO (auto ferma): conferma della liberazione.
+
+        Parametri:
+        - distance: distanza filtrata (decimi di cm)
+        - now: ticks_ms della misura
+        """
+        # Se già occupato, non ha senso contare nuovamente per occupazione.
+        self.occupied_timer = 0
+
+        # Assicura che l'assistenza parcheggio sia spenta mentre l'auto è considerata ferma.
+        self.buzzer.stop_parking_assist()
+
+        # Per liberare il posto, l'auto deve uscire chiaramente dalla zona:
+        # distanza > MAX + 2cm (tolleranza anti-flapping).
+        if distance > self._release_q:
+            # Avvia timer liberazione se non già attivo.
+            if self.free_timer == 0:
+                self.free_timer = now
+
+            # Conferma libero solo se la condizione permane per ULTRASONIC_FREE_CONFIRM ms.
+            if time.ticks_diff(now, self.free_timer) >= self._free_confirm:
+                self.car_parked = False
+                self._telemetry_dirty = True
+                self.parking_leds.set_free()
                 self.free_timer = 0
+                if _DEBUG:
+                    print("POSTO LIBERATO")
+        else:
+            # Se rientra nella zona, resetta il timer: richiesta continuità della condizione.
+            self.free_timer = 0
 
+    @micropython.native
     def check_gas(self):
         """Check gas levels - USA VALORI RAW"""
         # Legge valore ADC raw (0-4095). Viene usato direttamente per confronto con soglie.
-        gas_raw = self.mq2.read_raw()  # Valore RAW 0-4095
+        self.mq2.read_into(self._adc_buf)
+        gas_raw = self._adc_buf[0]  # Valore RAW 0-4095
+        self._last_gas_raw = gas_raw
 
         # Isteresi anti-flapping:
         # - entra in allarme quando supera MQ2_THRESHOLD
         # - esce dall'allarme solo quando scende sotto (MQ2_THRESHOLD - MQ2_HYSTERESIS)
-        if not self.gas_alarm and gas_raw > self.config.MQ2_THRESHOLD:
-            print(f"GAS ALARM! Raw: {gas_raw}")
+        if not self.gas_alarm and gas_raw > self._gas_on:
+            print("GAS ALARM! Raw:", gas_raw)
             self.gas_alarm = True
+            self._telemetry_dirty = True
             # Avvia buzzer in modalità allarme con frequenza/interval specifici per il gas.
             self.buzzer.start_alarm(freq=2500, interval=300)  # Suono diverso per gas
             self.alarm_led.on()
 
-        elif self.gas_alarm and gas_raw < (self.config.MQ2_THRESHOLD - self.config.MQ2_HYSTERESIS):
-            print(f"Gas alarm cleared. Raw: {gas_raw}")
+        elif self.gas_alarm and gas_raw < self._gas_off:
+            print("Gas alarm cleared. Raw:", gas_raw)
             self.gas_alarm = False
+            self._telemetry_dirty = True
             self.buzzer.stop_alarm()
             self.alarm_led.off()
 
+    def _refresh_gas_thresholds(self):
+        """Ricalcola le soglie di entrata/uscita allarme gas dalla configurazione corrente."""
+        # _gas_on: soglia di ingresso in allarme; _gas_off: soglia di uscita (con isteresi).
+        self._gas_on = self.config.MQ2_THRESHOLD
+        self._gas_off = self.config.MQ2_THRESHOLD - self.config.MQ2_HYSTERESIS
+
     def check_brightness(self):
         """Check ambient light - SOLO SE MODO AUTO"""
-        # La luminosità viene controllata solo in modalità AUTO.
-        if self.config.PARKING_LIGHT_MODE != "AUTO":
-            return  # Skip se non in modalità AUTO
-
         try:
             if self.brightness_sensor:
+                # Lettura sempre eseguita (anche fuori da AUTO): il valore viene memorizzato
+                # ed è l'unica lettura I2C della luminosità usata da display e telemetria.
+                # Lettura non bloccante: None finché il sensore non ha finito la prima integrazione.
                 lux = self.brightness_sensor.read_lux()
+                self._last_lux = lux
+                if lux is None:
+                    return
+
+                # La luminosità comanda la luce solo in modalità AUTO.
+                if self.config.PARKING_LIGHT_MODE != "AUTO":
+                    return  # Skip se non in modalità AUTO
 
-                # Logica a soglia:
+                # Logica a soglia con isteresi:
                 # - lux sotto soglia => accende la luce parcheggio
-                # - lux sopra soglia => spegne
-                if lux < self.config.LUX_THRESHOLD:
-                    self.parking_light.on(100)
-                else:
-                    self.parking_light.off()
+                # - lux sopra soglia + _LUX_HYSTERESIS => spegne
+                # - nella banda intermedia resta com'è (niente flapping attorno alla soglia).
+                # Il pin viene scritto solo quando la decisione cambia: lo stato attuale
+                # è brightness della luce, aggiornato anche da toggle e cambi di modalità.
+                light = self.parking_light
+                threshold = self.config.LUX_THRESHOLD
+                if light.brightness:
+                    if lux > threshold + _LUX_HYSTERESIS:
+                        light.off()
+                elif lux < threshold:
+                    light.on(100)
 
         except Exception as e:
             # Protezione: eventuali errori I2C/sensore non devono fermare il sistema.
@@ -589,19 +896,24 @@ class SmartParking:
         # Esegue un reset completo del microcontrollore:
         # - mostra una schermata grafica
         # - disconnette MQTT se attivo
-        # - attende 2s e poi chiama machine.reset()
+        # - fissa la scadenza del riavvio: machine.reset() parte da _task_display dopo
+        #   _RESET_SCREEN_MS, senza sleep (sbarra, timer e sensori continuano nel frattempo)
+        # get_press_type() continua a dare "long_press" finché il pulsante resta premuto:
+        # con un reset già in corso non si riparte (la scadenza non verrebbe mai raggiunta).
+        if self._reset_at is not None:
+            return
         print("System reset requested...")
 
         # Mostra icona/schermata dedicata al reset.
         self.display.show_system_reset()
 
         # Disconnette MQTT per chiusura pulita della connessione (se presente).
+        # L'handler viene rilasciato: fino al riavvio il loop non tenta di riconnettersi.
         if self.mqtt:
             self.mqtt.disconnect()
+            self.mqtt = None
 
-        # Pausa per consentire la visualizzazione della schermata.
-        time.sleep(2) # Tempo per ammirare l'icona
-        machine.reset()
+        self._reset_at = time.ticks_add(time.ticks_ms(), _RESET_SCREEN_MS)
 
     def publish_telemetry(self):
         """Pubblica telemetria su MQTT con FILTRO DASHBOARD"""
@@ -610,8 +922,8 @@ class SmartParking:
             return
 
         try:
-            # Distanza attuale: usa last_distance già filtrata e memorizzata.
-            distance = self.last_distance
+            # Distanza attuale: usa last_distance_q già filtrata e memorizzata (in cm per il payload).
+            distance = self.last_distance_q / 10
 
             # FILTRO per dashboard Node-RED:
             # Se la distanza è oltre un certo valore ( > 8cm), invia 8.0 fisso,
@@ -620,14 +932,10 @@ class SmartParking:
             if distance > 8.0:
                 mqtt_distance = 8.0
 
-            # Lettura Lux: gestita con try per evitare blocchi se sensore non disponibile.
-            lux = 0
-            if self.brightness_sensor:
-                try: lux = self.brightness_sensor.read_lux()
-                except: pass
-
-            # Livello gas raw.
-            gas_raw = self.mq2.read_raw()
+            # Lux e gas raw: ultimi valori letti da check_brightness() / check_gas().
+            # Lux 0 se sensore non disponibile.
+            lux = self._last_lux or 0
+            gas_raw = self._last_gas_raw
 
             # Dizionario telemetria pubblicato: include stati principali e sensori.
             data = {
@@ -639,7 +947,8 @@ class SmartParking:
                 'light': lux                                              # Lux (0 se non disponibile)
             }
 
-            # Delega la pubblicazione effettiva all'handler MQTT.
+            # Delega la pubblicazione effettiva all'handler MQTT:
+            # un solo messaggio binario + stati retained solo quando cambiano.
             self.mqtt.publish_telemetry(data)
 
         except Exception as e:
@@ -649,17 +958,11 @@ class SmartParking:
     def update_display(self):
         """Update OLED display"""
         # Gas raw viene mostrato sempre (anche come riferimento durante allarme).
-        gas_raw = self.mq2.read_raw()
+        # Valori già letti dai check periodici (check_gas / check_brightness): nessuna lettura qui.
+        gas_raw = self._last_gas_raw
 
         # lux_level è opzionale: se non disponibile, resta None.
-        lux_level = None
-
-        # Lettura lux protetta (sensore potrebbe non esserci o generare errori I2C).
-        try:
-            if self.brightness_sensor:
-                lux_level = self.brightness_sensor.read_lux()
-        except:
-            pass
+        lux_level = self._last_lux
 
         # Stato sbarra: True se aperta o in apertura/attesa (vedi ServoGate.is_open()).
         gate_open = self.servo.is_open()
@@ -671,8 +974,8 @@ class SmartParking:
         if self.gas_alarm:
             self.display.show_gas_alarm(gas_raw)
         elif self.parking_assist:
-            # Nota: qui usa distance_cm() raw (non filtrata) per mostrare valore "reattivo" sul display.
-            distance = self.ultrasonic.distance_cm()
+            # Nota: qui usa l'ultima misura raw (non filtrata) per mostrare valore "reattivo" sul display.
+            distance = self.ultrasonic.last_cm
             self.display.show_parking_assist(distance)
         else:
             self.display.show_main_screen(gate_status=gate_open, parking_status=self.car_parked, gas_level=gas_raw, alarm_active=self.gas_alarm, lux_level=lux_level)
\ No newline at end of file
@@ -1,6 +1,6 @@
 # sensors/brightness_sensor.py
 
-from tsl2561 import TSL2561
+from tsl2561 import TSL2561, TSL2561_INTEGRATIONTIME_13MS, TSL2561_INTEGRATIONTIME_402MS, TSL2561_GAIN_1X, TSL2561_GAIN_16X
 
 
 class BrightnessSensor:
@@ -20,11 +20,24 @@ class BrightnessSensor:
         Tenta di inizializzare il sensore.
         Se fallisce, imposta connected a False per evitare letture future.
         """
+        # Ultimo valore misurato (lux): ritornato finché non è pronta una nuova misura.
+        # None fino alla fine della prima integrazione.
+        self._lux = None
+
         try:
-            self.sensor = TSL2561(i2c, address)
+            # Integrazione breve (13 ms) con gain 16x per le letture periodiche: una misura
+            # nuova è pronta ogni ~20 ms invece che ogni ~450 ms. Il gain 16x compensa in parte
+            # il tempo più corto (circa metà della risoluzione di 402 ms / 1x, sufficiente attorno
+            # a LUX_THRESHOLD); con molta luce il canale satura e il valore è "fuori scala".
+            # Le 402 ms restano per le letture di precisione (high_precision_read_lux).
+            # Passate al costruttore: l'init scrive il registro TIMING una volta sola.
+            self.sensor = TSL2561(i2c, address, TSL2561_INTEGRATIONTIME_13MS, TSL2561_GAIN_16X)
 
             # Flag che indica che il sensore è correttamente connesso
             self.connected = True
+
+            # Avvia subito la prima integrazione: read_lux() non resta mai in attesa.
+            self.sensor.start_measurement()
         except Exception as e:
             # In caso di errore di inizializzazione (sensore assente o I2C errato)
             print(f"TSL2561 init error: {e}")
@@ -36,8 +49,13 @@ class BrightnessSensor:
         """
         Legge il livello di luce ambientale in lux.
 
+        Come funziona:
+        - Non bloccante: se l'integrazione in corso è finita legge il nuovo valore
+          (poll_measurement), altrimenti ritorna l'ultimo misurato.
+
         Ritorna:
-        - valore in lux (float o int a seconda della libreria)
+        - valore in lux (int)
+        - None se la prima misura non è ancora pronta
         - 0 se il sensore non è connesso o se avviene un errore
         """
 
@@ -46,8 +64,11 @@ class BrightnessSensor:
             return 0
 
         try:
-            # Lettura del valore di luminosità già convertito in lux
-            return self.sensor.read_lux()
+            # Lettura del valore di luminosità già convertito in lux (None = non ancora pronto)
+            lux = self.sensor.poll_measurement()
+            if lux is not None:
+                self._lux = lux
+            return self._lux
         except Exception as e:
             # In caso di errore durante la lettura
             print(f"TSL2561 read error: {e}")
@@ -55,6 +76,35 @@ class BrightnessSensor:
             self.connected = False
             return 0
 
+    def high_precision_read_lux(self):
+        """
+        Lettura di precisione: una misura con integrazione a 402 ms (bloccante, ~450 ms).
+
+        A cosa serve:
+        - Diagnostica o calibrazione occasionale, non il loop principale.
+
+        Come funziona:
+        - Passa temporaneamente a 402 ms / gain 1x (massima risoluzione senza saturare con
+          molta luce), legge una volta e torna a 13 ms / 16x; le letture non bloccanti
+          di read_lux() riprendono dopo una nuova integrazione breve.
+
+        Ritorna:
+        - valore in lux (int), 0 se il sensore non è connesso o in caso di errore
+        """
+        if not self.connected:
+            return 0
+
+        sensor = self.sensor
+        try:
+            sensor.set_timing(TSL2561_INTEGRATIONTIME_402MS, TSL2561_GAIN_1X)
+            try:
+                return sensor.read_lux()
+            finally:
+                sensor.set_timing(TSL2561_INTEGRATIONTIME_13MS, TSL2561_GAIN_16X)
+        except Exception as e:
+            print(f"TSL2561 read error: {e}")
+            return 0
+
     def read_raw(self):
         """
         Legge i valori grezzi del sensore.
@@ -1,7 +1,7 @@
 # sensors/ir_sensor.py
 
 import machine
-import time
+from time import ticks_ms
 
 
 class IRSensor:
@@ -28,13 +28,32 @@ class IRSensor:
         # quindi il comportamento dipende interamente dall'hardware del sensore
         self.pin = machine.Pin(pin, machine.Pin.IN)
 
+        # Numero GPIO, conservato per chi legge gli ingressi direttamente dal registro
+        # GPIO_IN (es. ServoGate, che campiona più sensori con una sola lettura).
+        self.pin_num = pin
+
         self.name = name
 
         # Stato precedente del sensore (True = ostacolo rilevato, False = nessun ostacolo)
         self.last_state = False
 
         # Timestamp (in millisecondi) dell'ultimo cambiamento di stato
-        self.last_change = time.ticks_ms()
+        self.last_change = ticks_ms()
+
+        # Fronte rilevato dall'IRQ e non ancora consumato da has_changed().
+        # True all'avvio: la prima chiamata legge comunque il pin (ostacolo già presente).
+        self._event = True
+
+        # IRQ su entrambi i fronti: has_changed() legge il pin solo dopo un fronte reale,
+        # invece di campionarlo ad ogni chiamata. hard=True: l'handler non alloca
+        # (solo un flag e un timestamp small int).
+        self.pin.irq(trigger=machine.Pin.IRQ_FALLING | machine.Pin.IRQ_RISING,
+                     handler=self._on_edge, hard=True)
+
+    def _on_edge(self, pin):
+        """Handler IRQ: segnala il fronte e ne memorizza l'istante."""
+        self._event = True
+        self.last_change = ticks_ms()
         
     def read(self):
         """
@@ -78,9 +97,17 @@ class IRSensor:
 
         In caso di cambiamento:
         - aggiorna last_state
-        - aggiorna last_change con il timestamp corrente
+        - last_change è già stato aggiornato dall'IRQ all'istante del fronte
+
+        Senza fronti dall'ultima chiamata ritorna False senza leggere il pin.
+        Dopo un fronte legge lo stato attuale: un disturbo che torna allo stato
+        precedente (due fronti ravvicinati) non conta come cambiamento.
         """
 
+        if not self._event:
+            return False
+        self._event = False
+
         current = self.read()
 
         # Confronto con lo stato precedente
@@ -89,9 +116,6 @@ class IRSensor:
             # Aggiorna lo stato salvato
             self.last_state = current
 
-            # Salva il momento del cambiamento (in millisecondi)
-            self.last_change = time.ticks_ms()
-
             # Indica che è avvenuto un cambiamento
             return True
 
@@ -1,7 +1,7 @@
 # sensors/mq2.py
 
 import machine
-import time
+from array import array
 
 
 class MQ2Sensor:
@@ -34,6 +34,9 @@ class MQ2Sensor:
         # Imposta la risoluzione dell'ADC a 12 bit
         # I valori letti vanno da 0 a 4095
         self.adc.width(machine.ADC.WIDTH_12BIT) # 12 bit = 0-4095
+
+        # Metodo di lettura legato una volta sola: usato da read_into() nel percorso caldo.
+        self._read = self.adc.read
         
         # Calibrazione iniziale:
         # Viene letto il valore medio del sensore all'avvio,
@@ -42,6 +45,9 @@ class MQ2Sensor:
 
         # Stampa il valore di baseline per debug o monitoraggio
         print(f"MQ2 baseline: {self.baseline}")
+
+        # Media mobile esponenziale delle letture (vedi read_into), inizializzata con la baseline.
+        self._ema = self.baseline
         
     def _read_average(self, samples=5):
         """
@@ -53,22 +59,31 @@ class MQ2Sensor:
 
         Ritorna:
         - valore medio intero delle letture ADC
-        """
-
-        total = 0
-
-        # Ciclo per il numero di campioni richiesti
-        for _ in range(samples):
 
-            # Lettura del valore analogico dal sensore
-            total += self.adc.read()
+        Come funziona:
+        - I campioni vengono letti di seguito in un array('H') e sommati da sum() (in C):
+          l'ADC dell'ESP32 ha il proprio sample-and-hold, non serve attendere tra le letture.
+        """
 
-            # Breve ritardo per stabilizzare le letture successive
-            time.sleep_ms(1)  
+        r = self._read
+        buf = array('H', (r() for _ in range(samples)))
 
         # Calcolo della media intera dei campioni
-        return total // samples
+        return sum(buf) // samples
     
+    def _median3(self):
+        """
+        Mediana di 3 letture ADC consecutive (nessuna attesa tra le letture).
+
+        Un singolo picco dell'ADC finisce in testa o in coda e viene scartato,
+        invece di spostare il valore come farebbe una media.
+        """
+        r = self._read
+        a = r()
+        b = r()
+        c = r()
+        return a + b + c - max(a, b, c) - min(a, b, c)
+
     def read_raw(self):
         """
         Legge il valore grezzo del sensore MQ-2.
@@ -76,12 +91,34 @@ class MQ2Sensor:
         Ritorna:
         - valore ADC compreso tra 0 e 4095
 
-        Usa una media di più letture per maggiore stabilità.
+        Usa la stessa media mobile di read_into() (mediana di 3 letture, nessuna attesa).
         """
 
-        # Ritorna la media di 3 campioni ADC
-        return self._read_average(3)
+        ema = (self._ema + self._median3()) >> 1
+        self._ema = ema
+        return ema
     
+    def read_into(self, buf):
+        """
+        Legge il valore grezzo del sensore MQ-2 nel buffer del chiamante.
+
+        Parametri:
+        - buf: array('H') preallocato; il valore ADC (0-4095) viene scritto in buf[0]
+
+        Come funziona:
+        - Ad ogni chiamata la mediana di 3 letture ravvicinate (_median3) scarta i picchi
+          isolati dell'ADC, che altrimenti con la sola media mobile sposterebbero il valore
+          di metà del picco (possibile falso allarme gas).
+        - Il valore viene fuso nella media mobile esponenziale ema = (ema + nuovo) / 2
+          (shift, solo interi): il rumore viene filtrato tra una chiamata e l'altra.
+        - Un gradino reale arriva all'87.5% in 3 letture (1.5 s a 500 ms), quindi
+          l'allarme gas resta reattivo.
+        """
+
+        ema = (self._ema + self._median3()) >> 1
+        self._ema = ema
+        buf[0] = ema
+
     def read_percentage(self):
         """
         Restituisce una percentuale indicativa del livello di gas.
@@ -97,12 +134,12 @@ class MQ2Sensor:
         # Lettura del valore ADC grezzo
         raw = self.read_raw()
 
-        # Conversione del valore ADC in percentuale rispetto al massimo
-        # min(100, ...) evita valori superiori al 100%
-        percentage = min(100, (raw / 4095) * 100)
+        # Conversione del valore ADC in decimi di percentuale rispetto al massimo (interi):
+        # raw <= 4095, quindi il risultato non supera 1000 (100.0%).
+        p10 = (raw * 1000) // 4095
 
-        # Arrotonda il valore a una cifra decimale
-        return round(percentage, 1)
+        # Una sola divisione finale: valore con una cifra decimale
+        return p10 / 10
     
     def get_ppm_estimate(self):
         """
@@ -128,8 +165,6 @@ class MQ2Sensor:
         delta = raw - self.baseline
 
         # Stima estremamente semplificata della concentrazione
-        # Scala il delta su un massimo ipotetico di 10000 ppm
-        ppm = (delta / 4095) * 10000  # Max ~10000 ppm
-
-        # Ritorna il valore come intero
-        return int(ppm)
+        # Scala il delta su un massimo ipotetico di 10000 ppm, in interi:
+        # divisione per 4096 (shift) al posto di 4095, trascurabile per una stima.
+        return (delta * 10000) >> 12  # Max ~10000 ppm
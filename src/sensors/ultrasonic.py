@@ -1,7 +1,17 @@
 # sensors/ultrasonic.py
 
 import machine
+import micropython
 import time
+from micropython import const
+from time import ticks_us, ticks_diff
+
+# Timeout (us) oltre il quale una misura avviata con trigger() è considerata persa
+# (eco mai arrivato: fuori portata o sensore scollegato).
+_ECHO_TIMEOUT_US = const(30000)
+
+# Timeout (us) di distance_cm() per ciascuna attesa di fronte dell'ECHO.
+_PULSE_TIMEOUT_US = const(10000)
 
 
 class UltrasonicSensor:
@@ -32,13 +42,101 @@ class UltrasonicSensor:
 
         # Assicura che il pin TRIG sia inizialmente LOW
         self.trig.off()
+
+        # Misura a interrupt (trigger() / read_cm()):
+        # - _rise_at: ticks_us() del fronte di salita dell'ECHO
+        # - _pulse_us: durata dell'ultimo impulso ECHO misurato dall'IRQ
+        # - _ready: True quando l'IRQ ha completato una nuova misura non ancora letta
+        # - _pending / _trig_at: misura in corso e istante del trigger
+        self._rise_at = 0
+        self._pulse_us = 0
+        self._ready = False
+        self._pending = False
+        self._trig_at = 0
+
+        # Ultima distanza letta con read_cm10()/read_cm(), in decimi di cm (intero),
+        # -1 se nessuna misura valida. In cm (float) tramite la proprietà last_cm.
+        self.last_cm10 = -1
+
+        # IRQ su entrambi i fronti dell'ECHO: il timestamp è preso nell'handler,
+        # senza attese attive nel loop principale. hard=True per ridurre la latenza:
+        # l'handler non alloca (solo small int e attributi già esistenti).
+        self.echo.irq(trigger=machine.Pin.IRQ_RISING | machine.Pin.IRQ_FALLING,
+                      handler=self._echo_irq, hard=True)
+
+    def _echo_irq(self, pin):
+        """Handler IRQ dell'ECHO: salita => memorizza l'istante, discesa => durata impulso."""
+        if pin.value():
+            self._rise_at = ticks_us()
+        elif self._pending:
+            self._pulse_us = ticks_diff(ticks_us(), self._rise_at)
+            self._pending = False
+            self._ready = True
+
+    def trigger(self):
+        """
+        Avvia una misura senza attenderne il risultato.
+
+        Come funziona:
+        - Emette l'impulso TRIG da 10 us e ritorna subito.
+        - La durata dell'eco viene misurata da _echo_irq(); il risultato si legge con read_cm().
+        - Se una misura precedente è ancora in corso (e non è scaduta) non ne avvia un'altra.
+        """
+        if self._pending and ticks_diff(ticks_us(), self._trig_at) < _ECHO_TIMEOUT_US:
+            return
+        self._ready = False
+        self._pending = True
+        self._trig_at = ticks_us()
+        self.trig.on()
+        time.sleep_us(10)
+        self.trig.off()
+
+    @micropython.native
+    def read_cm10(self):
+        """
+        Ritorna la distanza dell'ultima misura avviata con trigger(), in decimi di cm.
+
+        Ritorna:
+        - distanza in cm x 10 (intero) se è disponibile una nuova misura (il flag viene azzerato)
+        - -1 se nessuna nuova misura è pronta
+
+        Come funziona:
+        - Conversione in virgola fissa: 0.0343 cm/us / 2 (andata e ritorno) x 10
+          = us * 343 // 2000. Solo small int (max ~10^7 entro il timeout dell'eco):
+          nessun float allocato.
+        """
+        if not self._ready:
+            return -1
+        self._ready = False
+        q = self._pulse_us * 343 // 2000
+        self.last_cm10 = q
+        return q
+
+    def read_cm(self):
+        """
+        Ritorna la distanza (cm) dell'ultima misura avviata con trigger().
+
+        Ritorna:
+        - distanza in cm (float) se è disponibile una nuova misura (il flag viene azzerato)
+        - -1 se nessuna nuova misura è pronta
+        """
+        q = self.read_cm10()
+        return q / 10 if q >= 0 else -1
+
+    @property
+    def last_cm(self):
+        """Ultima distanza letta in cm (float), -1 se nessuna misura valida."""
+        q = self.last_cm10
+        return q / 10 if q >= 0 else -1
         
-    def distance_cm(self):
+    def distance_mm(self):
         """
-        Misura la distanza di un oggetto in centimetri.
+        Misura la distanza di un oggetto in millimetri (bloccante, fino a ~20 ms).
+        Per il loop principale preferire trigger() + read_cm10().
 
         Ritorna:
-        - distanza in cm (float)
+        - distanza in mm (intero): stessa conversione in virgola fissa di read_cm10()
+          (mm = decimi di cm), nessun float
         - -1 in caso di timeout o errore di lettura
         """
 
@@ -51,40 +149,24 @@ class UltrasonicSensor:
 
         # Riporta il pin TRIG a livello LOW
         self.trig.off()
-        
-        # Timeout massimo per evitare blocchi infiniti (10 ms)
-        timeout = 10000  
-
-        # Timestamp iniziale in microsecondi
-        t0 = time.ticks_us()
-
-        # Attende che il pin ECHO passi da LOW a HIGH
-        # (significa che l'impulso ultrasonico è stato inviato)
-        while self.echo.value() == 0:
-            # Se il tempo di attesa supera il timeout, ritorna errore
-            if time.ticks_diff(time.ticks_us(), t0) > timeout:
-                return -1
-                
-        # Timestamp quando ECHO diventa HIGH
-        t1 = time.ticks_us()
-
-        # Attende che il pin ECHO torni LOW
-        # (fine della ricezione dell'eco)
-        while self.echo.value() == 1:
-            # Se il segnale resta HIGH troppo a lungo, ritorna errore
-            if time.ticks_diff(time.ticks_us(), t1) > timeout:
-                return -1
-
-        # Timestamp quando ECHO torna LOW
-        t2 = time.ticks_us()
-        
-        # Durata dell'impulso ECHO in microsecondi
-        pulse_duration = t2 - t1
 
-        # Calcolo della distanza:
-        # 0.0343 cm/us = velocità del suono
-        # divisione per 2 perché l'onda va e torna
-        distance = pulse_duration * 0.0343 / 2
+        # Durata dell'impulso ECHO (us) misurata in C da time_pulse_us: attende il fronte di
+        # salita e poi quello di discesa, con timeout di 10 ms per ciascuna attesa.
+        # Valore negativo = timeout (eco mai partito o rimasto alto troppo a lungo).
+        pulse_duration = machine.time_pulse_us(self.echo, 1, _PULSE_TIMEOUT_US)
+        if pulse_duration < 0:
+            return -1
+
+        # 0.343 mm/us (velocità del suono) / 2 (andata e ritorno) = us * 343 // 2000
+        return pulse_duration * 343 // 2000
 
-        # Ritorna la distanza calcolata in centimetri
-        return distance
+    def distance_cm(self):
+        """
+        Misura la distanza di un oggetto in centimetri (bloccante, vedi distance_mm()).
+
+        Ritorna:
+        - distanza in cm (float)
+        - -1 in caso di timeout o errore di lettura
+        """
+        mm = self.distance_mm()
+        return mm / 10 if mm >= 0 else -1
@@ -1,5 +1,9 @@
 # tsl2561.py
 import time
+import micropython
+from array import array
+from time import ticks_ms, ticks_diff, ticks_add
+from micropython import const
 
 # I2C Addresses
 TSL2561_ADDR_LOW   = 0x29
@@ -17,6 +21,12 @@ TSL2561_REGISTER_ID         = 0x0A
 TSL2561_REGISTER_CHAN0_LOW  = 0x0C
 TSL2561_REGISTER_CHAN1_LOW  = 0x0E
 
+# Byte di comando già composti (COMMAND | [WORD |] registro), inlined dal compilatore:
+# nessun OR a runtime ad ogni accesso.
+_CMD_CONTROL = const(0x80 | 0x00)      # COMMAND | CONTROL
+_CMD_TIMING  = const(0x80 | 0x01)      # COMMAND | TIMING
+_CMD_CH0     = const(0x80 | 0x20 | 0x0C)  # COMMAND | WORD | CHAN0_LOW
+
 # Control values
 TSL2561_CONTROL_POWERON  = 0x03
 TSL2561_CONTROL_POWEROFF = 0x00
@@ -30,115 +40,167 @@ TSL2561_INTEGRATIONTIME_402MS = 0x02  # 402ms
 TSL2561_GAIN_1X  = 0x00
 TSL2561_GAIN_16X = 0x10
 
+# approssimazione lux a tratti sul ratio ch1/ch0 (x 2^10), tre valori per tratto:
+# ratio massimo, k0, k1 => lux = (k0 * channel0 - k1 * channel1) // 100; oltre l'ultimo tratto lux = 0.
+# array 'I' (non tupla di tuple) perché _lux_core lo legge direttamente con ptr32.
+_LUX_TABLE = array('I', (
+    0x050, 0x030, 0x066,
+    0x0A8, 0x022, 0x055,
+    0x0EC, 0x012, 0x037,
+    0x190, 0x00E, 0x029,
+))
+
+# valore ritornato con un canale saturo: "fuori scala" (molta luce), non 0 (che vorrebbe dire buio)
+_LUX_SATURATED = const(0xFFFF)
+
+
+@micropython.viper
+def _lux_core(ch0: uint, ch1: uint, ch_scale: uint, sat: uint, table) -> int:
+    # calcolo del lux in aritmetica intera nativa (viper, parole a 32 bit senza segno).
+    # conteggi >= sat = canale saturo (dipende dall'integrazione): fuori scala.
+    # sotto saturazione ch0 * ch_scale e channel1 << 10 stanno in 32 bit senza segno.
+    if ch0 >= sat or ch1 >= sat:
+        return _LUX_SATURATED
+    if ch0 == 0:
+        return 0
+
+    channel0 = (ch0 * ch_scale) >> 10
+    channel1 = (ch1 * ch_scale) >> 10
+    if channel0 == 0:
+        return 0
+
+    # ratio = (channel1 << 10) // channel0, confrontato senza divisione:
+    # ratio <= bound  <=>  channel1 << 10 < (bound + 1) * channel0
+    x = channel1 << 10
+    t = ptr32(table)
+    i = 0
+    while i < 12:
+        if x < (uint(t[i]) + 1) * channel0:
+            a = uint(t[i + 1]) * channel0
+            b = uint(t[i + 2]) * channel1
+            if a <= b:
+                return 0
+            return int((a - b) // 100)
+        i += 3
+    return 0
+
 
 class TSL2561:
-    def __init__(self, i2c, address=TSL2561_ADDR_FLOAT):
+    def __init__(self, i2c, address=TSL2561_ADDR_FLOAT,
+                 integration_time=TSL2561_INTEGRATIONTIME_402MS, gain=TSL2561_GAIN_1X):
         self.i2c = i2c
         self.address = address
 
-        # default configuration
-        self.integration_time = TSL2561_INTEGRATIONTIME_402MS
-        self.gain = TSL2561_GAIN_1X
+        # metodi I2C legati una volta sola: nessuna lookup di attributo ad ogni accesso
+        self._writeto = i2c.writeto_mem
+        self._readfrom = i2c.readfrom_mem
+        self._readinto = i2c.readfrom_mem_into
+
+        # configurazione iniziale (default 402ms / gain 1x): passarla qui invece di chiamare
+        # set_integration_time/set_gain dopo evita scritture ripetute del registro TIMING
+        self.integration_time = integration_time
+        self.gain = gain
 
         # IMPORTANT: questi attributi devono esistere sempre
         self._enabled = False
         self._delay_ms = 450  # default coerente con 402ms
+        self._ch_scale = 1 << 14  # scala canali per 402ms / gain 1x (vedi _update_scale)
+        self._sat = 0xFFFF  # conteggio di saturazione dei canali per 402ms
 
-        # check presenza
-        if not self._check_presence():
-            raise ValueError("TSL2561 not found at address 0x{:02X}".format(self.address))
+        # buffer per la lettura dei due canali (CHAN0 low/high, CHAN1 low/high)
+        self._buf = bytearray(4)
 
-        # FIX: power-on logico + stabilizzazione
-        self.enable()
+        # ultimo valore in lux e istante della lettura (None = nessuna lettura ancora)
+        self._last_lux = None
+        self._last_lux_ts = 0
+
+        # istante (ticks_ms) in cui la misura avviata da start_measurement() è pronta
+        self._t_ready = 0
+
+        # check presenza + power-on in un colpo solo, poi stabilizzazione
+        if not self._probe_and_enable():
+            raise ValueError("TSL2561 not found at address 0x{:02X}".format(self.address))
         time.sleep_ms(100)
 
-        # applica config (set_integration_time aggiorna anche _delay_ms)
-        self.set_integration_time(self.integration_time)
-        self.set_gain(self.gain)
+        # applica config: integrazione e gain con una sola scrittura del registro TIMING
+        # (_write_timing aggiorna anche _delay_ms e la scala dei canali)
+        self._write_timing()
 
-    def _check_presence(self):
+    def _probe_and_enable(self):
+        # scrive POWERON e lo rilegge dal registro CONTROL: se il valore torna, il sensore
+        # c'è ed è acceso (nessuna lettura separata del registro ID).
+        # Senza dispositivo la scrittura fallisce (nessun ACK) => False.
         try:
-            id_reg = self._read_byte(TSL2561_COMMAND_BIT | TSL2561_REGISTER_ID)
-
-            if id_reg in (0x00, 0xFF):
+            self._write_byte(_CMD_CONTROL, TSL2561_CONTROL_POWERON)
+            if (self._read_byte(_CMD_CONTROL) & 0x03) != TSL2561_CONTROL_POWERON:
                 return False
-
-            # Non forziamo pattern sul nibble alto: alcuni moduli/clone non matchano.
+            self._enabled = True
             return True
 
         except Exception:
             return False
 
     def _write_byte(self, register, value):
-        self.i2c.writeto_mem(self.address, register, bytes([value & 0xFF]))
+        self._writeto(self.address, register, bytes([value & 0xFF]))
 
     def _read_byte(self, register):
-        return self.i2c.readfrom_mem(self.address, register, 1)[0]
+        return self._readfrom(self.address, register, 1)[0]
 
     def _read_word(self, register):
-        data = self.i2c.readfrom_mem(self.address, register, 2)
+        data = self._readfrom(self.address, register, 2)
         return (data[1] << 8) | data[0]
 
     def enable(self):
         """Power on sensor."""
-        self._write_byte(TSL2561_COMMAND_BIT | TSL2561_REGISTER_CONTROL, TSL2561_CONTROL_POWERON)
+        self._write_byte(_CMD_CONTROL, TSL2561_CONTROL_POWERON)
         self._enabled = True
 
     def disable(self):
         """Power off sensor."""
-        self._write_byte(TSL2561_COMMAND_BIT | TSL2561_REGISTER_CONTROL, TSL2561_CONTROL_POWEROFF)
+        self._write_byte(_CMD_CONTROL, TSL2561_CONTROL_POWEROFF)
         self._enabled = False
 
     def set_integration_time(self, integration_time):
         self.integration_time = integration_time
+        self._write_timing()
 
-        # aggiorna timing register = integration + gain
+    def set_gain(self, gain):
+        self.gain = gain
+        self._write_timing()
+
+    def set_timing(self, integration_time, gain):
+        # integrazione e gain insieme: una sola scrittura del registro TIMING invece di due
+        self.integration_time = integration_time
+        self.gain = gain
+        self._write_timing()
+
+    def _write_timing(self):
+        # aggiorna timing register = integration + gain (un solo byte per entrambi)
         self._write_byte(
-            TSL2561_COMMAND_BIT | TSL2561_REGISTER_TIMING,
+            _CMD_TIMING,
             (self.integration_time | self.gain) & 0xFF
         )
 
-        # delay per completare integrazione (con margine)
+        # delay per completare integrazione (con margine) e conteggio a cui i canali
+        # saturano con quell'integrazione (datasheet: 5047 / 37177 / 65535)
         if self.integration_time == TSL2561_INTEGRATIONTIME_13MS:
             self._delay_ms = 20
+            self._sat = 5047
         elif self.integration_time == TSL2561_INTEGRATIONTIME_101MS:
             self._delay_ms = 120
+            self._sat = 37177
         else:
             self._delay_ms = 450
+            self._sat = 0xFFFF
+        self._update_scale()
 
-    def set_gain(self, gain):
-        self.gain = gain
-
-        self._write_byte(
-            TSL2561_COMMAND_BIT | TSL2561_REGISTER_TIMING,
-            (self.integration_time | self.gain) & 0xFF
-        )
-
-    def read_raw(self):
-        """Read raw values (broadband, infrared)."""
-        if not self._enabled:
-            self.enable()
-            time.sleep_ms(10)
-
-        # attesa integrazione
-        time.sleep_ms(self._delay_ms)
-
-        ch0 = self._read_word(TSL2561_COMMAND_BIT | TSL2561_WORD_BIT | TSL2561_REGISTER_CHAN0_LOW)
-        ch1 = self._read_word(TSL2561_COMMAND_BIT | TSL2561_WORD_BIT | TSL2561_REGISTER_CHAN1_LOW)
-
-        return ch0, ch1
-
-    def read_lux(self):
-        ch0, ch1 = self.read_raw()
-
-        # saturazione
-        if ch0 == 0xFFFF or ch1 == 0xFFFF:
-            return 0
-
-        # evita divisione per zero
-        if ch0 == 0:
-            return 0
+        # i conteggi validi con la nuova configurazione arrivano dopo un'integrazione intera;
+        # il lux in cache era stato misurato con la configurazione precedente
+        self._t_ready = ticks_add(ticks_ms(), self._delay_ms)
+        self._last_lux = None
 
+    def _update_scale(self):
+        # scala dei canali: dipende solo da integrazione e gain, ricalcolata quando cambiano
         # scaling per integrazione (schema tipico)
         if self.integration_time == TSL2561_INTEGRATIONTIME_13MS:
             ch_scale = 0x7517  # 322/11 * 2^10
@@ -150,25 +212,66 @@ class TSL2561:
         # scaling per gain
         if self.gain == TSL2561_GAIN_1X:
             ch_scale <<= 4
+        self._ch_scale = ch_scale
+
+    def start_measurement(self):
+        """Avvia l'integrazione senza attendere: il valore si legge poi con poll_measurement()."""
+        if not self._enabled:
+            self.enable()
+        self._t_ready = ticks_add(ticks_ms(), self._delay_ms)
 
-        channel0 = (ch0 * ch_scale) >> 10
-        channel1 = (ch1 * ch_scale) >> 10
+    def poll_measurement(self):
+        """
+        Ritorna il lux della misura in corso, oppure None se l'integrazione non è ancora finita.
 
-        if channel0 == 0:
-            return 0
+        Acceso, il sensore integra in continuo: dopo ogni lettura la prossima misura
+        è pronta un tempo di integrazione più tardi (nessuno sleep).
+        """
+        now = ticks_ms()
+        if ticks_diff(now, self._t_ready) < 0:
+            return None
 
-        ratio = (channel1 << 10) // channel0
+        buf = self._buf
+        self._readinto(self.address, _CMD_CH0, buf)
+        lux = self._compute_lux(buf[0] | (buf[1] << 8), buf[2] | (buf[3] << 8))
 
-        # approssimazione in base al ratio
-        if ratio <= 0x50:
-            lux = (0x030 * channel0 - 0x066 * channel1) // 100
-        elif ratio <= 0xA8:
-            lux = (0x022 * channel0 - 0x055 * channel1) // 100
-        elif ratio <= 0xEC:
-            lux = (0x012 * channel0 - 0x037 * channel1) // 100
-        elif ratio <= 0x190:
-            lux = (0x00E * channel0 - 0x029 * channel1) // 100
-        else:
-            lux = 0
+        self._last_lux = lux
+        self._last_lux_ts = now
+        self._t_ready = ticks_add(now, self._delay_ms)
+        return lux
 
-        return max(0, int(lux))
\ No newline at end of file
+    def read_raw(self):
+        """Read raw values (broadband, infrared)."""
+        # acceso, il sensore integra in continuo: si attende solo quanto manca alla fine
+        # dell'integrazione in corso (appena acceso: un'integrazione intera, che con il
+        # margine di _delay_ms copre anche l'avvio, senza un'attesa separata)
+        if not self._enabled:
+            self.start_measurement()
+        wait = ticks_diff(self._t_ready, ticks_ms())
+        if wait > 0:
+            time.sleep_ms(wait)
+
+        # una sola transazione I2C: 4 byte da CHAN0_LOW (l'indirizzo avanza da solo fino a CHAN1_HIGH)
+        buf = self._buf
+        self._readinto(self.address, _CMD_CH0, buf)
+        ch0 = buf[0] | (buf[1] << 8)
+        ch1 = buf[2] | (buf[3] << 8)
+
+        # la prossima misura nuova è pronta un'integrazione dopo questa lettura
+        self._t_ready = ticks_add(ticks_ms(), self._delay_ms)
+        return ch0, ch1
+
+    def read_lux(self):
+        # entro un tempo di integrazione dall'ultima lettura il sensore non ha un valore
+        # nuovo: ritorna quello in cache senza attendere una nuova integrazione
+        if self._last_lux is not None and ticks_diff(ticks_ms(), self._last_lux_ts) < self._delay_ms:
+            return self._last_lux
+
+        lux = self._compute_lux(*self.read_raw())
+        self._last_lux = lux
+        self._last_lux_ts = ticks_ms()
+        return lux
+
+    def _compute_lux(self, ch0, ch1):
+        # scala precalcolata da _update_scale (integrazione + gain), calcolo nativo in _lux_core
+        return _lux_core(ch0, ch1, self._ch_scale, self._sat, _LUX_TABLE)